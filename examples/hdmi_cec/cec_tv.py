@@ -26,15 +26,18 @@ from app.cec import CecDevice, CecCommand
 import app.cec_messages_pb2 as pb
 import subprocess
 import time
+from concurrent.futures import ThreadPoolExecutor
 
 class CecTv(IotNode):
     def __init__(self):
         super(CecTv, self).__init__()
         self.addCommand(Name('sendCommand'), self.onCecCommand, ['cec'], True)
+        # cec-client calls are slow and PLAY lasts the whole video, so commands
+        # are queued for one worker thread (the CEC bus takes one at a time)
+        self._cecExecutor = ThreadPoolExecutor(1)
         
     def processCommands(self, message):
         PI = CecDevice.RECORDING_1
-        # TODO: FORK SEPARATE THREAD FOR THIS
         self.log.debug("processCommands: "+ str(message.commands))
         if message.destination == pb.TV:
             processedDestination = CecDevice.TV
@@ -114,12 +117,22 @@ class CecTv(IotNode):
         # verify command interest
         message = pb.CommandMessage()
         ProtobufTlv.decode(message, interest.getName().get(3).getValue())
-        self.loop.call_soon(self.processCommands, message)
+        # acknowledge at once; the commands run after any queued before them
+        future = self._cecExecutor.submit(self.processCommands, message)
+        future.add_done_callback(self._onCecCommandsDone)
 
         data = Data(interest.getName())
         data.setContent('ACK')
         return data
 
+    def _onCecCommandsDone(self, future):
+        if not future.cancelled() and future.exception() is not None:
+            self.log.error("CEC command failed: " + str(future.exception()))
+
+    def stop(self):
+        self._cecExecutor.shutdown(wait=False)
+        super(CecTv, self).stop()
+
 if __name__ == '__main__':
     node = CecTv()
     node.start()
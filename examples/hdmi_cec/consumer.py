@@ -43,7 +43,7 @@ class Consumer(IotNode):
     def setupComplete(self):
         #fetch the pir list from the controller
         #once we have at least one pir, we can issue the interests
-        self.loop.call_soon(self.requestDeviceList)
+        self.watchDeviceList(self.onDataPirList, keywords=['cec', 'pir'])
         self.loop.call_soon(self.expressInterestPirAndRepeat)
 
     def getPirs(self):
@@ -58,13 +58,7 @@ class Consumer(IotNode):
     def getCec(self, cecId):
         return next((x for x in self._deviceList if x.type == "cec" and x.id == cecId), None)
 
-    def requestDeviceList(self):
-        # do this periodically, like every 5 seconds
-        interestName = Name(self._policyManager.getTrustRootIdentity()).append('listDevices')
-        self.face.expressInterest(interestName, self.onDataPirList, self.onPirListTimeout)
-
-    def onDataPirList(self, interest, data):
-        payload = json.loads(data.getContent().toRawStr())
+    def onDataPirList(self, payload):
         self.log.debug(str(payload))
         newDeviceList = []
 
@@ -79,6 +73,8 @@ class Consumer(IotNode):
                 newDeviceList.append(existingCec)
             else:
                 newDeviceList.append(RemoteDevice("cec", cec["name"]))
+                # commands to the TV are signed, use a session key for them
+                self.establishSession(Name(cec["name"]).getPrefix(-1))
 
         try:
             pirList = payload["pir"]
@@ -94,12 +90,6 @@ class Consumer(IotNode):
 
         self._deviceList = newDeviceList
 
-        self.loop.call_later(5, self.requestDeviceList)
-
-    def onPirListTimeout(self, interest):
-        #try again later
-        self.loop.call_later(15, self.requestDeviceList)
-
     def findDeviceIdMatching(self, matchPrefix):
         for d in self._deviceList:
             devName = Name(d.id)
@@ -177,8 +167,7 @@ class Consumer(IotNode):
                 message.commands.append(pb.PLAY)
                 encodedMessage = ProtobufTlv.encode(message)
                 interest = Interest(Name(cec.id).append(encodedMessage))
-                # self.face.makeCommandInterest(interest)
-                self.face.expressInterest(interest, self.onDataCec, self.onTimeoutCec)
+                self.expressSessionCommand(interest, self.onDataCec, self.onTimeoutCec)
         elif count == 0:
             # TODO: Send command interest to TV
             self.log.info("turn off tv")
@@ -188,8 +177,7 @@ class Consumer(IotNode):
                 message.commands.append(pb.STANDBY)
                 encodedMessage = ProtobufTlv.encode(message)
                 interest = Interest(Name(cec.id).append(encodedMessage))
-                # self.face.makeCommandInterest(interest)
-                self.face.expressInterest(interest, self.onDataCec, self.onTimeoutCec)
+                self.expressSessionCommand(interest, self.onDataCec, self.onTimeoutCec)
 
 if __name__ == '__main__':
     n = Consumer()
@@ -21,7 +21,6 @@
 from __future__ import print_function
 from ndn_pi.iot_node import IotNode
 from pyndn import Name, Data, Interest
-import json
 import random
 
 class LedUserNode(IotNode):
@@ -30,19 +29,15 @@ class LedUserNode(IotNode):
         self._ledCommands = []
 
     def setupComplete(self):
-        self.loop.call_soon(self.requestDeviceList)
+        self.watchDeviceList(self.onListReceived, keywords=['led'], isCompact=True)
         self.loop.call_later(1, self.sendRandomCommand)
 
-    def onListReceived(self, interest, data):
-        # the list is send at json
-        deviceDict = json.loads(data.getContent().toRawStr())
+    def onListReceived(self, deviceDict):
         try:
             ledCommands = deviceDict['led']
             self._ledCommands = [info['name'] for info in ledCommands]
         except (IndexError, KeyError, TypeError):
             self.log.debug('Did not find LED commands')
-        finally:
-            self.loop.call_later(5, self.requestDeviceList)
 
     def onCommandAck(self, interest, data):
         pass
@@ -63,17 +58,6 @@ class LedUserNode(IotNode):
         finally:
             self.loop.call_later(1, self.sendRandomCommand)
 
-    def onListTimeout(self, interest):
-        self.log.debug('Timed out asking for device list')
-        self.loop.call_later(15, self.requestDeviceList)
-
-    def requestDeviceList(self):
-        commandName = self._policyManager.getTrustRootIdentity().append('listDevices')
-        interest = Interest(commandName)
-        self.face.makeCommandInterest(interest)
-
-        self.face.expressInterest(interest, self.onListReceived, self.onListTimeout)
-
 
 if __name__ == '__main__':
     import logging
@@ -0,0 +1,264 @@
+# -*- Mode:python; c-file-style:"gnu"; indent-tabs-mode:nil -*- */
+#
+# Copyright (C) 2016 Regents of the University of California.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+# A copy of the GNU General Public License is in the file COPYING.
+
+import os
+from collections import OrderedDict
+
+# /<controller prefix>/<app>/_schema/_delta/<version> asks for the changes
+# since a version
+SCHEMA_DELTA_COMPONENT = "_delta"
+
+from pyndn.util.boost_info_parser import BoostInfoParser, BoostInfoTree
+
+def _nodesFromTree(tree):
+    """
+    :return: The subtrees of a BoostInfoTree, as (key, value, children)
+    :rtype: list
+    """
+    nodes = []
+    for key, subtrees in tree.subtrees.items():
+        for subtree in subtrees:
+            nodes.append((key, subtree.getValue(), _nodesFromTree(subtree)))
+    return nodes
+
+def _addNodesToTree(tree, nodes):
+    for key, value, children in nodes:
+        _addNodesToTree(tree.createSubtree(key, value), children)
+
+def _encodeNodes(key, value, children):
+    """
+    :return: One validator section in Boost's INFO format
+    :rtype: str
+    """
+    tree = BoostInfoTree()
+    _addNodesToTree(tree, [(key, value, children)])
+    return str(tree)
+
+def writeSchemaFile(path, content):
+    """
+    Replace a configuration file. The new file is written beside the old one
+    and renamed over it, so a crash leaves one or the other.
+    :param str path: The file to write
+    :param str content: The new contents
+    """
+    directory = os.path.dirname(path)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+    tempPath = path + '.tmp'
+    with open(tempPath, 'w') as tempFile:
+        tempFile.write(content)
+        tempFile.flush()
+        os.fsync(tempFile.fileno())
+    os.rename(tempPath, path)
+
+class ApplicationSchema(object):
+    """
+    The trust schema the controller hosts for an application: a validator
+    configuration whose rules are kept by id, so a rule can be added or looked
+    up without rebuilding or searching a BoostInfo tree. Each rule is kept as
+    (key, value, children) nodes, so rules read from a file are written back
+    as they were.
+
+    The rules of the last few published versions are remembered, so a node
+    holding one of them can be sent only the rules added and removed since.
+    """
+    def __init__(self, appName, maxHistory=16):
+        """
+        :param str appName: The application's name
+        :param int maxHistory: (optional) The number of published versions
+            to remember
+        """
+        super(ApplicationSchema, self).__init__()
+        self.appName = appName
+        self.maxHistory = maxHistory
+        # the version of the last published _schema, 0 if never published
+        self.version = 0
+        # published version -> (encoded non-rule sections, OrderedDict of
+        # rule id -> encoded rule), oldest first
+        self._history = OrderedDict()
+        # validator sections other than rules, e.g. the trust anchor
+        self._otherNodes = []
+        # rule id -> the rule's nodes, in rule order
+        self._rules = OrderedDict()
+
+    @staticmethod
+    def fromTree(appName, tree):
+        """
+        Read a schema from a parsed configuration file.
+        :param str appName: The application's name
+        :param BoostInfoParser tree: The parsed configuration
+        :rtype: ApplicationSchema
+        """
+        schema = ApplicationSchema(appName)
+        validatorTree = tree["validator"][0]
+        for key, value, children in _nodesFromTree(validatorTree):
+            if key != "rule":
+                schema._otherNodes.append((key, value, children))
+                continue
+            ruleIds = [childValue for childKey, childValue, _ in children
+                    if childKey == "id"]
+            schema._rules[ruleIds[0]] = children
+        return schema
+
+    def setTrustAnchor(self, certificateBase64):
+        """
+        Replace the trust anchors with a single certificate.
+        :param str certificateBase64: The base64 encoded certificate
+        """
+        self._otherNodes = [node for node in self._otherNodes
+                if node[0] != "trust-anchor"]
+        self._otherNodes.insert(0, ("trust-anchor", None, [
+                ("type", "base64", []),
+                ("base64-string", certificateBase64, [])]))
+
+    def hasRule(self, ruleId):
+        """
+        :param str ruleId: The id of a rule, the data prefix URI for rules
+            added by addSignerRule
+        :rtype: boolean
+        """
+        return ruleId in self._rules
+
+    def getRuleIds(self):
+        """
+        :return: The rule ids, in rule order
+        :rtype: list of str
+        """
+        return list(self._rules.keys())
+
+    def removeRule(self, ruleId):
+        """
+        :param str ruleId: The id of the rule to remove
+        :return: False if there is no such rule
+        :rtype: boolean
+        """
+        return self._rules.pop(ruleId, None) is not None
+
+    def addRegexRule(self, ruleId, regex, signatureType, signerName=None,
+            signerRegex=None):
+        """
+        Add a rule for data matching a regex, signed by one certificate or by
+        any certificate matching a regex.
+        :param str ruleId: The rule's id
+        :param str regex: The NDN regex data names must match
+        :param str signatureType: The checker's sig-type
+        :param Name signerName: (optional) The signing certificate's name,
+            without version
+        :param str signerRegex: (optional) If signerName is not given, the
+            NDN regex the signing certificate's name must match
+        """
+        filterNodes = [("type", "regex", []), ("regex", regex, [])]
+        self._addRule(ruleId, filterNodes, signatureType, signerName,
+                signerRegex)
+
+    def addSignerRule(self, dataPrefix, signerName, signatureType):
+        """
+        Add a rule that data under a prefix must be signed by one certificate.
+        The rule's id is the prefix URI.
+        :param Name dataPrefix: The data prefix
+        :param Name signerName: The signing certificate's name, without version
+        :param str signatureType: The checker's sig-type
+        """
+        filterNodes = [("type", "name", []), ("name", dataPrefix.toUri(), []),
+                ("relation", "is-prefix-of", [])]
+        self._addRule(dataPrefix.toUri(), filterNodes, signatureType,
+                signerName)
+
+    def _addRule(self, ruleId, filterNodes, signatureType, signerName,
+            signerRegex=None):
+        if signerName is not None:
+            keyLocatorNodes = [("type", "name", []),
+                    ("name", signerName.toUri(), []),
+                    ("relation", "equal", [])]
+        else:
+            keyLocatorNodes = [("type", "name", []),
+                    ("regex", signerRegex, [])]
+        checkerNodes = [("type", "customized", []),
+                ("sig-type", signatureType, []),
+                ("key-locator", None, keyLocatorNodes)]
+        self._rules[ruleId] = [("id", ruleId, []), ("for", "data", []),
+                ("filter", None, filterNodes), ("checker", None, checkerNodes)]
+
+    def toTree(self):
+        """
+        :return: The schema as a validator configuration
+        :rtype: BoostInfoParser
+        """
+        tree = BoostInfoParser()
+        validatorTree = tree.getRoot().createSubtree("validator")
+        _addNodesToTree(validatorTree, self._otherNodes)
+        for ruleNodes in self._rules.values():
+            _addNodesToTree(validatorTree.createSubtree("rule"), ruleNodes)
+        return tree
+
+    def encode(self):
+        """
+        :return: The schema in Boost's INFO format, as in the .conf file and
+            the published _schema
+        :rtype: str
+        """
+        return str(self.toTree().getRoot())
+
+    def recordVersion(self, version):
+        """
+        Remember the current rules as a published version.
+        :param int version: The new version, greater than any recorded before
+        """
+        otherText = ''.join(_encodeNodes(*node) for node in self._otherNodes)
+        ruleTexts = OrderedDict((ruleId, _encodeNodes("rule", None, ruleNodes))
+                for ruleId, ruleNodes in self._rules.items())
+        self.version = version
+        self._history[version] = (otherText, ruleTexts)
+        while len(self._history) > self.maxHistory:
+            self._history.popitem(last=False)
+
+    def getRecordedVersions(self):
+        """
+        :return: The versions changes can be computed from, oldest first
+        :rtype: list of int
+        """
+        return list(self._history.keys())
+
+    def getChangesSince(self, fromVersion):
+        """
+        Compute what turns a published version into the latest one: remove
+        the rules with the removed ids, then append the added rules in order.
+        :param int fromVersion: The version the node holds
+        :return: {"from": fromVersion, "to": latest version, "added": [[rule
+            id, rule in INFO format], ...], "removed": [rule id, ...]}, or
+            None if fromVersion is not recorded, or the change is more than
+            rules appended and removed
+        :rtype: dict
+        """
+        if fromVersion not in self._history:
+            return None
+        fromOther, fromRules = self._history[fromVersion]
+        toOther, toRules = self._history[self.version]
+        if fromOther != toOther:
+            # e.g. a new trust anchor
+            return None
+        removed = [ruleId for ruleId, ruleText in fromRules.items()
+                if toRules.get(ruleId) != ruleText]
+        kept = [ruleId for ruleId in fromRules if ruleId not in removed]
+        added = [[ruleId, ruleText] for ruleId, ruleText in toRules.items()
+                if fromRules.get(ruleId) != ruleText]
+        if kept + [ruleId for ruleId, _ in added] != list(toRules.keys()):
+            # rules must stay in order, as the first matching rule is used
+            return None
+        return {"from": fromVersion, "to": self.version, "added": added,
+                "removed": removed}
@@ -19,19 +19,30 @@
 # A copy of the GNU General Public License is in the file COPYING.
 
 import logging
+import os
+import stat
 import time
 import sys
+import json
+
+from base64 import b64encode
 
 from pyndn import Name, Face, Interest, Data
-from pyndn.security import KeyChain
+from pyndn.security import KeyChain, KeyType
 
 from pyndn.security.policy import ConfigPolicyManager
 from pyndn.security.identity import IdentityManager, BasicIdentityStorage, FilePrivateKeyStorage
 from pyndn.security.security_exception import SecurityException
+from pyndn.security.certificate import IdentityCertificate
+from pyndn.util import Blob
+from pyndn.util.common import Common
 
 from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
 
 from security.iot_policy_manager import IotPolicyManager
+from security.session_key import SessionKeyStore
+from key_pool import KeyPool
 
 try:
     import asyncio
@@ -40,7 +51,8 @@ except ImportError:
 
 from pyndn.threadsafe_face import ThreadsafeFace
 
-Command = namedtuple('Command', ['suffix', 'function', 'keywords', 'isSigned'])
+Command = namedtuple('Command', ['suffix', 'function', 'keywords', 'isSigned',
+        'isBlocking', 'maxConcurrent'])
 
 class BaseNode(object):
     """
@@ -56,17 +68,36 @@ class BaseNode(object):
         
         self._identityStorage = BasicIdentityStorage()
 
-        self._identityManager = IdentityManager(self._identityStorage, FilePrivateKeyStorage())
+        self._privateKeyStorage = FilePrivateKeyStorage()
+        self._identityManager = IdentityManager(self._identityStorage, self._privateKeyStorage)
         self._policyManager = IotPolicyManager(self._identityStorage)
 
         # hopefully there is some private/public key pair available
         self._keyChain = KeyChain(self._identityManager, self._policyManager)
 
+        # HMAC session keys peers have negotiated with us
+        self._sessionKeyStore = SessionKeyStore()
+
+        # the type of key we generate for our identity
+        self._keyType = KeyType.RSA
+        # optional key pairs generated ahead of time
+        self._keyPool = None
+
         self._registrationFailures = 0
         self._prepareLogging()
 
         self._setupComplete = False
 
+        # identity lookups go to the database; cache them until identity changes
+        self.invalidateIdentityCache()
+
+        # responses are signed in a thread pool so the loop is not held up
+        self._signingWorkerCount = 2
+        self._signingExecutor = None
+        self._maxPendingSignatures = 64
+        self._pendingSignatures = 0
+        self._signingBackpressureCount = 0
+
 
 ##
 # Logging
@@ -106,6 +137,13 @@ class BaseNode(object):
         pass
 
     def getDefaultCertificateName(self):
+        """
+        :return: The name of the certificate used to sign our packets. This is
+            cached until invalidateIdentityCache is called.
+        :rtype: pyndn.Name
+        """
+        if self._defaultCertificateName is not None:
+            return self._defaultCertificateName
         try:
             certName = self._identityStorage.getDefaultCertificateNameForIdentity( 
                 self._policyManager.getDeviceIdentity())
@@ -114,8 +152,103 @@ class BaseNode(object):
             certName = self._keyChain.createIdentityAndCertificate(self._policyManager.getDeviceIdentity())
             #certName = self._keyChain.getDefaultCertificateName()
             #print(certName.toUri())
+        self._defaultCertificateName = certName
         return certName
 
+    def getDefaultCertificate(self):
+        """
+        :return: The certificate used to sign our packets, cached like its name
+        :rtype: pyndn.security.certificate.IdentityCertificate
+        """
+        if self._defaultCertificate is None:
+            self._defaultCertificate = self._identityManager.getCertificate(
+                    self.getDefaultCertificateName())
+        return self._defaultCertificate
+
+    def setKeyType(self, keyType):
+        """
+        Choose the type of key generated for this node's identity. ECDSA keys
+        are much cheaper to generate and use than RSA keys on Pi hardware.
+        :param int keyType: pyndn.security.KeyType.RSA (default) or KeyType.EC
+        """
+        # raises SecurityException for unsupported types
+        IotPolicyManager.getSignatureTypeForKeyType(keyType)
+        self._keyType = keyType
+        if self._keyPool is not None:
+            self._keyPool.keyType = keyType
+
+    def getKeyType(self):
+        """
+        :return: The type of key generated for this node's identity
+        :rtype: int
+        """
+        return self._keyType
+
+    def setKeyPoolSize(self, size, directory=""):
+        """
+        Keep key pairs generated ahead of time in a background process, so a
+        new identity doesn't wait for its key to be generated. Off by default.
+        :param int size: The number of keys to keep ready, or 0 to stop
+            generating them
+        :param str directory: (optional) Where to keep the keys, as for
+            KeyPool
+        """
+        if self._keyPool is not None:
+            self._keyPool.shutdown()
+            self._keyPool = None
+        if size > 0:
+            self._keyPool = KeyPool(size, self._keyType, directory)
+
+    def _generateKeyPairAsDefault(self, identityName, isKsk=False):
+        """
+        Take a key pair of our configured type from the key pool, or generate
+        one, and make it the default for the identity.
+        :return: The name of the new key
+        :rtype: pyndn.Name
+        """
+        keyPair = None
+        if (self._keyPool is not None and
+                isinstance(self._privateKeyStorage, FilePrivateKeyStorage)):
+            keyPair = self._keyPool.take()
+            self._keyPool.refill()
+        if keyPair is not None:
+            publicKeyDer, privateKeyDer = keyPair
+            keyName = self._identityStorage.getNewKeyName(identityName, isKsk)
+            self._installKeyPair(keyName, publicKeyDer, privateKeyDer)
+            self._identityStorage.addKey(keyName, self._keyType,
+                    Blob(publicKeyDer, False))
+            self._identityStorage.setDefaultKeyNameForIdentity(keyName)
+            self.log.debug("Took key from pool: " + keyName.toUri())
+            return keyName
+
+        if self._keyType == KeyType.EC:
+            return self._identityManager.generateEcdsaKeyPairAsDefault(
+                identityName, isKsk=isKsk)
+        return self._identityManager.generateRSAKeyPairAsDefault(
+            identityName, isKsk=isKsk)
+
+    def _installKeyPair(self, keyName, publicKeyDer, privateKeyDer):
+        """
+        Save a key pair in our FilePrivateKeyStorage under the given name, in
+        the same files FilePrivateKeyStorage.generateKeyPair writes.
+        """
+        keyFilePath = self._privateKeyStorage.maintainMapping(keyName.toUri())
+        with open(keyFilePath + ".pub", 'w') as keyFile:
+            keyFile.write(Common.base64Encode(publicKeyDer, True))
+        with open(keyFilePath + ".pri", 'w') as keyFile:
+            keyFile.write(Common.base64Encode(privateKeyDer, True))
+        os.chmod(keyFilePath + ".pub", stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+        os.chmod(keyFilePath + ".pri", stat.S_IRUSR)
+
+    def invalidateIdentityCache(self):
+        """
+        Forget the cached default certificate and signing information. Must be
+        called whenever the device identity or its default certificate changes.
+        """
+        self._defaultCertificateName = None
+        self._defaultCertificate = None
+        self._signatureTemplate = None
+
     def start(self):
         """
         Begins the event loop. After this, the node's Face is set up and it can
@@ -135,6 +268,9 @@ class BaseNode(object):
 
         self._isStopped = False
         self.beforeLoopStart()
+        if self._keyPool is not None:
+            # fill the pool while we wait to be paired or to pair others
+            self.loop.call_soon(self._keyPool.refill)
         
         try:
             self.loop.run_forever()
@@ -149,6 +285,11 @@ class BaseNode(object):
         """
         self.log.info("Shutting down")
         self._isStopped = True 
+        if self._signingExecutor is not None:
+            self._signingExecutor.shutdown(wait=False)
+            self._signingExecutor = None
+        if self._keyPool is not None:
+            self._keyPool.shutdown()
         self.loop.stop()
         
 ###
@@ -159,17 +300,189 @@ class BaseNode(object):
         Sign the data with our network certificate
         :param pyndn.Data data: The data to sign
         """
-        self._keyChain.sign(data, self.getDefaultCertificateName())
+        encoding, keyName, digestAlgorithm = self._prepareSignature(data)
+        data.getSignature().setSignature(self._privateKeyStorage.sign(
+                encoding.toSignedBuffer(), keyName, digestAlgorithm))
+        data.wireEncode()
+
+    def _prepareSignature(self, data):
+        """
+        Set the signature info on the data and encode the part to be signed.
+        Only the private key operation is left to the caller.
+        :return: The encoding, the signing key name and the digest algorithm
+        """
+        if self._signatureTemplate is None:
+            certificateName = self.getDefaultCertificateName()
+            keyName = IdentityCertificate.certificateNameToPublicKeyName(certificateName)
+            digestAlgorithm = [0]
+            signature = self._identityManager._makeSignatureByCertificate(
+                    certificateName, digestAlgorithm)
+            self._signatureTemplate = (signature, keyName, digestAlgorithm[0])
+        signature, keyName, digestAlgorithm = self._signatureTemplate
+
+        data.setSignature(signature)
+        return data.wireEncode(), keyName, digestAlgorithm
 
     def sendData(self, data, sign=True):
         """
         Reply to an interest with a data packet, optionally signing it.
+        The signature is computed in the signing thread pool when it is enabled,
+        and the packet is sent once it is ready.
         :param pyndn.Data data: The response data packet
         :param boolean sign: (optional, default=True) Whether the response must be signed. 
         """
-        if sign:
+        if not sign:
+            self.face.putData(data)
+        elif self._signingWorkerCount <= 0:
             self.signData(data)
-        self.face.putData(data)
+            self.face.putData(data)
+        elif self._pendingSignatures >= self._maxPendingSignatures:
+            # the pool can't keep up; sign here, slowing the loop down
+            self._signingBackpressureCount += 1
+            self.log.warn("Signing queue full ({} pending), signing {} inline".format(
+                self._pendingSignatures, data.getName().toUri()))
+            self.signData(data)
+            self.face.putData(data)
+        else:
+            self._signDataInPool(data)
+
+    def _signDataInPool(self, data):
+        """
+        Prepare the signature on the loop thread, where the identity storage
+        may be used, and leave only the private key operation to the pool.
+        """
+        encoding, keyName, digestAlgorithm = self._prepareSignature(data)
+
+        if self._signingExecutor is None:
+            self._signingExecutor = ThreadPoolExecutor(self._signingWorkerCount)
+        future = self.loop.run_in_executor(self._signingExecutor,
+                self._privateKeyStorage.sign, encoding.toSignedBuffer(), keyName,
+                digestAlgorithm)
+        self._pendingSignatures += 1
+
+        def onSigned(future):
+            self._pendingSignatures -= 1
+            if future.cancelled():
+                return
+            if future.exception() is not None:
+                self.log.error("Could not sign {}: {}".format(
+                    data.getName().toUri(), future.exception()))
+                return
+            data.getSignature().setSignature(future.result())
+            data.wireEncode()
+            self.face.putData(data)
+        future.add_done_callback(onSigned)
+
+    def setSigningWorkerCount(self, count, maxPending=None):
+        """
+        Configure the pool used to sign responses in sendData.
+        :param int count: The number of signing threads. If this is 0, responses
+            are signed synchronously, e.g. for testing.
+        :param int maxPending: (optional) The number of responses that may wait
+            for a signature. When this is reached, sendData signs inline.
+        """
+        self._signingWorkerCount = count
+        if maxPending is not None:
+            self._maxPendingSignatures = maxPending
+        if self._signingExecutor is not None:
+            self._signingExecutor.shutdown(wait=False)
+            self._signingExecutor = None
+
+    def getSigningQueueStatus(self):
+        """
+        :return: The number of responses waiting for a signature, the queue
+            limit, and how many times the limit forced an inline signature
+        :rtype: dict
+        """
+        return {'pending': self._pendingSignatures,
+                'maxPending': self._maxPendingSignatures,
+                'backpressure': self._signingBackpressureCount}
+
+###
+# Signed commands
+##
+    def getSignerIdentity(self, interest):
+        """
+        :param pyndn.Interest interest: A command interest signed with a
+            network certificate or a session key
+        :return: The identity that signed the interest, or None
+        :rtype: pyndn.Name
+        """
+        if self._sessionKeyStore.isSessionSigned(interest):
+            session = self._sessionKeyStore.findSessionForInterest(interest)
+            if session is None:
+                return None
+            return session.peerIdentity
+        signature = self._policyManager._extractSignature(interest)
+        if signature is None:
+            return None
+        certificateName = signature.getKeyLocator().getKeyName()
+        return IdentityCertificate.certificateNameToPublicKeyName(certificateName).getPrefix(-1)
+
+    def _verifyCommandInterest(self, interest, onVerified, onVerifyFailed):
+        """
+        Verify a signed command interest, against its session key if it was
+        signed with one, or with the key chain.
+        :param function onVerified: Called with the interest and the session
+            it came in under (None for certificate signatures)
+        :param function onVerifyFailed: Called with the interest
+        """
+        if self._sessionKeyStore.isSessionSigned(interest):
+            session = self._sessionKeyStore.findSessionForInterest(interest)
+            if session is not None and session.verifyInterest(interest):
+                onVerified(interest, session)
+            else:
+                onVerifyFailed(interest)
+            return
+        def onKeyChainVerified(interest):
+            onVerified(interest, None)
+        try:
+            self._keyChain.verifyInterest(interest, onKeyChainVerified, onVerifyFailed)
+        except Exception as e:
+            self.log.exception("Exception while verifying command", exc_info=True)
+            onVerifyFailed(interest)
+
+    def _sendCommandResponse(self, responseData, session=None):
+        """
+        Send the response to a command, signed with the session key the
+        command came in under, or with our certificate.
+        """
+        if session is None:
+            self.sendData(responseData)
+        else:
+            session.signData(responseData)
+            self.face.putData(responseData)
+
+    def _onSessionRequest(self, interest):
+        """
+        A peer sent /<prefix>/_session/<ECDH public value>, signed with its
+        network certificate. Answer with our public value and the session name.
+        """
+        def onVerified(interest):
+            peerPublicBits = interest.getName().get(self.prefix.size()+1).getValue().toBytes()
+            try:
+                created = self._sessionKeyStore.createSession(
+                        self.prefix, peerPublicBits, self.getSignerIdentity(interest))
+            except ValueError:
+                self.log.warn("Malformed session request: " + interest.getName().toUri())
+                return
+            if created is None:
+                # the peer keeps signing with its certificate
+                self.log.warn("Too many sessions, refused " + interest.getName().toUri())
+                return
+            session, publicBits = created
+            self.log.info("New session key " + session.keyName.toUri())
+
+            response = Data(interest.getName())
+            response.setContent(json.dumps({'name': session.keyName.toUri(),
+                'key': b64encode(publicBits),
+                'lifetime': self._sessionKeyStore.lifetime}))
+            self.sendData(response)
+        try:
+            self._keyChain.verifyInterest(interest, onVerified, self.verificationFailed)
+        except Exception as e:
+            self.log.exception("Exception while verifying session request", exc_info=True)
+            self.verificationFailed(interest)
 
 ###
 # 
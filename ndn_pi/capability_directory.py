@@ -0,0 +1,269 @@
+# -*- Mode:python; c-file-style:"gnu"; indent-tabs-mode:nil -*- */
+#
+# Copyright (C) 2016 Regents of the University of California.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+# A copy of the GNU General Public License is in the file COPYING.
+
+from collections import OrderedDict
+
+from pyndn import Name
+from pyndn.encoding import ProtobufTlv
+
+from commands import ListDevicesMessage
+
+# name component asking for a listing in ListDevicesMessage TLV, not JSON
+COMPACT_LISTING_COMPONENT = "_tlv"
+
+def encodeCompactListing(listing):
+    """
+    Encode a listing as a ListDevicesMessage. Each command name is stored as
+    an index into a table of shared prefixes (the name without its last
+    component) plus the remaining suffix.
+    :param dict listing: keyword -> list of listings, as from toDict()
+    :return: The TLV encoding
+    :rtype: str
+    """
+    message = ListDevicesMessage()
+    prefixIndexes = {}
+    for keyword in sorted(listing.keys()):
+        keywordMessage = message.keywords.add()
+        keywordMessage.keyword = keyword
+        for info in listing[keyword]:
+            commandName = Name(info['name'])
+            prefix = commandName.getPrefix(-1)
+            prefixUri = prefix.toUri()
+            if prefixUri not in prefixIndexes:
+                prefixIndexes[prefixUri] = len(message.prefixes)
+                prefixMessage = message.prefixes.add()
+                for i in range(prefix.size()):
+                    prefixMessage.components.append(prefix.get(i).getValue().toRawStr())
+
+            entry = keywordMessage.entries.add()
+            entry.prefixIndex = prefixIndexes[prefixUri]
+            for i in range(prefix.size(), commandName.size()):
+                entry.suffix.components.append(commandName.get(i).getValue().toRawStr())
+            entry.needsSignature = info['signed']
+            if info.get('unconfirmed', False):
+                entry.unconfirmed = True
+    return ProtobufTlv.encode(message).toRawStr()
+
+def decodeCompactListing(encoding):
+    """
+    :param str encoding: A listing encoded with encodeCompactListing
+    :return: keyword -> list of {'signed', 'name'} listings, as from toDict()
+    :rtype: dict
+    """
+    message = ListDevicesMessage()
+    ProtobufTlv.decode(message, bytearray(encoding))
+    prefixes = [Name() for i in range(len(message.prefixes))]
+    for prefix, prefixMessage in zip(prefixes, message.prefixes):
+        for component in prefixMessage.components:
+            prefix.append(component)
+
+    listing = {}
+    for keywordMessage in message.keywords:
+        entries = listing.setdefault(keywordMessage.keyword, [])
+        for entry in keywordMessage.entries:
+            commandName = Name(prefixes[entry.prefixIndex])
+            for component in entry.suffix.components:
+                commandName.append(component)
+            info = {'signed':entry.needsSignature, 'name':commandName.toUri()}
+            if entry.unconfirmed:
+                info['unconfirmed'] = True
+            entries.append(info)
+    return listing
+
+class CapabilityDirectory(object):
+    """
+    The controller's directory of device commands, indexed both by keyword and
+    by the identity that registered them. Replacing one identity's entries
+    only touches that identity's commands.
+    """
+    def __init__(self):
+        super(CapabilityDirectory, self).__init__()
+        # keyword -> OrderedDict of command URI -> listing
+        self._keywordIndex = {}
+        # identity URI -> list of (keyword, command URI)
+        self._identityIndex = {}
+        # identity URI -> digest of the capabilities message it last sent
+        self._identityDigests = {}
+        # identity URI -> time its capabilities were last sent or confirmed
+        self._identityRefreshTimes = {}
+        # identities whose entries were restored from disk and not yet
+        # confirmed by the identity itself
+        self._unconfirmedIdentities = set()
+        # incremented whenever a listing is added or removed
+        self._version = 0
+        # keyword -> the same, for the listings under that keyword
+        self._keywordVersions = {}
+
+    def addEntry(self, identity, keyword, commandUri, isSigned):
+        """
+        Add a command under a keyword. Does nothing if the command is already
+        listed under that keyword.
+        :param pyndn.Name identity: The identity the command belongs to
+        :param str keyword: The keyword to list the command under
+        :param str commandUri: The full command name
+        :param boolean isSigned: Whether the command must be signed
+        :return: Whether the entry was added
+        :rtype: boolean
+        """
+        entries = self._keywordIndex.setdefault(keyword, OrderedDict())
+        if commandUri in entries:
+            return False
+        entries[commandUri] = {'signed':isSigned, 'name':commandUri}
+        self._identityIndex.setdefault(identity.toUri(), []).append(
+            (keyword, commandUri))
+        self._version += 1
+        self._keywordVersions[keyword] = self._keywordVersions.get(keyword, 0) + 1
+        return True
+
+    def removeIdentity(self, identity):
+        """
+        Remove every entry registered by an identity.
+        :param pyndn.Name identity: The identity whose commands are removed
+        """
+        self._identityDigests.pop(identity.toUri(), None)
+        self._identityRefreshTimes.pop(identity.toUri(), None)
+        self._unconfirmedIdentities.discard(identity.toUri())
+        removed = self._identityIndex.pop(identity.toUri(), [])
+        for keyword, commandUri in removed:
+            entries = self._keywordIndex.get(keyword)
+            if entries is None:
+                continue
+            entries.pop(commandUri, None)
+            self._keywordVersions[keyword] += 1
+            if len(entries) == 0:
+                del self._keywordIndex[keyword]
+        if len(removed) > 0:
+            self._version += 1
+
+    def setDigest(self, identity, digest):
+        """
+        Remember the digest of the capabilities an identity registered, so its
+        periodic refreshes can be checked without resending the list.
+        :param pyndn.Name identity: The identity that sent the capabilities
+        :param str digest: The digest of its encoded capabilities message
+        """
+        self._identityDigests[identity.toUri()] = digest
+
+    def getDigest(self, identity):
+        """
+        :return: The digest last set for the identity, or None
+        :rtype: str
+        """
+        return self._identityDigests.get(identity.toUri())
+
+    def setRefreshTime(self, identity, refreshTime):
+        """
+        Record that an identity's entries are still current.
+        :param pyndn.Name identity: The identity that refreshed its entries
+        :param float refreshTime: The time of the refresh, from time.time()
+        """
+        self._identityRefreshTimes[identity.toUri()] = refreshTime
+
+    def getRefreshTime(self, identity):
+        """
+        :return: The time the identity last refreshed its entries, or None
+        :rtype: float
+        """
+        return self._identityRefreshTimes.get(identity.toUri())
+
+    def setConfirmed(self, identity, isConfirmed):
+        """
+        Mark an identity's entries as confirmed by the identity, or as only
+        restored from an earlier run. Unconfirmed listings carry
+        'unconfirmed': True.
+        :param pyndn.Name identity: The identity whose entries are marked
+        :param boolean isConfirmed: Whether the identity has confirmed them
+        """
+        identityUri = identity.toUri()
+        if isConfirmed == (identityUri not in self._unconfirmedIdentities):
+            return
+        if isConfirmed:
+            self._unconfirmedIdentities.discard(identityUri)
+        else:
+            self._unconfirmedIdentities.add(identityUri)
+        for keyword, commandUri in self._identityIndex.get(identityUri, []):
+            listing = self._keywordIndex[keyword][commandUri]
+            if isConfirmed:
+                listing.pop('unconfirmed', None)
+            else:
+                listing['unconfirmed'] = True
+            self._keywordVersions[keyword] += 1
+        self._version += 1
+
+    def identities(self):
+        """
+        :return: The URIs of the identities that have entries
+        :rtype: list of str
+        """
+        return list(self._identityIndex.keys())
+
+    def getIdentityEntries(self, identity):
+        """
+        :param pyndn.Name identity: The identity to look up
+        :return: (keyword, command URI, isSigned) for each of its entries
+        :rtype: list of tuple
+        """
+        return [(keyword, commandUri, self._keywordIndex[keyword][commandUri]['signed'])
+                for keyword, commandUri in self._identityIndex.get(identity.toUri(), [])]
+
+    def getEntries(self, keyword):
+        """
+        :param str keyword: The keyword to look up
+        :return: The listings for the keyword, in the order they were added
+        :rtype: list of dict
+        """
+        entries = self._keywordIndex.get(keyword)
+        if entries is None:
+            return []
+        return list(entries.values())
+
+    def getVersion(self):
+        """
+        :return: A counter that changes whenever the listings change
+        :rtype: int
+        """
+        return self._version
+
+    def getKeywordVersion(self, keyword):
+        """
+        :return: A counter that changes whenever the listings under the
+            keyword change
+        :rtype: int
+        """
+        return self._keywordVersions.get(keyword, 0)
+
+    def keywords(self):
+        return list(self._keywordIndex.keys())
+
+    def items(self):
+        """
+        :return: (keyword, listings) pairs for the whole directory
+        """
+        return [(keyword, list(entries.values()))
+                for keyword, entries in self._keywordIndex.items()]
+
+    def toDict(self, keywords=None):
+        """
+        :param list keywords: (optional) Only include these keywords
+        :return: keyword -> list of {'signed', 'name'} listings, e.g. for JSON
+        :rtype: dict
+        """
+        if keywords is None:
+            return dict(self.items())
+        return dict((keyword, self.getEntries(keyword)) for keyword in keywords
+                if keyword in self._keywordIndex)
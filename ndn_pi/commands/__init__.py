@@ -4,4 +4,5 @@ __all__ = ['cert_request_pb2', 'configure_device_pb2', 'list_devices_pb2',
 from cert_request_pb2 import CertificateRequestMessage
 from update_capabilities_pb2 import UpdateCapabilitiesCommandMessage
 from configure_device_pb2 import DeviceConfigurationMessage
-from app_request_pb2 import AppRequestMessage
\ No newline at end of file
+from app_request_pb2 import AppRequestMessage
+from list_devices_pb2 import ListDevicesMessage
@@ -0,0 +1,197 @@
+# Generated by the protocol buffer compiler.  DO NOT EDIT!
+# source: list-devices.proto
+
+from google.protobuf import descriptor as _descriptor
+from google.protobuf import message as _message
+from google.protobuf import reflection as _reflection
+from google.protobuf import descriptor_pb2
+# @@protoc_insertion_point(imports)
+
+
+
+
+DESCRIPTOR = _descriptor.FileDescriptor(
+  name='list-devices.proto',
+  package='',
+  serialized_pb='\n\x12list-devices.proto\"\xd0\x02\n\x12ListDevicesMessage\x12+\n\x08prefixes\x18\xed\x01 \x03(\x0b\x32\x18.ListDevicesMessage.Name\x12.\n\x08keywords\x18\xee\x01 \x03(\x0b\x32\x1b.ListDevicesMessage.Keyword\x1a\x1a\n\x04Name\x12\x12\n\ncomponents\x18\x08 \x03(\x0c\x1aw\n\x05\x45ntry\x12\x14\n\x0bprefixIndex\x18\xe7\x01 \x02(\r\x12)\n\x06suffix\x18\xe8\x01 \x02(\x0b\x32\x18.ListDevicesMessage.Name\x12\x17\n\x0eneedsSignature\x18\xe9\x01 \x01(\x08\x12\x14\n\x0bunconfirmed\x18\xea\x01 \x01(\x08\x1aH\n\x07Keyword\x12\x10\n\x07keyword\x18\xeb\x01 \x02(\t\x12+\n\x07\x65ntries\x18\xec\x01 \x03(\x0b\x32\x19.ListDevicesMessage.Entry')
+
+
+
+_LISTDEVICESMESSAGE_NAME = _descriptor.Descriptor(
+  name='Name',
+  full_name='ListDevicesMessage.Name',
+  filename=None,
+  file=DESCRIPTOR,
+  containing_type=None,
+  fields=[
+    _descriptor.FieldDescriptor(
+      name='components', full_name='ListDevicesMessage.Name.components', index=0,
+      number=8, type=12, cpp_type=9, label=3,
+      has_default_value=False, default_value=[],
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      options=None),
+  ],
+  extensions=[
+  ],
+  nested_types=[],
+  enum_types=[
+  ],
+  options=None,
+  is_extendable=False,
+  extension_ranges=[],
+  serialized_start=138,
+  serialized_end=164,
+)
+
+_LISTDEVICESMESSAGE_ENTRY = _descriptor.Descriptor(
+  name='Entry',
+  full_name='ListDevicesMessage.Entry',
+  filename=None,
+  file=DESCRIPTOR,
+  containing_type=None,
+  fields=[
+    _descriptor.FieldDescriptor(
+      name='prefixIndex', full_name='ListDevicesMessage.Entry.prefixIndex', index=0,
+      number=231, type=13, cpp_type=3, label=2,
+      has_default_value=False, default_value=0,
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      options=None),
+    _descriptor.FieldDescriptor(
+      name='suffix', full_name='ListDevicesMessage.Entry.suffix', index=1,
+      number=232, type=11, cpp_type=10, label=2,
+      has_default_value=False, default_value=None,
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      options=None),
+    _descriptor.FieldDescriptor(
+      name='needsSignature', full_name='ListDevicesMessage.Entry.needsSignature', index=2,
+      number=233, type=8, cpp_type=7, label=1,
+      has_default_value=False, default_value=False,
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      options=None),
+    _descriptor.FieldDescriptor(
+      name='unconfirmed', full_name='ListDevicesMessage.Entry.unconfirmed', index=3,
+      number=234, type=8, cpp_type=7, label=1,
+      has_default_value=False, default_value=False,
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      options=None),
+  ],
+  extensions=[
+  ],
+  nested_types=[],
+  enum_types=[
+  ],
+  options=None,
+  is_extendable=False,
+  extension_ranges=[],
+  serialized_start=166,
+  serialized_end=285,
+)
+
+_LISTDEVICESMESSAGE_KEYWORD = _descriptor.Descriptor(
+  name='Keyword',
+  full_name='ListDevicesMessage.Keyword',
+  filename=None,
+  file=DESCRIPTOR,
+  containing_type=None,
+  fields=[
+    _descriptor.FieldDescriptor(
+      name='keyword', full_name='ListDevicesMessage.Keyword.keyword', index=0,
+      number=235, type=9, cpp_type=9, label=2,
+      has_default_value=False, default_value=unicode("", "utf-8"),
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      options=None),
+    _descriptor.FieldDescriptor(
+      name='entries', full_name='ListDevicesMessage.Keyword.entries', index=1,
+      number=236, type=11, cpp_type=10, label=3,
+      has_default_value=False, default_value=[],
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      options=None),
+  ],
+  extensions=[
+  ],
+  nested_types=[],
+  enum_types=[
+  ],
+  options=None,
+  is_extendable=False,
+  extension_ranges=[],
+  serialized_start=287,
+  serialized_end=359,
+)
+
+_LISTDEVICESMESSAGE = _descriptor.Descriptor(
+  name='ListDevicesMessage',
+  full_name='ListDevicesMessage',
+  filename=None,
+  file=DESCRIPTOR,
+  containing_type=None,
+  fields=[
+    _descriptor.FieldDescriptor(
+      name='prefixes', full_name='ListDevicesMessage.prefixes', index=0,
+      number=237, type=11, cpp_type=10, label=3,
+      has_default_value=False, default_value=[],
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      options=None),
+    _descriptor.FieldDescriptor(
+      name='keywords', full_name='ListDevicesMessage.keywords', index=1,
+      number=238, type=11, cpp_type=10, label=3,
+      has_default_value=False, default_value=[],
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      options=None),
+  ],
+  extensions=[
+  ],
+  nested_types=[_LISTDEVICESMESSAGE_NAME, _LISTDEVICESMESSAGE_ENTRY, _LISTDEVICESMESSAGE_KEYWORD, ],
+  enum_types=[
+  ],
+  options=None,
+  is_extendable=False,
+  extension_ranges=[],
+  serialized_start=23,
+  serialized_end=359,
+)
+
+_LISTDEVICESMESSAGE_NAME.containing_type = _LISTDEVICESMESSAGE;
+_LISTDEVICESMESSAGE_ENTRY.fields_by_name['suffix'].message_type = _LISTDEVICESMESSAGE_NAME
+_LISTDEVICESMESSAGE_ENTRY.containing_type = _LISTDEVICESMESSAGE;
+_LISTDEVICESMESSAGE_KEYWORD.fields_by_name['entries'].message_type = _LISTDEVICESMESSAGE_ENTRY
+_LISTDEVICESMESSAGE_KEYWORD.containing_type = _LISTDEVICESMESSAGE;
+_LISTDEVICESMESSAGE.fields_by_name['prefixes'].message_type = _LISTDEVICESMESSAGE_NAME
+_LISTDEVICESMESSAGE.fields_by_name['keywords'].message_type = _LISTDEVICESMESSAGE_KEYWORD
+DESCRIPTOR.message_types_by_name['ListDevicesMessage'] = _LISTDEVICESMESSAGE
+
+class ListDevicesMessage(_message.Message):
+  __metaclass__ = _reflection.GeneratedProtocolMessageType
+
+  class Name(_message.Message):
+    __metaclass__ = _reflection.GeneratedProtocolMessageType
+    DESCRIPTOR = _LISTDEVICESMESSAGE_NAME
+
+    # @@protoc_insertion_point(class_scope:ListDevicesMessage.Name)
+
+  class Entry(_message.Message):
+    __metaclass__ = _reflection.GeneratedProtocolMessageType
+    DESCRIPTOR = _LISTDEVICESMESSAGE_ENTRY
+
+    # @@protoc_insertion_point(class_scope:ListDevicesMessage.Entry)
+
+  class Keyword(_message.Message):
+    __metaclass__ = _reflection.GeneratedProtocolMessageType
+    DESCRIPTOR = _LISTDEVICESMESSAGE_KEYWORD
+
+    # @@protoc_insertion_point(class_scope:ListDevicesMessage.Keyword)
+  DESCRIPTOR = _LISTDEVICESMESSAGE
+
+  # @@protoc_insertion_point(class_scope:ListDevicesMessage)
+
+
+# @@protoc_insertion_point(module_scope)
@@ -0,0 +1,147 @@
+# -*- Mode:python; c-file-style:"gnu"; indent-tabs-mode:nil -*- */
+#
+# Copyright (C) 2016 Regents of the University of California.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+# A copy of the GNU General Public License is in the file COPYING.
+
+import os
+import json
+import logging
+from binascii import hexlify, unhexlify
+
+class DirectoryJournal(object):
+    """
+    An append-only file of the changes made to a CapabilityDirectory, so a
+    restarted controller can rebuild its directory. Each line is a JSON record
+    replacing everything known about one identity:
+        {"identity": uri, "digest": hex, "entries": [[keyword, name, signed], ...]}
+    with "entries" null when the identity was removed. Once enough records are
+    superseded, the file is rewritten with one record per identity.
+    """
+    def __init__(self, path, minCompactionRecords=64):
+        """
+        :param str path: The journal file, created if it does not exist
+        :param int minCompactionRecords: (optional) Never compact a journal
+            with fewer records than this
+        """
+        super(DirectoryJournal, self).__init__()
+        self.path = path
+        self.minCompactionRecords = minCompactionRecords
+        self._file = None
+        self._recordCount = 0
+        self._liveIdentities = set()
+        self.log = logging.getLogger(str(self.__class__))
+
+    def replay(self):
+        """
+        Read the journal.
+        :return: The latest record for each identity still in the directory,
+            as (identity URI, digest, [(keyword, name, signed)])
+        :rtype: list
+        """
+        latest = {}
+        self._recordCount = 0
+        if os.path.exists(self.path):
+            with open(self.path) as journalFile:
+                for line in journalFile:
+                    try:
+                        record = json.loads(line)
+                        identityUri = record['identity']
+                    except (ValueError, KeyError, TypeError):
+                        # e.g. a line cut short by a crash
+                        self.log.warn("Skipping bad journal record")
+                        continue
+                    self._recordCount += 1
+                    if record.get('entries') is None:
+                        latest.pop(identityUri, None)
+                    else:
+                        latest[identityUri] = record
+        self._liveIdentities = set(latest.keys())
+
+        replayed = []
+        for identityUri, record in latest.items():
+            digest = record.get('digest')
+            if digest is not None:
+                digest = unhexlify(digest)
+            entries = [(keyword, name, signed)
+                    for keyword, name, signed in record['entries']]
+            replayed.append((identityUri, digest, entries))
+        return replayed
+
+    def recordIdentity(self, identityUri, digest, entries):
+        """
+        Record the current entries of an identity.
+        :param str identityUri: The identity
+        :param str digest: The digest of its capabilities message, or None
+        :param list entries: (keyword, name, signed) for each of its entries
+        """
+        if digest is not None:
+            digest = hexlify(digest)
+        self._liveIdentities.add(identityUri)
+        self._append({'identity': identityUri, 'digest': digest,
+                'entries': [list(entry) for entry in entries]})
+
+    def recordRemoval(self, identityUri):
+        """
+        Record that an identity's entries were removed.
+        """
+        self._liveIdentities.discard(identityUri)
+        self._append({'identity': identityUri, 'entries': None})
+
+    def needsCompaction(self):
+        """
+        :return: Whether most records in the journal have been superseded
+        :rtype: boolean
+        """
+        return (self._recordCount >= self.minCompactionRecords and
+                self._recordCount > 2*len(self._liveIdentities))
+
+    def compact(self, records):
+        """
+        Replace the journal with the given records. The new journal is written
+        beside the old one and renamed over it, so a crash leaves one or the
+        other.
+        :param list records: (identity URI, digest, entries) for every identity
+            in the directory, as for recordIdentity
+        """
+        self.close()
+        tempPath = self.path + '.tmp'
+        with open(tempPath, 'w') as tempFile:
+            for identityUri, digest, entries in records:
+                if digest is not None:
+                    digest = hexlify(digest)
+                tempFile.write(json.dumps({'identity': identityUri,
+                        'digest': digest,
+                        'entries': [list(entry) for entry in entries]}) + '\n')
+            tempFile.flush()
+            os.fsync(tempFile.fileno())
+        os.rename(tempPath, self.path)
+        self._recordCount = len(records)
+        self._liveIdentities = set(record[0] for record in records)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _append(self, record):
+        if self._file is None:
+            directory = os.path.dirname(self.path)
+            if directory and not os.path.exists(directory):
+                os.makedirs(directory)
+            self._file = open(self.path, 'a')
+        self._file.write(json.dumps(record) + '\n')
+        self._file.flush()
+        self._recordCount += 1
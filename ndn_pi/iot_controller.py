@@ -1,26 +1,36 @@
 from __future__ import print_function
 
 import logging
+import os
 import time
+import threading
 from sys import stdin, stdout
 import struct
 
 from pyndn import Name, Face, Interest, Data
-from pyndn.security import KeyChain
+from pyndn.security import KeyChain, KeyType
 from pyndn.security.certificate import IdentityCertificate, PublicKey, CertificateSubjectDescription
 from pyndn.encoding import ProtobufTlv
 from pyndn.security.security_exception import SecurityException
+from pyndn.security.identity import BasicIdentityStorage
 from pyndn.util import Blob, MemoryContentCache
 from pyndn.util.boost_info_parser import BoostInfoParser, BoostInfoTree
 
 from base_node import BaseNode, Command
+from capability_directory import CapabilityDirectory, encodeCompactListing, COMPACT_LISTING_COMPONENT
+from timer_wheel import TimerWheel
+from directory_journal import DirectoryJournal
+from application_schema import ApplicationSchema, writeSchemaFile, SCHEMA_DELTA_COMPONENT
 
 from commands import CertificateRequestMessage, UpdateCapabilitiesCommandMessage, DeviceConfigurationMessage, AppRequestMessage
 from security.hmac_helper import HmacHelper
+from security.session_key import SESSION_COMPONENT
 
-from collections import defaultdict
 import json
 from base64 import b64encode
+from hashlib import sha256
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 
 try:
     import asyncio
@@ -35,74 +45,147 @@ try:
 except NameError:
     pass
 
+# content bytes per segment of a published directory listing
+DIRECTORY_SEGMENT_SIZE = 4096
+
 class IotController(BaseNode):
     """
     The controller class has a few built-in commands:
-        - listDevices: return the names and capabilities of all attached devices
+        - listDevices: return the names and capabilities of all attached devices,
+            or only those under the keywords following listDevices in the name.
+            JSON by default, or a ListDevicesMessage if the keywords are
+            followed by a _tlv component
         - certificateRequest: takes public key information and returns name of
             new certificate
+        - certificateRenewal: the same, signed by the device's current
+            certificate instead of its pairing key. Rate limited.
         - updateCapabilities: should be sent periodically from IotNodes to update their
            command lists
         - addDevice: add a device based on HMAC
+        - <app>/_schema/_delta/<version>: the rules added to and removed from an
+            application's trust schema since a version, or the name of the
+            latest _schema if those changes can't be given
     It is unlikely that you will need to subclass this.
     """
-    def __init__(self, nodeName, networkName, applicationDirectory = ""):
+    def __init__(self, nodeName, networkName, applicationDirectory = "",
+            keyType = KeyType.RSA, journalPath = ""):
         super(IotController, self).__init__()
         
         self.deviceSuffix = Name(nodeName)
         self.networkPrefix = Name(networkName)
         self.prefix = Name(self.networkPrefix).append(self.deviceSuffix)
 
+        # the controller's key type is used for the whole network's trust rules
+        self.setKeyType(keyType)
+        self._policyManager.setKeyType(keyType)
         self._policyManager.setEnvironmentPrefix(self.networkPrefix)
         self._policyManager.setTrustRootIdentity(self.prefix)
         self._policyManager.setDeviceIdentity(self.prefix)
         self._policyManager.updateTrustRules()
         
         # the controller keeps a directory of capabilities->names
-        self._directory = defaultdict(list)
+        self._directory = CapabilityDirectory()
+
+        # the listing is published as signed, versioned segments that the
+        # content cache answers until the directory changes
+        self._directoryFreshnessPeriod = 10000
+        # (keyword tuple, isCompact) -> published listing, least recently
+        # requested first. The keyword tuple is empty for the whole directory
+        self._publishedListings = OrderedDict()
+        self._maxPublishedListings = 64
+        self._directoryPublishScheduled = False
+
+        # nodes refresh their entries every 30 seconds; we drop the entries
+        # of a node that misses a few refreshes in a row
+        self._capabilityRefreshPeriod = 30
+        self._maxMissedRefreshes = 3
+        self._expiryWheel = TimerWheel(tickDuration=1.0, wheelSize=128)
+        self._nextExpiryTick = None
 
         # keep track of who's still using HMACs
         # key is device serial, value is the HmacHelper
         self._hmacDevices = {}
-
-        # our capabilities
-        self._baseDirectory = {}
+        # device serial -> function called with the serial and the outcome of
+        # its configuration interest: its status, 'invalid' or 'timeout'
+        self._pairingCallbacks = {}
+        self._bulkPairing = None
+
+        # device certificates are stored and signed in a thread pool
+        self._issuingWorkerCount = 2
+        self._issuingExecutor = None
+        self._issuingStorage = threading.local()
+        # device serial -> request being issued, and the interests waiting on it
+        self._certificateRequests = {}
+        # device serial -> certificate just issued, to answer lost responses
+        self._recentCertificates = {}
+        self._certificateStats = {"issued": 0, "failed": 0, "merged": 0,
+                "totalLatency": 0.0, "maxLatency": 0.0}
+
+        # certificate renewals are limited by a token bucket; devices over
+        # the limit are each given a later time to come back
+        self._renewalRate = 1.0
+        self._renewalBurst = 10
+        self._renewalTokens = self._renewalBurst
+        self._lastRenewalRefill = time.time()
+        self._nextRenewalSlot = 0
+        self._deferredRenewals = 0
 
         # add the built-ins
         self._insertIntoCapabilities('listDevices', 'directory', False)
         self._insertIntoCapabilities('updateCapabilities', 'capabilities', True)
-
-        self._directory.update(self._baseDirectory)
+        self._insertIntoCapabilities('capabilitiesDigest', 'capabilities', True)
 
         # Set up application directory
         if applicationDirectory == "":
             applicationDirectory = os.path.expanduser('~/.ndn/iot/applications')
         self._applicationDirectory = applicationDirectory
+        # application name -> ApplicationSchema
         self._applications = dict()
+        # schema changes are written and published in batches: application
+        # name -> whether a new _schema version should be published
+        self._changedApplications = {}
+        self._schemaFlushDelay = 1.0
+        self._schemaFlushHandle = None
+        self._schemaWriter = None
+        # application name -> recorded version changes are asked from ->
+        # signed response, for the application's latest version
+        self._schemaDeltas = {}
+        self._schemaDeltaFreshnessPeriod = 1000
+
+        # the directory is journaled so a restart doesn't forget every node
+        if journalPath == "":
+            journalPath = os.path.expanduser('~/.ndn/iot/directory.journal')
+        self._journal = DirectoryJournal(journalPath)
         
     def _insertIntoCapabilities(self, commandName, keyword, isSigned):
         newUri = Name(self.prefix).append(Name(commandName)).toUri()
-        self._baseDirectory[keyword] = [{'signed':isSigned, 'name':newUri}]
+        self._directory.addEntry(self.prefix, keyword, newUri, isSigned)
 
     def beforeLoopStart(self):
         if not self._policyManager.hasRootSignedCertificate():
             # make one....
             self.log.warn('Generating controller certificate...')
-            newKey = self._identityManager.generateRSAKeyPairAsDefault(
-                self.prefix, isKsk=True)
+            newKey = self._generateKeyPairAsDefault(self.prefix, isKsk=True)
             newCert = self._identityManager.selfSign(newKey)
             self._identityManager.addCertificateAsDefault(newCert)
+        # start() may have looked up our certificate before it existed
+        self.invalidateIdentityCache()
         # Trusting root's own certificate upon each run
         # TODO: debug where application starts first and controller starts second, application's interest cannot be verified
-        self._rootCertificate = self._keyChain.getCertificate(self.getDefaultCertificateName())
-        self._policyManager._certificateCache.insertCertificate(self._rootCertificate)
+        self._rootCertificate = self.getDefaultCertificate()
+        self._policyManager.pinCertificate(self._rootCertificate)
         
         self._memoryContentCache = MemoryContentCache(self.face)
+        # have the last run's directory ready before we answer any interest
+        self._restoreDirectory()
         self.face.setCommandSigningInfo(self._keyChain, self.getDefaultCertificateName())
         self._memoryContentCache.registerPrefix(self.prefix, onRegisterFailed = self.onRegisterFailed, 
           onRegisterSuccess = None, onDataNotFound = self._onCommandReceived)
         # Serve root certificate in our memoryContentCache
         self._memoryContentCache.add(self._rootCertificate)
+        self._publishDirectory()
+        self._nextExpiryTick = self.loop.time()
+        self._onExpiryTick()
         self.loadApplications()
         self.loop.call_soon(self.onStartup)
 
@@ -137,6 +220,7 @@ class IotController(BaseNode):
         self.log.warn("Timed out trying to configure device " + deviceSerial)
         # don't try again
         self._hmacDevices.pop(deviceSerial)
+        self._notifyPairingResult(deviceSerial, 'timeout')
 
     def _deviceAdditionResponse(self, interest, data):
         status = data.getContent().toRawStr()
@@ -146,7 +230,115 @@ class IotController(BaseNode):
             self.log.info("Received {} from {}".format(status, deviceSerial))
         else:
             self.log.warn("Received invalid HMAC from {}".format(deviceSerial))
-        
+            status = 'invalid'
+        self._notifyPairingResult(deviceSerial, status)
+
+    def _notifyPairingResult(self, deviceSerial, result):
+        callback = self._pairingCallbacks.pop(deviceSerial, None)
+        if callback is not None:
+            callback(deviceSerial, result)
+
+######
+# Bulk pairing
+######
+
+    @staticmethod
+    def readPairingManifest(fileName):
+        """
+        Read the devices to pair from a file with one device per line:
+            <serial> <PIN (hex)> <node name>
+        Fields may also be separated by commas. Blank lines and lines starting
+        with # are ignored.
+        :return: (serial, PIN, node name) for each device
+        :rtype: list of (str, str, pyndn.Name)
+        """
+        devices = []
+        with open(fileName) as manifest:
+            for lineNumber, line in enumerate(manifest, 1):
+                line = line.strip()
+                if len(line) == 0 or line.startswith('#'):
+                    continue
+                fields = line.replace(',', ' ').split()
+                if len(fields) != 3:
+                    raise ValueError('{}:{}: expected serial, PIN and node name'.format(
+                            fileName, lineNumber))
+                deviceSerial, devicePin, deviceSuffix = fields
+                if deviceSerial in [device[0] for device in devices]:
+                    raise ValueError('{}:{}: serial {} is listed twice'.format(
+                            fileName, lineNumber, deviceSerial))
+                devices.append((deviceSerial, devicePin.decode('hex'), Name(deviceSuffix)))
+        return devices
+
+    def pairDevices(self, devices, maxConcurrent=8, maxAttempts=4, retryDelay=2.0,
+            onComplete=None):
+        """
+        Pair many devices, a few at a time. A device that does not answer is
+        tried again after retryDelay seconds, doubling the delay on each
+        further attempt. Progress is printed as each device finishes.
+        :param list devices: (serial, PIN, node name) for each device, as from
+            readPairingManifest
+        :param int maxConcurrent: (optional) How many devices may be waiting
+            for a configuration response at once
+        :param int maxAttempts: (optional) How many times to try each device
+        :param float retryDelay: (optional) Seconds before the first retry
+        :param function onComplete: (optional) Called with a dict of serial ->
+            result ('200' when configured) once every device is done
+        """
+        if self._bulkPairing is not None:
+            raise RuntimeError("Bulk pairing is already running")
+        self._bulkPairing = {"waiting": list(reversed(devices)), "inFlight": 0,
+                "results": {}, "total": len(devices), "started": time.time(),
+                "maxConcurrent": maxConcurrent, "maxAttempts": maxAttempts,
+                "retryDelay": retryDelay, "onComplete": onComplete}
+        print('Pairing {} devices'.format(len(devices)))
+        self._startNextPairings()
+
+    def _startNextPairings(self):
+        pairing = self._bulkPairing
+        while pairing["inFlight"] < pairing["maxConcurrent"] and len(pairing["waiting"]) > 0:
+            device = pairing["waiting"].pop()
+            self._startPairing(device, 1)
+        if pairing["inFlight"] == 0 and len(pairing["waiting"]) == 0:
+            self._finishBulkPairing()
+
+    def _startPairing(self, device, attempt):
+        pairing = self._bulkPairing
+        deviceSerial, devicePin, deviceSuffix = device
+        pairing["inFlight"] += 1
+
+        def onResult(deviceSerial, result):
+            if result == 'timeout' and attempt < pairing["maxAttempts"]:
+                delay = pairing["retryDelay"]*(2**(attempt-1))
+                self.log.info('Retrying {} in {}s (attempt {}/{})'.format(
+                        deviceSerial, delay, attempt+1, pairing["maxAttempts"]))
+                # keep our slot until the retry is done
+                def retry():
+                    pairing["inFlight"] -= 1
+                    self._startPairing(device, attempt+1)
+                self.loop.call_later(delay, retry)
+                return
+            pairing["inFlight"] -= 1
+            pairing["results"][deviceSerial] = result
+            print('[{}/{}] {}: {} after {} attempt(s)'.format(len(pairing["results"]),
+                    pairing["total"], deviceSerial, result, attempt))
+            self._startNextPairings()
+
+        self._pairingCallbacks[deviceSerial] = onResult
+        self._addDeviceToNetwork(deviceSerial, deviceSuffix, devicePin)
+
+    def _finishBulkPairing(self):
+        pairing = self._bulkPairing
+        self._bulkPairing = None
+        results = pairing["results"]
+        paired = len([result for result in results.values() if result == '200'])
+        print('Paired {} of {} devices in {:.1f}s'.format(paired, pairing["total"],
+                time.time() - pairing["started"]))
+        for deviceSerial, result in sorted(results.items()):
+            if result != '200':
+                print('\t{}: {}'.format(deviceSerial, result))
+        if pairing["onComplete"] is not None:
+            pairing["onComplete"](results)
+
 ######
 # Certificate signing
 ######
@@ -156,7 +348,9 @@ class IotController(BaseNode):
         Extracts a public key name and key bits from a command interest name 
         component. Generates a certificate if the request is verifiable.
 
-        This expects an HMAC signed interest.
+        This expects an HMAC signed interest. The storage writes and signing
+        happen in the issuing thread pool; requests from a device that is
+        already being issued a certificate wait for that one.
         """
         message = CertificateRequestMessage()
         commandParamsTlv = interest.getName().get(self.prefix.size()+1)
@@ -165,22 +359,68 @@ class IotController(BaseNode):
         signature = HmacHelper.extractInterestSignature(interest)
         deviceSerial = str(signature.getKeyLocator().getKeyName().get(-1).getValue())
 
-        response = Data(interest.getName())
-        certData = None
-        hmac = None
-        try:
-            hmac = self._hmacDevices[deviceSerial]
-            if hmac.verifyInterest(interest):
-                certData = self._createCertificateFromRequest(message)
-                # remove this hmac; another request will require a new pin
-                self._hmacDevices.pop(deviceSerial)
-        except KeyError:
+        recent = self._recentCertificates.get(deviceSerial)
+        if recent is not None and recent["expiry"] > time.time():
+            # a retry from a device that did not get our answer
+            if recent["hmac"].verifyInterest(interest):
+                self._certificateStats["merged"] += 1
+                self._sendCertificateResponse(interest, recent["certificate"], recent["hmac"])
+                return
+
+        hmac = self._hmacDevices.get(deviceSerial)
+        if hmac is None:
             self.log.warn('Received certificate request for device with no registered key')
+            self._sendCertificateResponse(interest, None, None)
+            return
+        if not hmac.verifyInterest(interest):
+            self._sendCertificateResponse(interest, None, hmac)
+            return
+
+        request = self._certificateRequests.get(deviceSerial)
+        if request is not None:
+            self.log.debug('Merging certificate request from {}'.format(deviceSerial))
+            request["interests"].append(interest)
+            self._certificateStats["merged"] += 1
+            return
+
+        try:
+            preparedCertificate = self._prepareCertificateFromRequest(message)
         except SecurityException as e:
             self.log.warn('Could not create device certificate: ' + str(e))
-        else:
-            self.log.info('Creating certificate for device {}'.format(deviceSerial))
-
+            preparedCertificate = None
+        if preparedCertificate is None:
+            # remove this hmac; another request will require a new pin
+            self._hmacDevices.pop(deviceSerial)
+            self._sendCertificateResponse(interest, None, hmac)
+            return
+
+        self.log.info('Creating certificate for device {}'.format(deviceSerial))
+        def respond(interest, certData):
+            self._sendCertificateResponse(interest, certData, hmac)
+        self._startIssuing(deviceSerial, interest, preparedCertificate, respond, hmac)
+
+    def _startIssuing(self, requestKey, interest, preparedCertificate, respond,
+            hmac=None):
+        """
+        Hand a prepared certificate to the issuing thread pool.
+        :param str requestKey: Identifies the request, so duplicates can wait
+            for it: a device serial, or an identity URI for renewals
+        :param function respond: Called with each waiting interest and the
+            issued certificate, or None if issuing failed
+        :param HmacHelper hmac: (optional) The pairing key the request was
+            signed with
+        """
+        self._certificateRequests[requestKey] = {"interests": [interest],
+                "hmac": hmac, "respond": respond, "started": time.time()}
+        if self._issuingExecutor is None:
+            self._issuingExecutor = ThreadPoolExecutor(self._issuingWorkerCount)
+        future = self.loop.run_in_executor(self._issuingExecutor,
+                self._issueCertificate, *preparedCertificate)
+        future.add_done_callback(
+                lambda future: self._onCertificateIssued(requestKey, future))
+
+    def _sendCertificateResponse(self, interest, certData, hmac):
+        response = Data(interest.getName())
         if certData is not None:
             response.setContent(certData.wireEncode())
             response.getMetaInfo().setFreshnessPeriod(10000) # should be good even longer
@@ -190,9 +430,12 @@ class IotController(BaseNode):
             hmac.signData(response)
         self.sendData(response, False)
 
-    def _createCertificateFromRequest(self, message):
+    def _prepareCertificateFromRequest(self, message):
         """
-        Generate an IdentityCertificate from the public key information given.
+        Check the public key information given and build an unsigned
+        IdentityCertificate for it, ready for _issueCertificate.
+        :return: The arguments for _issueCertificate, or None if we do not
+            issue certificates for the key
         """
         # TODO: Verify the certificate was actually signed with the private key
         # matching the public key we are issuing a cert for!!
@@ -209,21 +452,206 @@ class IotController(BaseNode):
         keyDer = Blob(message.command.keyBits)
         keyType = message.command.keyType
 
+        # raises SecurityException if we can't issue for this kind of key
+        self._policyManager.getSignatureTypeForKeyType(keyType)
+        publicKey = PublicKey(keyDer)
+        if publicKey.getKeyType() != keyType:
+            raise SecurityException("Key bits do not match the requested key type")
+
+        # the same certificate IdentityManager would make for a stored key
+        timestamp = int(time.time()*1000)
+        certificateName = keyName.getPrefix(-1).append('KEY').append(keyName.get(-1))
+        certificateName.append("ID-CERT").appendVersion(timestamp)
+
+        certificate = IdentityCertificate()
+        certificate.setName(certificateName)
+        certificate.setNotBefore(timestamp)
+        certificate.setNotAfter(timestamp + 2*365*24*3600*1000) # about 2 years.
+        certificate.setPublicKeyInfo(publicKey)
+        certificate.addSubjectDescription(
+                CertificateSubjectDescription("2.5.4.41", keyName.toUri()))
+        certificate.encode()
+
+        # the signing key lookup uses our identity storage, so do it here
+        encoding, signingKeyName, digestAlgorithm = self._prepareSignature(certificate)
+        return (keyName, keyType, keyDer, certificate, encoding, signingKeyName,
+                digestAlgorithm)
+
+    def _issueCertificate(self, keyName, keyType, keyDer, certificate, encoding,
+            signingKeyName, digestAlgorithm):
+        """
+        Runs in the issuing thread pool: store the device key, sign its
+        certificate and store that too. SQLite connections can't be shared
+        between threads, so each worker has its own identity storage.
+        :return: The signed certificate
+        :rtype: pyndn.security.certificate.IdentityCertificate
+        """
+        identityStorage = getattr(self._issuingStorage, "identityStorage", None)
+        if identityStorage is None:
+            identityStorage = BasicIdentityStorage()
+            self._issuingStorage.identityStorage = identityStorage
+
+        # does nothing if the key was stored by an earlier request
+        identityStorage.addKey(keyName, keyType, keyDer)
+
+        certificate.getSignature().setSignature(self._privateKeyStorage.sign(
+                encoding.toSignedBuffer(), signingKeyName, digestAlgorithm))
+        certificate.wireEncode()
+        # store it for later use + verification
+        identityStorage.addCertificate(certificate)
+        return certificate
+
+    def _onCertificateIssued(self, requestKey, future):
+        request = self._certificateRequests.pop(requestKey)
+        if request["hmac"] is not None:
+            # remove this hmac; another request will require a new pin
+            self._hmacDevices.pop(requestKey, None)
+        latency = time.time() - request["started"]
+
+        certData = None
+        if future.cancelled():
+            # e.g. the issuing pool was shut down; the waiters are denied
+            # like any other failure rather than left to time out
+            self._certificateStats["failed"] += 1
+            self.log.warn('Device certificate for {} was cancelled'.format(requestKey))
+        elif future.exception() is not None:
+            self._certificateStats["failed"] += 1
+            self.log.warn('Could not create device certificate: ' + str(future.exception()))
+        else:
+            certData = future.result()
+            self._policyManager._certificateCache.insertCertificate(certData)
+
+            stats = self._certificateStats
+            stats["issued"] += 1
+            stats["totalLatency"] += latency
+            stats["maxLatency"] = max(stats["maxLatency"], latency)
+            self.log.info('Issued {} in {:.0f}ms ({} more queued)'.format(
+                    certData.getName().toUri(), latency*1000,
+                    len(self._certificateRequests)))
+
+            if request["hmac"] is not None:
+                now = time.time()
+                for serial in [serial for serial, recent in self._recentCertificates.items()
+                        if recent["expiry"] <= now]:
+                    del self._recentCertificates[serial]
+                self._recentCertificates[requestKey] = {"certificate": certData,
+                        "hmac": request["hmac"], "expiry": now + 60}
+
+        for interest in request["interests"]:
+            request["respond"](interest, certData)
+
+    def _handleCertificateRenewal(self, interest, session):
+        """
+        Issue a new certificate to a device that already has one. The device
+        may only renew certificates for keys under its own identity. If too
+        many devices are renewing, the device is told how many seconds to wait
+        before asking again.
+        """
+        identity = self.getSignerIdentity(interest)
+        message = CertificateRequestMessage()
+        commandParamsTlv = interest.getName().get(self.prefix.size()+1)
+        ProtobufTlv.decode(message, commandParamsTlv.getValue())
+        keyName = Name("/".join(message.command.keyName.components))
+
+        def respond(interest, certData):
+            response = Data(interest.getName())
+            if certData is not None:
+                response.setContent(certData.wireEncode())
+            else:
+                response.setContent("Denied")
+            self._sendCommandResponse(response, session)
+
+        if identity is None or not identity.equals(keyName.getPrefix(-1)):
+            self.log.warn('Refusing renewal of {} by {}'.format(keyName.toUri(),
+                    identity.toUri() if identity is not None else None))
+            respond(interest, None)
+            return
+
+        request = self._certificateRequests.get(identity.toUri())
+        if request is not None:
+            request["interests"].append(interest)
+            self._certificateStats["merged"] += 1
+            return
+
+        retryAfter = self._takeRenewalToken()
+        if retryAfter > 0:
+            self.log.debug('Deferring renewal for {} by {:.1f}s'.format(
+                    identity.toUri(), retryAfter))
+            response = Data(interest.getName())
+            response.setContent("Retry-After {:.1f}".format(retryAfter))
+            self._sendCommandResponse(response, session)
+            return
+
         try:
-            self._identityStorage.addKey(keyName, keyType, keyDer)
+            preparedCertificate = self._prepareCertificateFromRequest(message)
         except SecurityException as e:
-            print(e)
-            # assume this is due to already existing?
-            pass
+            self.log.warn('Could not renew device certificate: ' + str(e))
+            preparedCertificate = None
+        if preparedCertificate is None:
+            respond(interest, None)
+            return
 
-        certificate = self._identityManager._generateCertificateForKey(keyName)
+        self.log.info('Renewing certificate for {}'.format(identity.toUri()))
+        self._startIssuing(identity.toUri(), interest, preparedCertificate, respond)
 
-        self._keyChain.sign(certificate, self.getDefaultCertificateName())
-        # store it for later use + verification
-        self._identityStorage.addCertificate(certificate)
-        self._policyManager._certificateCache.insertCertificate(certificate)
+    def _takeRenewalToken(self):
+        """
+        :return: 0 if a renewal may go ahead now, or else the seconds the
+            device should wait. Each deferred device gets its own slot after
+            the ones deferred before it.
+        :rtype: float
+        """
+        now = time.time()
+        self._renewalTokens = min(self._renewalBurst, self._renewalTokens +
+                (now - self._lastRenewalRefill)*self._renewalRate)
+        self._lastRenewalRefill = now
+        if self._renewalTokens >= 1:
+            self._renewalTokens -= 1
+            return 0
+
+        nextToken = now + (1 - self._renewalTokens)/self._renewalRate
+        self._nextRenewalSlot = max(nextToken,
+                self._nextRenewalSlot + 1.0/self._renewalRate)
+        self._deferredRenewals += 1
+        return self._nextRenewalSlot - now
+
+    def setCertificateRenewalLimit(self, rate, burst=10):
+        """
+        Limit how quickly device certificates are renewed.
+        :param float rate: The renewals allowed per second, on average
+        :param int burst: (optional) The renewals allowed at once after a
+            quiet period
+        """
+        self._renewalRate = float(rate)
+        self._renewalBurst = burst
+        self._renewalTokens = min(self._renewalTokens, burst)
 
-        return certificate
+    def setIssuingWorkerCount(self, count):
+        """
+        :param int count: The number of threads that store and sign device
+            certificates
+        """
+        self._issuingWorkerCount = count
+        if self._issuingExecutor is not None:
+            self._issuingExecutor.shutdown(wait=False)
+            self._issuingExecutor = None
+
+    def getCertificateQueueStatus(self):
+        """
+        :return: The number of certificates being issued, how many have been
+            issued or failed, how many duplicate requests were merged, how
+            many renewals were deferred by the rate limit, and the mean and
+            maximum issuing latency in seconds
+        :rtype: dict
+        """
+        stats = self._certificateStats
+        issued = stats["issued"]
+        return {'queued': len(self._certificateRequests),
+                'issued': issued, 'failed': stats["failed"],
+                'merged': stats["merged"],
+                'deferredRenewals': self._deferredRenewals,
+                'meanLatency': stats["totalLatency"]/issued if issued else 0.0,
+                'maxLatency': stats["maxLatency"]}
 
 ######
 # Device Capabilities
@@ -234,9 +662,7 @@ class IotController(BaseNode):
         Take the received capabilities update interest and update our directory listings.
         """
         # we assume the sender is the one who signed the interest...
-        signature = self._policyManager._extractSignature(interest)
-        certificateName = signature.getKeyLocator().getKeyName()
-        senderIdentity = IdentityCertificate.certificateNameToPublicKeyName(certificateName).getPrefix(-1)
+        senderIdentity = self.getSignerIdentity(interest)
 
         self.log.info('Updating capabilities for {}'.format(senderIdentity.toUri()))
 
@@ -245,10 +671,9 @@ class IotController(BaseNode):
         message = UpdateCapabilitiesCommandMessage()
         ProtobufTlv.decode(message, messageComponent.getValue())
         # we remove all the old capabilities for the sender
-        tempDirectory = defaultdict(list)
-        for keyword in self._directory:
-            tempDirectory[keyword] = [cap for cap in self._directory[keyword] 
-                    if not senderIdentity.match(Name(cap['name']))]
+        self._directory.removeIdentity(senderIdentity)
+        self._directory.setDigest(senderIdentity,
+                sha256(messageComponent.getValue().toBytes()).digest())
 
         # then we add the ones from the message
         for capability in message.capabilities:
@@ -261,25 +686,212 @@ class IotController(BaseNode):
                     senderIdentity.toUri(),commandUri))
             else:    
                 for keyword in capability.keywords:
-                    allUris = [info['name'] for info in tempDirectory[keyword]]
-                    if capabilityPrefix not in allUris:
-                        listing = {'signed':capability.needsSignature,
-                                'name':commandUri}
-                        tempDirectory[keyword].append(listing)
-        self._directory = tempDirectory
+                    self._directory.addEntry(senderIdentity, keyword, commandUri,
+                            capability.needsSignature)
+        self._refreshDeviceCapabilities(senderIdentity)
+        self._scheduleDirectoryPublish()
+
+        self._journal.recordIdentity(senderIdentity.toUri(),
+                self._directory.getDigest(senderIdentity),
+                self._directory.getIdentityEntries(senderIdentity))
+        if self._journal.needsCompaction():
+            self._compactJournal()
+
+    def _restoreDirectory(self):
+        """
+        Reload the directory from the journal. The entries are listed as
+        unconfirmed until their node refreshes them, and expire as usual if it
+        never does.
+        """
+        replayed = self._journal.replay()
+        for identityUri, digest, entries in replayed:
+            identity = Name(identityUri)
+            for keyword, commandUri, isSigned in entries:
+                self._directory.addEntry(identity, keyword, commandUri, isSigned)
+            if digest is not None:
+                self._directory.setDigest(identity, digest)
+            self._directory.setConfirmed(identity, False)
+            self._expiryWheel.schedule(identityUri,
+                    self._maxMissedRefreshes*self._capabilityRefreshPeriod)
+        if len(replayed) > 0:
+            self.log.info('Restored capabilities of {} devices'.format(len(replayed)))
+
+    def _compactJournal(self):
+        records = []
+        for identityUri in self._directory.identities():
+            identity = Name(identityUri)
+            if identity.equals(self.prefix):
+                # the built-ins are added on every start
+                continue
+            records.append((identityUri, self._directory.getDigest(identity),
+                    self._directory.getIdentityEntries(identity)))
+        self._journal.compact(records)
+
+    def _checkCapabilitiesDigest(self, interest):
+        """
+        Compare a node's capabilities digest with the one we have for it.
+        :return: 'unchanged' if it matches, or 'update' to ask for the full list
+        :rtype: str
+        """
+        senderIdentity = self.getSignerIdentity(interest)
+        digest = interest.getName().get(self.prefix.size()+1).getValue().toBytes()
+        if senderIdentity is not None and self._directory.getDigest(senderIdentity) == digest:
+            self._refreshDeviceCapabilities(senderIdentity)
+            return 'unchanged'
+        return 'update'
+
+    def setCapabilityExpiry(self, maxMissedRefreshes, refreshPeriod=30):
+        """
+        Set when the entries of a node that stopped refreshing them are removed.
+        Takes effect at each node's next refresh.
+        :param int maxMissedRefreshes: How many refreshes in a row may be missed
+        :param float refreshPeriod: (optional) The seconds between refreshes
+            from the nodes
+        """
+        self._maxMissedRefreshes = maxMissedRefreshes
+        self._capabilityRefreshPeriod = refreshPeriod
+
+    def _refreshDeviceCapabilities(self, identity):
+        """
+        Push back the expiry of an identity's entries.
+        """
+        self._directory.setRefreshTime(identity, time.time())
+        version = self._directory.getVersion()
+        self._directory.setConfirmed(identity, True)
+        if self._directory.getVersion() != version:
+            self._scheduleDirectoryPublish()
+        self._expiryWheel.schedule(identity.toUri(),
+                self._maxMissedRefreshes*self._capabilityRefreshPeriod)
+
+    def _onExpiryTick(self):
+        """
+        Advance the expiry wheel to the current time and remove the entries of
+        nodes that have not refreshed them.
+        """
+        tickDuration = self._expiryWheel.tickDuration
+        now = self.loop.time()
+        expired = []
+        # catch up if the loop was busy
+        while self._nextExpiryTick <= now:
+            expired.extend(self._expiryWheel.tick())
+            self._nextExpiryTick += tickDuration
+
+        for identityUri in expired:
+            identity = Name(identityUri)
+            self.log.info('Capabilities of {} expired (last refreshed {})'.format(
+                identityUri, self._directory.getRefreshTime(identity)))
+            self._directory.removeIdentity(identity)
+            self._journal.recordRemoval(identityUri)
+        if len(expired) > 0:
+            self._scheduleDirectoryPublish()
+
+        self.loop.call_later(self._nextExpiryTick - now, self._onExpiryTick)
 
     def _prepareCapabilitiesList(self, interestName):
         """
-        Responds to a directory listing request with JSON
+        Responds to a directory listing request with JSON. Only used for
+        requests that the published segments cannot answer, e.g. signed ones.
         """
-        
+        listing = self._publishListing()
         dataName = Name(interestName).append(Name.Component.fromNumber(int(time.time())))
         response = Data(dataName)
 
-        response.setContent(json.dumps(self._directory))
+        response.setContent(listing['content'])
 
         return response
 
+    def _scheduleDirectoryPublish(self):
+        """
+        Republish the directory once the current burst of updates is handled.
+        """
+        if not self._directoryPublishScheduled:
+            self._directoryPublishScheduled = True
+            self.loop.call_soon(self._publishDirectory)
+
+    def _publishDirectory(self):
+        """
+        Bring every listing that has been requested up to date. New versions
+        go into the content cache, which answers the interests waiting for them.
+        """
+        self._directoryPublishScheduled = False
+        self._publishListing()
+        # republishing in order keeps the least recently requested first
+        for keywords, isCompact in list(self._publishedListings.keys()):
+            self._publishListing(keywords, isCompact)
+
+    def _getListingVersion(self, keywords):
+        if len(keywords) == 0:
+            return self._directory.getVersion()
+        return tuple(self._directory.getKeywordVersion(keyword)
+                for keyword in keywords)
+
+    def _publishListing(self, keywords=(), isCompact=False):
+        """
+        Make sure the listing for some keywords (or the whole directory) is
+        encoded, segmented and signed, and in the content cache as
+        /<prefix>/listDevices/[<keyword>/...][_tlv/]<version>/<segment>.
+        Nothing is re-encoded or re-signed unless the listed entries changed.
+        :param tuple keywords: The keywords to list, or () for everything
+        :param boolean isCompact: (optional) Encode as a ListDevicesMessage
+            instead of JSON
+        :return: The published listing
+        :rtype: dict
+        """
+        listingKey = (keywords, isCompact)
+        listing = self._publishedListings.get(listingKey)
+        version = self._getListingVersion(keywords)
+        if listing is not None:
+            # most recently used last
+            del self._publishedListings[listingKey]
+            self._publishedListings[listingKey] = listing
+            if listing['version'] == version:
+                if time.time() >= listing['expiry']:
+                    # unchanged, so the packets we already signed are still good
+                    self._addListingToCache(listing)
+                return listing
+
+        if isCompact:
+            content = encodeCompactListing(self._directory.toDict(keywords or None))
+        else:
+            content = json.dumps(self._directory.toDict(keywords or None), sort_keys=True)
+        if listing is not None and listing['content'] == content:
+            # e.g. a node re-registered the same commands
+            listing['version'] = version
+            return listing
+
+        listingName = Name(self.prefix).append('listDevices')
+        for keyword in keywords:
+            listingName.append(keyword)
+        if isCompact:
+            listingName.append(COMPACT_LISTING_COMPONENT)
+        versionName = listingName.appendVersion(int(time.time()*1000))
+        chunks = [content[i:i+DIRECTORY_SEGMENT_SIZE]
+                for i in range(0, len(content), DIRECTORY_SEGMENT_SIZE)] or ['']
+        finalBlockId = Name.Component.fromSegment(len(chunks)-1)
+
+        segments = []
+        for i, chunk in enumerate(chunks):
+            segment = Data(Name(versionName).appendSegment(i))
+            segment.setContent(chunk)
+            segment.getMetaInfo().setFreshnessPeriod(self._directoryFreshnessPeriod)
+            segment.getMetaInfo().setFinalBlockId(finalBlockId)
+            self.signData(segment)
+            segments.append(segment)
+
+        listing = {"version": version, "content": content, "segments": segments,
+                "expiry": 0}
+        self._publishedListings[listingKey] = listing
+        while len(self._publishedListings) > self._maxPublishedListings:
+            self._publishedListings.popitem(last=False)
+        self._addListingToCache(listing)
+        self.log.debug("Published directory listing " + versionName.toUri())
+        return listing
+
+    def _addListingToCache(self, listing):
+        for segment in listing['segments']:
+            self._memoryContentCache.add(segment)
+        listing['expiry'] = time.time() + self._directoryFreshnessPeriod/1000.0
+
 #####
 # Interest handling
 ####
@@ -293,7 +905,7 @@ class IotController(BaseNode):
         # TODO: since we've memoryContentCache serving root cert now, this should no longer be required
         try:
             if interestName.isPrefixOf(self.getDefaultCertificateName()):
-                foundCert = self._identityManager.getCertificate(self.getDefaultCertificateName())
+                foundCert = self.getDefaultCertificate()
                 self.log.debug("Serving certificate request")
                 self.face.putData(foundCert)
                 return
@@ -307,24 +919,62 @@ class IotController(BaseNode):
         if afterPrefix == "listDevices":
             #compose device list
             self.log.debug("Received device list request")
-            response = self._prepareCapabilitiesList(interestName)
-            self.sendData(response)
+            if HmacHelper.extractInterestSignature(interest) is not None:
+                # signed requests can't be answered from the cache
+                response = self._prepareCapabilitiesList(interestName)
+                self.sendData(response)
+                return
+            # /<prefix>/listDevices/[<keyword>/...][_tlv/][<version>/<segment>]
+            keywords = []
+            isCompact = False
+            for i in range(prefix.size()+1, interestName.size()):
+                component = interestName.get(i)
+                if component.isVersion():
+                    break
+                value = component.getValue().toRawStr()
+                if value == COMPACT_LISTING_COMPONENT:
+                    isCompact = True
+                    break
+                keywords.append(value)
+            for segment in self._publishListing(tuple(keywords), isCompact)['segments']:
+                if interest.matchesName(segment.getName()):
+                    self.face.putData(segment)
+                    return
+            # wait for the next version, e.g. a watcher that has the current one
+            self._memoryContentCache.storePendingInterest(interest, face)
         elif afterPrefix == "certificateRequest":
             #build and sign certificate
             self.log.debug("Received certificate request")
             self._handleCertificateRequest(interest)
+        elif afterPrefix == "certificateRenewal":
+            # signed with the certificate being renewed
+            self.log.debug("Received certificate renewal")
+            self._verifyCommandInterest(interest,
+                    self._handleCertificateRenewal, self.verificationFailed)
 
         elif afterPrefix == "updateCapabilities":
             # needs to be signed!
             self.log.debug("Received capabilities update")
-            def onVerifiedCapabilities(interest):
+            def onVerifiedCapabilities(interest, session):
                 print("capabilities good")
                 response = Data(interest.getName())
                 response.setContent(str(time.time()))
-                self.sendData(response)
+                self._sendCommandResponse(response, session)
                 self._updateDeviceCapabilities(interest)
-            self._keyChain.verifyInterest(interest, 
+            self._verifyCommandInterest(interest, 
                     onVerifiedCapabilities, self.verificationFailed)
+        elif afterPrefix == "capabilitiesDigest":
+            # periodic refresh from a node whose list we should already have
+            self.log.debug("Received capabilities digest")
+            def onVerifiedDigest(interest, session):
+                response = Data(interest.getName())
+                response.setContent(self._checkCapabilitiesDigest(interest))
+                self._sendCommandResponse(response, session)
+            self._verifyCommandInterest(interest, 
+                    onVerifiedDigest, self.verificationFailed)
+        elif afterPrefix == SESSION_COMPONENT:
+            self.log.debug("Received session key request")
+            self._onSessionRequest(interest)
         elif afterPrefix == "requests":
             # application request to publish under some names received; need to be signed
             def onVerifiedAppRequest(interest):
@@ -356,6 +1006,11 @@ class IotController(BaseNode):
             #print(self._policyManager.config)
             self._keyChain.verifyInterest(interest, 
                     onVerifiedAppRequest, onVerificationFailedAppRequest)
+        elif (afterPrefix in self._applications and interestName.size() > prefix.size() + 3
+                and interestName.get(prefix.size() + 1).toEscapedString() == "_schema"
+                and interestName.get(prefix.size() + 2).toEscapedString() == SCHEMA_DELTA_COMPONENT):
+            self._handleSchemaDeltaRequest(interest, afterPrefix,
+                interestName.get(prefix.size() + 3))
         else:
             print("Got interest unable to answer yet: " + interest.getName().toUri())
             if interest.getExclude():
@@ -365,6 +1020,18 @@ class IotController(BaseNode):
             # response.getMetaInfo().setFreshnessPeriod(1000)
             # self.sendData(response)
 
+    def stop(self):
+        # don't lose schema changes that are waiting to be written, and
+        # don't let an earlier write land after them
+        if self._schemaWriter is not None:
+            self._schemaWriter.shutdown(wait=True)
+            self._schemaWriter = None
+        self._flushApplications(isStopping=True)
+        if self._issuingExecutor is not None:
+            self._issuingExecutor.shutdown(wait=False)
+            self._issuingExecutor = None
+        super(IotController, self).stop()
+
     def onStartup(self):
         # begin taking add requests
         self.loop.call_soon(self.displayMenu)
@@ -373,6 +1040,7 @@ class IotController(BaseNode):
     def displayMenu(self):
         menuStr = "\n"
         menuStr += "P)air a new device with serial and PIN\n"
+        menuStr += "B)ulk pair devices from a file\n"
         menuStr += "D)irectory listing\n"
         menuStr += "E)xpress an interest\n"
         menuStr += "L)oad hosted applications (" + (self._applicationDirectory) + ")\n"
@@ -446,12 +1114,28 @@ class IotController(BaseNode):
         finally:
             self.loop.call_soon(self.displayMenu)
 
+    def beginBulkPairing(self):
+        try:
+            fileName = input('Device file (serial PIN name per line): ')
+        except KeyboardInterrupt:
+            print('Pairing attempt aborted')
+        else:
+            try:
+                devices = self.readPairingManifest(os.path.expanduser(fileName))
+                self.pairDevices(devices)
+            except (IOError, ValueError, TypeError, RuntimeError) as e:
+                print('Could not pair devices: ' + str(e))
+        finally:
+            self.loop.call_soon(self.displayMenu)
+
     def handleUserInput(self):
         inputStr = stdin.readline().upper()
         if inputStr.startswith('D'):
             self.listDevices()
         elif inputStr.startswith('P'):
             self.beginPairing()
+        elif inputStr.startswith('B'):
+            self.beginBulkPairing()
         elif inputStr.startswith('E'):
             self.expressInterest()
         elif inputStr.startswith('Q'):
@@ -465,105 +1149,176 @@ class IotController(BaseNode):
 # application trust schema distribution
 ########################
     def updateTrustSchema(self, appName, certName, dataPrefix, publishNew = False):
-        if appName in self._applications:
-            if dataPrefix.toUri() in self._applications[appName]["dataPrefix"]:
-                print("some key is configured for namespace " + dataPrefix.toUri() + " for application " + appName + ". Ignoring this request.")
-                return False
-            else:
-                # TODO: Handle malformed conf where validator tree does not exist
-                validatorNode = self._applications[appName]["tree"]["validator"][0]
-        else:
+        """
+        Allow a certificate to sign an application's data under a prefix. The
+        schema changes at once; the .conf file is rewritten, and a new _schema
+        version published, once the current burst of changes is over.
+        :param str appName: The application
+        :param Name certName: The certificate allowed to sign
+        :param Name dataPrefix: The prefix of the data it may sign
+        :param boolean publishNew: (optional) Publish a new _schema version
+        :return: False if some key is already configured for the prefix
+        :rtype: boolean
+        """
+        signatureType = self._policyManager.getSignatureTypeForKeyType(
+            self._policyManager.getKeyType())
+        schema = self._applications.get(appName)
+        if schema is None:
             # This application does not previously exist, we create its trust schema 
             # (and for now, add in static rules for sync data)
-
-            self._applications[appName] = {"tree": BoostInfoParser(), "dataPrefix": [], "version": 0}
-            validatorNode = self._applications[appName]["tree"].getRoot().createSubtree("validator")
-            
-            trustAnchorNode = validatorNode.createSubtree("trust-anchor")
-            #trustAnchorNode.createSubtree("type", "file")
-            #trustAnchorNode.createSubtree("file-name", os.path.expanduser("~/.ndn/iot/root.cert"))
-            trustAnchorNode.createSubtree("type", "base64")
-            trustAnchorNode.createSubtree("base64-string", Blob(b64encode(self._rootCertificate.wireEncode().toBytes()), False).toRawStr())
+            schema = ApplicationSchema(appName)
+            schema.setTrustAnchor(Blob(b64encode(self._rootCertificate.wireEncode().toBytes()), False).toRawStr())
 
             #create cert verification rule
             # TODO: the idea for this would be, if the cert has /home-prefix/<one-component>/KEY/ksk-*/ID-CERT, then it should be signed by fixed controller(s)
             # if the cert has /home-prefix/<multiple-components>/KEY/ksk-*/ID-CERT, then it should be checked hierarchically (this is for subdomain support)
-            certRuleNode = validatorNode.createSubtree("rule")
-            certRuleNode.createSubtree("id", "Certs")
-            certRuleNode.createSubtree("for", "data")
-
-            filterNode = certRuleNode.createSubtree("filter")
-            filterNode.createSubtree("type", "regex")
-            filterNode.createSubtree("regex", "^[^<KEY>]*<KEY><>*<ID-CERT>")
-
-            checkerNode = certRuleNode.createSubtree("checker")
-            # TODO: wait how did my first hierarchical verifier work?
-            #checkerNode.createSubtree("type", "hierarchical")
-
-            checkerNode.createSubtree("type", "customized")
-            checkerNode.createSubtree("sig-type", "rsa-sha256")
-
-            keyLocatorNode = checkerNode.createSubtree("key-locator")
-            keyLocatorNode.createSubtree("type", "name")
             # We don't put cert version in there
-            keyLocatorNode.createSubtree("name", Name(self.getDefaultCertificateName()).getPrefix(-1).toUri())
-            keyLocatorNode.createSubtree("relation", "equal")
+            schema.addRegexRule("Certs", "^[^<KEY>]*<KEY><>*<ID-CERT>", signatureType,
+                signerName=Name(self.getDefaultCertificateName()).getPrefix(-1))
 
             # Discovery rule: anything that multicasts under my home prefix should be signed, and the signer should have been authorized by root
             # TODO: This rule as of right now is over-general
-            discoveryRuleNode = validatorNode.createSubtree("rule")
-            discoveryRuleNode.createSubtree("id", "sync-data")
-            discoveryRuleNode.createSubtree("for", "data")
-
-            filterNode = discoveryRuleNode.createSubtree("filter")
-            filterNode.createSubtree("type", "regex")
-            filterNode.createSubtree("regex", "^[^<MULTICAST>]*<MULTICAST><>*")
+            schema.addRegexRule("sync-data", "^[^<MULTICAST>]*<MULTICAST><>*", signatureType,
+                signerRegex="^[^<KEY>]*<KEY><>*<ID-CERT>")
+            self._applications[appName] = schema
+        elif schema.hasRule(dataPrefix.toUri()):
+            print("some key is configured for namespace " + dataPrefix.toUri() + " for application " + appName + ". Ignoring this request.")
+            return False
 
-            checkerNode = discoveryRuleNode.createSubtree("checker")
-            # TODO: wait how did my first hierarchical verifier work?
-            #checkerNode.createSubtree("type", "hierarchical")
+        # We don't put cert version in there
+        schema.addSignerRule(dataPrefix, certName.getPrefix(-1), signatureType)
+        self._onApplicationChanged(appName, publishNew)
+        return True
 
-            checkerNode.createSubtree("type", "customized")
-            checkerNode.createSubtree("sig-type", "rsa-sha256")
+    def removeTrustSchema(self, appName, dataPrefix, publishNew = False):
+        """
+        Stop allowing data under a prefix to be signed for an application.
+        :param str appName: The application
+        :param Name dataPrefix: The prefix given to updateTrustSchema
+        :param boolean publishNew: (optional) Publish a new _schema version
+        :return: False if no key is configured for the prefix
+        :rtype: boolean
+        """
+        schema = self._applications.get(appName)
+        if schema is None or not schema.removeRule(dataPrefix.toUri()):
+            return False
+        self._onApplicationChanged(appName, publishNew)
+        return True
 
-            keyLocatorNode = checkerNode.createSubtree("key-locator")
-            keyLocatorNode.createSubtree("type", "name")
-            keyLocatorNode.createSubtree("regex", "^[^<KEY>]*<KEY><>*<ID-CERT>")
+    def _onApplicationChanged(self, appName, publishNew):
+        self._changedApplications[appName] = (self._changedApplications.get(appName, False)
+            or publishNew)
+        if self._schemaFlushHandle is None:
+            self._schemaFlushHandle = self.loop.call_later(self._schemaFlushDelay,
+                self._flushApplications)
 
+    def setSchemaFlushDelay(self, delay):
+        """
+        :param float delay: How long after an application's schema changes to
+            write its file and publish it, in seconds. Changes made meanwhile
+            go into the same file write and _schema version.
+        """
+        self._schemaFlushDelay = delay
+
+    def _publishSchema(self, schema, content):
+        # TODO: ideally, this is the trust schema of the application, and does not necessarily carry controller prefix. 
+        # We make it carry controller prefix here so that prefix registration / route setup is easier (implementation workaround)
+        # versions must increase even when several are published in a second
+        previousVersion = schema.version
+        schema.recordVersion(max(int(time.time()), schema.version + 1))
+        data = Data(Name(self.prefix).append(schema.appName).append("_schema").appendVersion(schema.version))
+        data.setContent(content)
+        self.signData(data)
+        self._memoryContentCache.add(data)
+
+        # nodes holding the previous version will ask for the changes next
+        self._schemaDeltas[schema.appName] = {}
+        if previousVersion in schema.getRecordedVersions():
+            self._getSchemaDelta(schema, previousVersion)
+
+    def _getSchemaDelta(self, schema, fromVersion):
+        """
+        :return: The changes to an application's schema since a version,
+            named /<prefix>/<app>/_schema/_delta/<fromVersion>/<latest version>.
+            The content is the JSON from ApplicationSchema.getChangesSince,
+            signed with our certificate. If those changes can't be given, it
+            is {"from": fromVersion, "to": latest version, "schema": the name
+            of the signed _schema to fetch instead}, with only a digest
+            signature, so asking about arbitrary versions costs us no
+            signing.
+        :rtype: Data
+        """
+        deltas = self._schemaDeltas.setdefault(schema.appName, {})
+        response = deltas.get(fromVersion)
+        if response is not None:
+            return response
+
+        schemaName = Name(self.prefix).append(schema.appName).append("_schema")
+        response = Data(Name(schemaName).append(SCHEMA_DELTA_COMPONENT)
+            .appendVersion(fromVersion).appendVersion(schema.version))
+        response.getMetaInfo().setFreshnessPeriod(self._schemaDeltaFreshnessPeriod)
+        changes = schema.getChangesSince(fromVersion)
+        if changes is None:
+            response.setContent(json.dumps({"from": fromVersion,
+                "to": schema.version,
+                "schema": schemaName.appendVersion(schema.version).toUri()}))
+            self._keyChain.signWithSha256(response)
+            return response
+
+        response.setContent(json.dumps(changes))
+        self.signData(response)
+        # only recorded versions get here, so this holds maxHistory at most
+        deltas[fromVersion] = response
+        return response
 
-        ruleNode = validatorNode.createSubtree("rule")
-        ruleNode.createSubtree("id", dataPrefix.toUri())
-        ruleNode.createSubtree("for", "data")
-        
-        filterNode = ruleNode.createSubtree("filter")
-        filterNode.createSubtree("type", "name")
-        filterNode.createSubtree("name", dataPrefix.toUri())
-        filterNode.createSubtree("relation", "is-prefix-of")
+    def _handleSchemaDeltaRequest(self, interest, appName, versionComponent):
+        schema = self._applications[appName]
+        if schema.version == 0:
+            # not published yet
+            return
+        try:
+            fromVersion = versionComponent.toVersion()
+        except RuntimeError:
+            self.log.debug("Bad schema version in " + interest.getName().toUri())
+            return
+        self.sendData(self._getSchemaDelta(schema, fromVersion), False)
 
-        checkerNode = ruleNode.createSubtree("checker")
-        checkerNode.createSubtree("type", "customized")
-        checkerNode.createSubtree("sig-type", "rsa-sha256")
+    def _flushApplications(self, isStopping=False):
+        """
+        Write the files of the applications changed since the last flush, in
+        the background, and publish their new _schema versions.
+        :param boolean isStopping: (optional) Write the files before
+            returning, and don't publish
+        """
+        if self._schemaFlushHandle is not None:
+            self._schemaFlushHandle.cancel()
+            self._schemaFlushHandle = None
+        changedApplications = self._changedApplications
+        self._changedApplications = {}
+        for appName, publishNew in changedApplications.items():
+            schema = self._applications.get(appName)
+            if schema is None:
+                # replaced by loadApplications
+                continue
+            content = schema.encode()
+            if publishNew and not isStopping:
+                self._publishSchema(schema, content)
+            fileName = os.path.join(self._applicationDirectory, appName + ".conf")
+            if isStopping:
+                writeSchemaFile(fileName, content)
+                continue
+            if self._schemaWriter is None:
+                # one thread, so writes to a file happen in order
+                self._schemaWriter = ThreadPoolExecutor(1)
+            future = self.loop.run_in_executor(self._schemaWriter,
+                writeSchemaFile, fileName, content)
+            future.add_done_callback(
+                lambda future, fileName=fileName: self._onSchemaWritten(fileName, future))
+
+    def _onSchemaWritten(self, fileName, future):
+        if future.exception() is not None:
+            self.log.error("Could not write {}: {}".format(fileName, future.exception()))
 
-        keyLocatorNode = checkerNode.createSubtree("key-locator")
-        keyLocatorNode.createSubtree("type", "name")
-        # We don't put cert version in there
-        keyLocatorNode.createSubtree("name", certName.getPrefix(-1).toUri())
-        keyLocatorNode.createSubtree("relation", "equal")
-
-        if not os.path.exists(self._applicationDirectory):
-            os.makedirs(self._applicationDirectory)
-        self._applications[appName]["tree"].write(os.path.join(self._applicationDirectory, appName + ".conf"))
-        self._applications[appName]["dataPrefix"].append(dataPrefix.toUri())
-        self._applications[appName]["version"] = int(time.time())
-        if publishNew:
-            # TODO: ideally, this is the trust schema of the application, and does not necessarily carry controller prefix. 
-            # We make it carry controller prefix here so that prefix registration / route setup is easier (implementation workaround)
-            data = Data(Name(self.prefix).append(appName).append("_schema").appendVersion(self._applications[appName]["version"]))
-            data.setContent(str(self._applications[appName]["tree"].getRoot()))
-            self.signData(data)
-            self._memoryContentCache.add(data)
-        return True
-    
     # TODO: putting existing confs into memoryContentCache        
     def loadApplications(self, directory = None, override = False):
         if not directory:
@@ -578,19 +1333,18 @@ class IotController(BaseNode):
                     if appName in self._applications and not override:
                         print("loadApplications: " + appName + " already exists, do nothing for configuration file: " + fullFileName)
                     else:
-                        self._applications[appName] = {"tree": BoostInfoParser(), "dataPrefix": [], "version": int(time.time())}
-                        self._applications[appName]["tree"].read(fullFileName)
-                        data = Data(Name(self.prefix).append(appName).append("_schema").appendVersion(self._applications[appName]["version"]))
-                        data.setContent(str(self._applications[appName]["tree"].getRoot()))
-                        self.signData(data)
-                        self._memoryContentCache.add(data)
+                        tree = BoostInfoParser()
+                        tree.read(fullFileName)
                         try:
-                            validatorTree = self._applications[appName]["tree"]["validator"][0]
-                            for rule in validatorTree["rule"]:
-                                self._applications[appName]["dataPrefix"].append(rule["id"][0].value)
+                            schema = ApplicationSchema.fromTree(appName, tree)
                         # TODO: don't swallow any general exceptions, we want to catch only KeyError (make sure) here
                         except Exception as e:
                             print("loadApplications parse configuration file " + fullFileName + " : " + str(e))
+                            continue
+                        # the file is what we have in memory now
+                        self._changedApplications.pop(appName, None)
+                        self._applications[appName] = schema
+                        self._publishSchema(schema, str(tree.getRoot()))
 
         return
 
@@ -599,6 +1353,7 @@ if __name__ == '__main__':
     import sys
 
     nArgs = len(sys.argv) - 1
+    keyType = KeyType.RSA
     if nArgs == 0:
         from pyndn.util.boost_info_parser import BoostInfoParser
         fileName = os.path.expanduser('~/.ndn/iot_controller.conf')
@@ -607,6 +1362,10 @@ if __name__ == '__main__':
         config.read(fileName)
         deviceName = config["device/controllerName"][0].value
         networkName = config["device/environmentPrefix"][0].value
+        # optional: "rsa" (default) or "ecdsa"
+        keyTypeNodes = config["device/keyType"]
+        if len(keyTypeNodes) > 0 and keyTypeNodes[0].value.lower() == "ecdsa":
+            keyType = KeyType.EC
     elif nArgs == 2:
         networkName = sys.argv[1]
         deviceName = sys.argv[2]
@@ -616,5 +1375,5 @@ if __name__ == '__main__':
 
     deviceSuffix = Name(deviceName)
     networkPrefix = Name(networkName)
-    n = IotController(deviceSuffix, networkPrefix)
+    n = IotController(deviceSuffix, networkPrefix, keyType=keyType)
     n.start()
@@ -20,8 +20,15 @@ import logging
 import time
 import sys
 import os
+import json
+import random
 
-from pyndn import Name, Face, Interest, Data
+from hashlib import sha256
+
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from pyndn import Name, Face, Interest, Data, Exclude
 from pyndn.security import KeyChain
 from pyndn.security.identity import IdentityManager
 from pyndn.security.policy import ConfigPolicyManager
@@ -29,15 +36,18 @@ from pyndn.security.certificate import IdentityCertificate, PublicKey
 from pyndn.encoding import ProtobufTlv
 
 from base_node import BaseNode, Command
+from name_trie import NameTrie
+from capability_directory import decodeCompactListing, COMPACT_LISTING_COMPONENT
 
 from ndn_pi.commands import CertificateRequestMessage, UpdateCapabilitiesCommandMessage, DeviceConfigurationMessage
 from security.hmac_helper import HmacHelper
+from security.session_key import SessionKey, SessionKeyExchange, SESSION_COMPONENT
 
 from pyndn.util import Blob
 from pyndn.util.boost_info_parser import BoostInfoParser
 from pyndn.security.security_exception import SecurityException
 
-from base64 import b64encode
+from base64 import b64encode, b64decode
 
 default_prefix = Name('/home/configure')
 
@@ -46,6 +56,11 @@ try:
 except ImportError:
     import trollius as asyncio
 
+try:
+    ensure_future = asyncio.ensure_future
+except AttributeError:
+    ensure_future = getattr(asyncio, 'async')
+
 from pyndn.threadsafe_face import ThreadsafeFace
 
 class IotNode(BaseNode):
@@ -53,21 +68,60 @@ class IotNode(BaseNode):
     This class must be subclassed in order to provide commands or allow user interaction.
     Any setup tasks needed by the user may be place in __init__ or setupComplete as needed.
     """
-    def __init__(self, transport = None, conn = None):
+    def __init__(self, transport = None, conn = None, stateFilePath = ""):
         """
         Initialize the network and security settings for the node
-        :param str configFilename: The path to the configuration file generated by ndn-config
+        :param str stateFilePath: (optional) Where to save the network
+            configuration after pairing. Defaults to a file in ~/.ndn/iot
+            named after the node class.
         """
         super(IotNode, self).__init__(transport, conn)
         self.deviceSuffix = None
 
-        self._commands = []        
-        
+        # a paired node restarts from here instead of pairing again
+        if stateFilePath == "":
+            stateFilePath = os.path.expanduser(
+                    '~/.ndn/iot/{}.state'.format(self.__class__.__name__))
+        self._stateFilePath = stateFilePath
+
+        self._commands = []
+        # full command names -> Command, for dispatching incoming interests
+        self._commandTrie = NameTrie()
+        # what we tell the controller about our commands
+        self._encodedCapabilities = None
+        self._acknowledgedCapabilitiesDigest = None
+        # number of running handlers for each command suffix
+        self._commandsInFlight = defaultdict(int)
+
+        # blocking command handlers run here
+        self._commandWorkerCount = 4
+        self._commandExecutor = None
+
+        # node prefix -> SessionKey, for commands we send to other nodes
+        self._peerSessions = NameTrie()
+        self._pendingSessions = set()
+        self._sessionRotationFraction = 0.8
+
+        # keyword tuple -> state of a watchDeviceList call
+        self._directoryWatches = {}
+        self._directoryWatchLifetime = 30000
+
         self.deviceSerial = self.getSerial()
 
         self.prefix = Name(default_prefix).append(self.deviceSerial)
 
         self._certificateTimeouts = 0
+        # failed requests are retried after a randomized, doubling delay
+        self._baseRetryDelay = 1.0
+        self._maxRetryDelay = 300.0
+
+        # we renew our certificate this far into its validity period, give or
+        # take the jitter (also a fraction of the validity period), so devices
+        # commissioned together don't all renew at once
+        self._certificateRenewalFraction = 0.8
+        self._certificateRenewalJitter = 0.05
+        self._certificateRenewalHandle = None
+        self._certificateRenewalFailures = 0
 
         self._rootCertificate = None
 
@@ -81,11 +135,25 @@ class IotNode(BaseNode):
         
 
     def beforeLoopStart(self):
+        if self._restoreNodeState():
+            return
         print("Serial: {}\nConfiguration PIN: {}".format(self.deviceSerial, self._createNewPin()))
         # TODO: after PyNDN update, openloop publisher's registration would call onRegisterFailed; while nfd-status on the other side shows it's actually successful
         self.face.registerPrefix(self.prefix, 
             self._onConfigurationReceived, self.onRegisterFailed)
 
+    def stop(self):
+        """
+        Stops the node, taking it off the network
+        """
+        if self._commandExecutor is not None:
+            self._commandExecutor.shutdown(wait=False)
+            self._commandExecutor = None
+        if self._certificateRenewalHandle is not None:
+            self._certificateRenewalHandle.cancel()
+            self._certificateRenewalHandle = None
+        super(IotNode, self).stop()
+
 #####
 # Pre-configuration flow
 ####
@@ -145,7 +213,7 @@ class IotNode(BaseNode):
         try:
             defaultKey = self._identityStorage.getDefaultKeyNameForIdentity(keyIdentity)
         except SecurityException:
-            defaultKey = self._identityManager.generateRSAKeyPairAsDefault(keyIdentity)
+            defaultKey = self._generateKeyPairAsDefault(keyIdentity)
         
         self.log.debug("Key name: " + defaultKey.toUri())
 
@@ -176,9 +244,20 @@ class IotNode(BaseNode):
             self.log.critical("Trust root cannot be reached, exiting")
             self._isStopped = True
         else:
+            delay = self._getRetryDelay(self._certificateTimeouts)
             self._certificateTimeouts += 1
-            self.loop.call_soon(self._sendCertificateRequest, self._configureIdentity)
-        pass
+            self.loop.call_later(delay, self._sendCertificateRequest, self._configureIdentity)
+
+    def _getRetryDelay(self, attempt):
+        """
+        :param int attempt: The number of attempts that have failed so far
+        :return: Seconds to wait before trying again: doubling with each
+            failure up to a limit, and randomized so devices that failed
+            together don't retry together
+        :rtype: float
+        """
+        delay = min(self._maxRetryDelay, self._baseRetryDelay*2**attempt)
+        return random.uniform(delay/2, delay)
 
 
     def _processValidCertificate(self, data):
@@ -195,13 +274,15 @@ class IotNode(BaseNode):
             rootCertName = newCert.getSignature().getKeyLocator().getKeyName()
             # update trust rules so we trust the controller
             self._policyManager.setDeviceIdentity(self._configureIdentity) 
+            self._policyManager.setKeyType(
+                self._policyManager.getKeyTypeForSignature(newCert.getSignature()))
             self._policyManager.updateTrustRules()
 
             def onRootCertificateDownload(interest, data):
                 try:
                     # zhehao: the root cert is downloaded and installed without verifying; should the root cert be preconfigured?
                     # Insert root certificate so that we can verify newCert
-                    self._policyManager._certificateCache.insertCertificate(data)
+                    self._policyManager.pinCertificate(data)
 
                     # Set the root cert as default for root identity
                     try:
@@ -247,15 +328,26 @@ class IotNode(BaseNode):
         self._identityManager.setDefaultCertificateForKey(newCert)
 
         # unregister localhop prefix, register new prefix, change identity
+        self.face.removeRegisteredPrefix(self.tempPrefixId)
+        self._joinNetwork(capabilitiesDelay=5)
+        self._saveNodeState()
+        self._scheduleCertificateRenewal(newCert)
+
+    def _joinNetwork(self, capabilitiesDelay=0):
+        """
+        Take on our network identity and start answering commands.
+        :param float capabilitiesDelay: (optional) Seconds to wait before
+            sending our capabilities to the controller
+        """
         self.prefix = self._configureIdentity
         self._policyManager.setDeviceIdentity(self.prefix)
+        self.invalidateIdentityCache()
+        self._rebuildCommandTrie()
 
         self.face.setCommandCertificateName(self.getDefaultCertificateName())
-
-        self.face.removeRegisteredPrefix(self.tempPrefixId)
         self.face.registerPrefix(self.prefix, self._onCommandReceived, self.onRegisterFailed)
 
-        self.loop.call_later(5, self._updateCapabilities)
+        self.loop.call_later(capabilitiesDelay, self._updateCapabilities)
 
     def _certificateValidationFailed(self, data, reason):
         self.log.error("Certificate from controller is invalid: " + str(reason))
@@ -272,52 +364,284 @@ class IotNode(BaseNode):
 
 
 
+###
+# Node state
+# After pairing we save what we learned about the network, so a restarted
+# node can rejoin it without being paired again.
+###
+
+    def _saveNodeState(self):
+        """
+        Write the network configuration to the state file. The file is written
+        beside the old one and renamed over it, so a crash leaves one or the
+        other.
+        """
+        state = {'environmentPrefix': self._policyManager.getEnvironmentPrefix().toUri(),
+                'trustRoot': self._policyManager.getTrustRootIdentity().toUri(),
+                'deviceIdentity': self._configureIdentity.toUri(),
+                'deviceSuffix': self.deviceSuffix.toUri(),
+                'keyType': self._policyManager.getKeyType(),
+                'rootCertificate': b64encode(self._rootCertificate.wireEncode().toBytes())}
+        try:
+            directory = os.path.dirname(self._stateFilePath)
+            if directory and not os.path.exists(directory):
+                os.makedirs(directory)
+            tempPath = self._stateFilePath + '.tmp'
+            with open(tempPath, 'w') as stateFile:
+                json.dump(state, stateFile)
+                stateFile.flush()
+                os.fsync(stateFile.fileno())
+            os.rename(tempPath, self._stateFilePath)
+        except (IOError, OSError) as e:
+            self.log.error("Cannot write node state file: " + str(e))
+
+    def _restoreNodeState(self):
+        """
+        Rejoin the network described by the state file, if we still have a
+        certificate from its controller.
+        :return: Whether the node state was restored
+        :rtype: boolean
+        """
+        if not os.path.exists(self._stateFilePath):
+            return False
+        try:
+            with open(self._stateFilePath) as stateFile:
+                state = json.load(stateFile)
+            rootCertificate = IdentityCertificate()
+            rootCertificate.wireDecode(Blob(b64decode(state['rootCertificate']), False))
+            environmentPrefix = Name(state['environmentPrefix'])
+            trustRoot = Name(state['trustRoot'])
+            deviceIdentity = Name(state['deviceIdentity'])
+            deviceSuffix = Name(state['deviceSuffix'])
+            keyType = state['keyType']
+        except Exception as e:
+            self.log.warn("Ignoring unreadable node state file: " + str(e))
+            return False
+
+        self._policyManager.setEnvironmentPrefix(environmentPrefix)
+        self._policyManager.setTrustRootIdentity(trustRoot)
+        self._policyManager.setDeviceIdentity(deviceIdentity)
+        if not self._policyManager.hasRootSignedCertificate():
+            self.log.warn("No certificate for saved identity {}, pairing again".format(
+                    deviceIdentity.toUri()))
+            self._policyManager.removeTrustRules()
+            return False
+        self._policyManager.setKeyType(keyType)
+        self._policyManager.updateTrustRules()
+        self._policyManager.pinCertificate(rootCertificate)
+        self._rootCertificate = rootCertificate
+
+        self.deviceSuffix = deviceSuffix
+        self._configureIdentity = deviceIdentity
+        self.log.info("Restored node state for " + deviceIdentity.toUri())
+        self._joinNetwork()
+        self._scheduleCertificateRenewal(self.getDefaultCertificate())
+        return True
+
+###
+# Certificate renewal
+# Once we have a certificate, we ask the controller to renew it before it
+# expires, signing the request with the certificate itself.
+###
+
+    def setCertificateRenewal(self, fraction, jitter=0.05):
+        """
+        Choose when the device certificate is renewed. Takes effect from the
+        next certificate received.
+        :param float fraction: How far into the certificate's validity period
+            to renew it, e.g. 0.8
+        :param float jitter: (optional) The renewal time is moved randomly by
+            up to this fraction of the validity period either way
+        """
+        self._certificateRenewalFraction = fraction
+        self._certificateRenewalJitter = jitter
+
+    def _scheduleCertificateRenewal(self, certificate):
+        """
+        Schedule the renewal of a certificate we have just installed.
+        :param pyndn.security.certificate.IdentityCertificate certificate: Our
+            new default certificate
+        """
+        if self._certificateRenewalHandle is not None:
+            self._certificateRenewalHandle.cancel()
+        self._certificateRenewalFailures = 0
+
+        notBefore = certificate.getNotBefore()/1000.0
+        lifetime = certificate.getNotAfter()/1000.0 - notBefore
+        renewalPoint = self._certificateRenewalFraction + random.uniform(
+                -self._certificateRenewalJitter, self._certificateRenewalJitter)
+        renewalPoint = min(1.0, max(0.0, renewalPoint))
+        delay = max(0, notBefore + lifetime*renewalPoint - time.time())
+
+        self.log.info("Certificate renewal in {:.0f}s".format(delay))
+        self._certificateRenewalHandle = self.loop.call_later(delay,
+                self._sendCertificateRenewal)
+
+    def _sendCertificateRenewal(self):
+        """
+        Ask the controller for a new certificate for our current key, with a
+        command interest signed by our current certificate.
+        """
+        self._certificateRenewalHandle = None
+        keyName = self._identityStorage.getDefaultKeyNameForIdentity(self.prefix)
+
+        message = CertificateRequestMessage()
+        publicKey = self._identityManager.getPublicKey(keyName)
+        message.command.keyType = publicKey.getKeyType()
+        message.command.keyBits = publicKey.getKeyDer().toRawStr()
+        for component in range(keyName.size()):
+            message.command.keyName.components.append(keyName.get(component).toEscapedString())
+
+        interestName = Name(self._policyManager.getTrustRootIdentity()
+                ).append("certificateRenewal").append(ProtobufTlv.encode(message))
+        interest = Interest(interestName)
+        interest.setInterestLifetimeMilliseconds(10000)
+        self.face.makeCommandInterest(interest)
+
+        self.log.info("Sending certificate renewal to controller")
+        self.face.expressInterest(interest, self._onCertificateRenewalResponse,
+                self._onCertificateRenewalTimeout)
+
+    def _retryCertificateRenewal(self, delay=None):
+        """
+        :param float delay: (optional) Seconds to wait, instead of the usual
+            backoff for the number of failures so far
+        """
+        if delay is None:
+            delay = self._getRetryDelay(self._certificateRenewalFailures)
+        self._certificateRenewalFailures += 1
+        self.log.debug("Retrying certificate renewal in {:.0f}s".format(delay))
+        self._certificateRenewalHandle = self.loop.call_later(delay,
+                self._sendCertificateRenewal)
+
+    def _onCertificateRenewalTimeout(self, interest):
+        self.log.warn("Timed out trying to renew certificate")
+        self._retryCertificateRenewal()
+
+    def _onCertificateRenewalResponse(self, interest, data):
+        def onVerified(data):
+            content = data.getContent().toRawStr()
+            if content.startswith("Retry-After"):
+                # the controller is renewing other devices; come back in our
+                # own slot, plus a little more so we don't all arrive together
+                retryAfter = float(content.split()[1])
+                self.log.info("Controller deferred certificate renewal")
+                self._retryCertificateRenewal(retryAfter + random.uniform(0,
+                        self._baseRetryDelay))
+            elif content == "Denied":
+                self.log.error("Controller refused to renew our certificate")
+                self._retryCertificateRenewal()
+            else:
+                newCert = IdentityCertificate()
+                newCert.wireDecode(data.getContent())
+                self._keyChain.verifyData(newCert,
+                        self._onRenewedCertificateVerified, onFailed)
+
+        def onFailed(data, reason=None):
+            self.log.error("Renewed certificate is invalid: " + str(reason))
+            self._retryCertificateRenewal()
+
+        self._keyChain.verifyData(data, onVerified, onFailed)
+
+    def _onRenewedCertificateVerified(self, newCert):
+        try:
+            self._identityManager.addCertificate(newCert)
+        except SecurityException as e:
+            pass # can't tell existing certificate from another error
+        self._identityManager.setDefaultCertificateForKey(newCert)
+        self.invalidateIdentityCache()
+        self.face.setCommandCertificateName(self.getDefaultCertificateName())
+        self.log.info("Renewed certificate: " + newCert.getName().toUri())
+        self._scheduleCertificateRenewal(newCert)
+
 ###
 # Device capabilities
 # On startup, tell the controller what types of commands are available
 ##
 
-    def _onCapabilitiesAck(self, interest, data):
+    def _onCapabilitiesAck(self, interest, data, digest):
         self.log.debug('Received {}'.format(data.getName().toUri()))
+        # the controller has this list now, so just send digests
+        self._acknowledgedCapabilitiesDigest = digest
         if not self._setupComplete:
             self._setupComplete = True
             self.log.info('Setup complete')
+            # keep-alives to the controller are signed with a session key
+            self.establishSession(self._policyManager.getTrustRootIdentity())
             self.loop.call_soon(self.setupComplete, self._configureIdentity)
 
+    def _onCapabilitiesDigestAck(self, interest, data):
+        status = data.getContent().toRawStr()
+        self.log.debug('Received {} for capabilities digest'.format(status))
+        if status != 'unchanged':
+            # the controller does not have our current list
+            self._acknowledgedCapabilitiesDigest = None
+            self._sendCapabilities()
+
     def _onCapabilitiesTimeout(self, interest):
-        #try again in 30s
+        # the next periodic update will try again
         self.log.info('Timeout waiting for capabilities update')
-        self.loop.call_later(30, self._updateCapabilities)
 
-    def _updateCapabilities(self):
+    def _getEncodedCapabilities(self):
         """
-        Send the controller a list of our commands.
-        """ 
-        fullCommandName = Name(self._policyManager.getTrustRootIdentity()
-                ).append('updateCapabilities')
-        capabilitiesMessage = UpdateCapabilitiesCommandMessage()
+        :return: Our command list encoded for the controller, and its digest.
+            Both are cached until the command list or prefix changes.
+        :rtype: (pyndn.util.Blob, str)
+        """
+        if self._encodedCapabilities is None:
+            capabilitiesMessage = UpdateCapabilitiesCommandMessage()
 
-        for command in self._commands:
-            commandName = Name(self.prefix).append(Name(command.suffix))
-            capability = capabilitiesMessage.capabilities.add()
-            for i in range(commandName.size()):
-                capability.commandPrefix.components.append(
-                        str(commandName.get(i).getValue()))
+            for command in self._commands:
+                commandName = Name(self.prefix).append(Name(command.suffix))
+                capability = capabilitiesMessage.capabilities.add()
+                for i in range(commandName.size()):
+                    capability.commandPrefix.components.append(
+                            str(commandName.get(i).getValue()))
+
+                for kw in command.keywords:
+                    capability.keywords.append(kw)
 
-            for kw in command.keywords:
-                capability.keywords.append(kw)
+                capability.needsSignature = command.isSigned
 
-            capability.needsSignature = command.isSigned
+            encodedCapabilities = ProtobufTlv.encode(capabilitiesMessage)
+            digest = sha256(encodedCapabilities.toBytes()).digest()
+            self._encodedCapabilities = (encodedCapabilities, digest)
+        return self._encodedCapabilities
+
+    def _sendCapabilities(self):
+        """
+        Send the controller a list of our commands, or only its digest if the
+        controller already has the list.
+        """
+        encodedCapabilities, digest = self._getEncodedCapabilities()
+        if digest == self._acknowledgedCapabilitiesDigest:
+            interestName = Name(self._policyManager.getTrustRootIdentity()
+                    ).append('capabilitiesDigest').append(Blob(bytearray(digest), False))
+            interest = Interest(interestName)
+            interest.setInterestLifetimeMilliseconds(5000)
+            self.log.debug("Sending capabilities digest to controller")
+            self.expressSessionCommand(interest, self._onCapabilitiesDigestAck,
+                    self._onCapabilitiesTimeout)
+            return
 
-        encodedCapabilities = ProtobufTlv.encode(capabilitiesMessage)
+        fullCommandName = Name(self._policyManager.getTrustRootIdentity()
+                ).append('updateCapabilities')
         fullCommandName.append(encodedCapabilities)
         interest = Interest(fullCommandName)
         interest.setInterestLifetimeMilliseconds(5000)
         self.face.makeCommandInterest(interest)
-        signature = self._policyManager._extractSignature(interest)
+
+        def onCapabilitiesAck(interest, data):
+            self._onCapabilitiesAck(interest, data, digest)
 
         self.log.info("Sending capabilities to controller")
-        self.face.expressInterest(interest, self._onCapabilitiesAck, self._onCapabilitiesTimeout)
+        self.face.expressInterest(interest, onCapabilitiesAck, self._onCapabilitiesTimeout)
+
+    def _updateCapabilities(self):
+        """
+        Keep the controller up to date with our commands.
+        """ 
+        self._sendCapabilities()
 
         # update twice a minute
         self.loop.call_later(30, self._updateCapabilities)
@@ -334,13 +658,72 @@ class IotNode(BaseNode):
         print("Received invalid" + dataOrInterest.getName().toUri())
         self.log.info("Received invalid" + dataOrInterest.getName().toUri())
 
-    def _makeVerifiedCommandDispatch(self, function):
-        def onVerified(interest):
+    def _makeVerifiedCommandDispatch(self, command):
+        def onVerified(interest, session):
             self.log.info("Verified: " + interest.getName().toUri())
-            responseData = function(interest)
-            self.sendData(responseData)
+            self._dispatchCommand(command, interest, session)
         return onVerified
 
+    def _getCommandExecutor(self):
+        if self._commandExecutor is None:
+            self._commandExecutor = ThreadPoolExecutor(self._commandWorkerCount)
+        return self._commandExecutor
+
+    def _dispatchCommand(self, command, interest, session=None):
+        """
+        Run the handler for a command and send its response. Coroutine and
+        blocking handlers are scheduled, and their response is sent when they
+        finish, so they do not hold up the event loop.
+        If the command came in under a session key, the response is signed
+        with the same key.
+        """
+        if (command.maxConcurrent is not None and
+                self._commandsInFlight[command.suffix] >= command.maxConcurrent):
+            # let the interest time out, the requester may try again
+            self.log.warn("Too many pending {} commands, dropping {}".format(
+                command.suffix, interest.getName().toUri()))
+            return
+
+        if command.isBlocking:
+            future = self.loop.run_in_executor(self._getCommandExecutor(),
+                    command.function, interest)
+        else:
+            responseData = command.function(interest)
+            if not (asyncio.iscoroutine(responseData) or 
+                    isinstance(responseData, asyncio.Future)):
+                if responseData is not None:
+                    self._sendCommandResponse(responseData, session)
+                return
+            future = ensure_future(responseData)
+
+        self._commandsInFlight[command.suffix] += 1
+        def onHandlerDone(future):
+            self._onCommandHandlerDone(command, interest, future, session)
+        future.add_done_callback(onHandlerDone)
+
+    def _onCommandHandlerDone(self, command, interest, future, session):
+        self._commandsInFlight[command.suffix] -= 1
+        if future.cancelled():
+            return
+        if future.exception() is not None:
+            self.log.error("Handler for {} failed: {}".format(
+                interest.getName().toUri(), future.exception()))
+            return
+        responseData = future.result()
+        if responseData is not None:
+            self._sendCommandResponse(responseData, session)
+
+    def setCommandWorkerCount(self, count):
+        """
+        Set the number of threads available to blocking command handlers.
+        :param int count: The maximum number of blocking handlers that can run
+            at once, across all commands
+        """
+        self._commandWorkerCount = count
+        if self._commandExecutor is not None:
+            self._commandExecutor.shutdown(wait=False)
+            self._commandExecutor = None
+
     def unknownCommandResponse(self, interest):
         """
         Called when the node receives an interest where the handler is unknown or unimplemented.
@@ -373,34 +756,290 @@ class IotNode(BaseNode):
         # else we must look in our command list to see if this requires verification
         # we dispatch directly or after verification as necessary
 
-        # now we look for the first command that matches in our config
+        # now we look for the most specific command that matches the name
         self.log.debug("Received {}".format(interest.getName().toUri()))
-        
-        for command in self._commands:
-            fullCommandName = Name(self.prefix).append(Name(command.suffix))
-            if fullCommandName.match(interest.getName()):
-                dispatchFunc = command.function
-                
-                if not command.isSigned:
-                    responseData = dispatchFunc(interest)
-                    self.sendData(responseData)
-                else:
-                    try:
-                        self._keyChain.verifyInterest(interest, 
-                                self._makeVerifiedCommandDispatch(dispatchFunc),
-                                self.verificationFailed)
-                        return
-                    except Exception as e:
-                        self.log.exception("Exception while verifying command", exc_info=True)
-                        self.verificationFailed(interest)
-                        return
+
+        interestName = interest.getName()
+        if (interestName.size() > self.prefix.size() and 
+                interestName.get(self.prefix.size()).toEscapedString() == SESSION_COMPONENT):
+            self._onSessionRequest(interest)
+            return
+
+        command = self._commandTrie.longestPrefixMatch(interestName)
+        if command is not None:
+            if not command.isSigned:
+                self._dispatchCommand(command, interest)
+            else:
+                self._verifyCommandInterest(interest, 
+                        self._makeVerifiedCommandDispatch(command),
+                        self.verificationFailed)
+            return
         #if we get here, just let it timeout
         return
 
+###
+# Session keys
+# After verifying a peer's signature once, we agree an HMAC key with it so
+# later commands and responses are cheap to sign and verify. The answering
+# side is in BaseNode.
+##
+    def establishSession(self, nodePrefix, onEstablished=None):
+        """
+        Negotiate a session key with another node, so expressSessionCommand can
+        sign commands to it with HMAC instead of our certificate.
+        :param pyndn.Name nodePrefix: The prefix of the node
+        :param function onEstablished: (optional) Called with the node prefix
+            once the session key is ready
+        """
+        prefixUri = Name(nodePrefix).toUri()
+        if prefixUri in self._pendingSessions:
+            return
+        self._pendingSessions.add(prefixUri)
+
+        exchange = SessionKeyExchange()
+        interestName = Name(nodePrefix).append(SESSION_COMPONENT).append(
+                Blob(bytearray(exchange.getPublicBits()), False))
+        interest = Interest(interestName)
+        interest.setInterestLifetimeMilliseconds(5000)
+        self.face.makeCommandInterest(interest)
+
+        def onVerified(data):
+            self._pendingSessions.discard(prefixUri)
+            try:
+                info = json.loads(data.getContent().toRawStr())
+                keyName = Name(info['name'])
+                rawKey = exchange.deriveKey(b64decode(info['key']),
+                        keyName.get(-1).getValue().toRawStr())
+                session = SessionKey(keyName, rawKey, info['lifetime'])
+            except (ValueError, KeyError, TypeError):
+                self.log.warn("Malformed session response from " + prefixUri)
+                return
+            if not keyName.getPrefix(-2).equals(Name(nodePrefix)):
+                # a node may only give us keys for its own prefix
+                self.log.warn("Session key {} is not for {}".format(
+                        keyName.toUri(), prefixUri))
+                return
+            self._peerSessions.insert(Name(nodePrefix), session)
+            self.log.info("Established session key " + keyName.toUri())
+            if onEstablished is not None:
+                onEstablished(Name(nodePrefix))
+
+        def onVerifyFailed(data, reason=None):
+            self._pendingSessions.discard(prefixUri)
+            self.verificationFailed(data)
+
+        def onSessionData(interest, data):
+            self._keyChain.verifyData(data, onVerified, onVerifyFailed)
+
+        def onSessionTimeout(interest):
+            self._pendingSessions.discard(prefixUri)
+            self.log.info("Timed out establishing session with " + prefixUri)
+
+        self.face.expressInterest(interest, onSessionData, onSessionTimeout)
+
+    def expressSessionCommand(self, interest, onData, onTimeout):
+        """
+        Express a signed command. If we have a session key for the node it is
+        sent to, the interest is signed with it and the response is checked
+        against it before onData is called; otherwise the interest is signed
+        with our certificate. Keys are renegotiated as they near expiry.
+
+        The peer may have lost the session, e.g. by restarting, and it ignores
+        commands signed with a key it does not know. So if a session command
+        times out or its response does not verify, the session is dropped, the
+        command is sent again signed with our certificate, and a new session
+        is negotiated.
+        :param pyndn.Interest interest: The unsigned command interest
+        :param function onData: Called with the interest and verified response
+        :param function onTimeout: Called with the interest if it times out
+        """
+        session = self._peerSessions.longestPrefixMatch(interest.getName())
+        if session is not None and session.isExpired():
+            self._peerSessions.remove(session.keyName.getPrefix(-2))
+            session = None
+
+        if session is None:
+            self.face.makeCommandInterest(interest)
+            self.face.expressInterest(interest, onData, onTimeout)
+            return
+
+        nodePrefix = session.keyName.getPrefix(-2)
+        if session.needsRotation(self._sessionRotationFraction):
+            self.establishSession(nodePrefix)
+
+        unsignedName = Name(interest.getName())
+        session.signInterest(interest)
+
+        def onSessionFailed():
+            if self._peerSessions.find(nodePrefix) is session:
+                self.log.info("Dropping session key " + session.keyName.toUri())
+                self._peerSessions.remove(nodePrefix)
+                self.establishSession(nodePrefix)
+            retry = Interest(unsignedName)
+            retry.setInterestLifetimeMilliseconds(
+                    interest.getInterestLifetimeMilliseconds())
+            self.face.makeCommandInterest(retry)
+            self.face.expressInterest(retry, onData, onTimeout)
+
+        def onSessionData(interest, data):
+            if session.verifyData(data):
+                onData(interest, data)
+            else:
+                self.verificationFailed(data)
+                onSessionFailed()
+
+        def onSessionTimeout(interest):
+            onSessionFailed()
+
+        self.face.expressInterest(interest, onSessionData, onSessionTimeout)
+
+###
+# Directory
+# The controller publishes its listings as versioned segments:
+# /<controller>/listDevices/[<keyword>/...][_tlv/]<version>/<segment>
+##
+    def _makeListInterest(self, keywords, isCompact=False, knownVersion=None,
+            lifetime=5000):
+        listName = Name(self._policyManager.getTrustRootIdentity()).append('listDevices')
+        for keyword in keywords or []:
+            listName.append(keyword)
+        if isCompact:
+            listName.append(COMPACT_LISTING_COMPONENT)
+        interest = Interest(listName)
+        interest.setInterestLifetimeMilliseconds(lifetime)
+        interest.setMustBeFresh(True)
+        # the newest version sorts last; the suffix limit (version, segment
+        # and implicit digest) keeps out listings for more keywords
+        interest.setChildSelector(1)
+        interest.setMaxSuffixComponents(3)
+        if knownVersion is not None:
+            # only a newer version will do
+            exclude = Exclude()
+            exclude.appendAny()
+            exclude.appendComponent(knownVersion)
+            interest.setExclude(exclude)
+        return interest
+
+    def _fetchListing(self, interest, isCompact, onListing, onTimeout):
+        """
+        Fetch and reassemble every segment of the listing that answers the
+        interest.
+        :param boolean isCompact: Whether the interest asks for a
+            ListDevicesMessage instead of JSON
+        :param function onListing: Called with the listing and its version
+            component, or None if the controller does not version listings
+        :param function onTimeout: Called with the interest that timed out
+        """
+        listSize = interest.getName().size()
+        chunks = []
+        def onSegment(interest, data):
+            dataName = data.getName()
+            finalBlockId = data.getMetaInfo().getFinalBlockId()
+            version = None
+            if (dataName.size() == listSize + 2 and
+                    finalBlockId.getValue().size() > 0):
+                version = dataName.get(-2)
+                if dataName.get(-1).toSegment() == len(chunks):
+                    chunks.append(data.getContent().toRawStr())
+                if len(chunks) <= finalBlockId.toSegment():
+                    # ask for the next segment of this same version
+                    nextInterest = Interest(
+                            dataName.getPrefix(-1).appendSegment(len(chunks)))
+                    nextInterest.setInterestLifetimeMilliseconds(5000)
+                    self.face.expressInterest(nextInterest, onSegment, onTimeout)
+                    return
+            else:
+                # an unsegmented answer from an older controller
+                chunks.append(data.getContent().toRawStr())
+            try:
+                if isCompact and version is not None:
+                    deviceList = decodeCompactListing(''.join(chunks))
+                else:
+                    deviceList = json.loads(''.join(chunks))
+            except (ValueError, IndexError):
+                self.log.warn("Malformed directory listing " + dataName.toUri())
+                return
+            onListing(deviceList, version)
+
+        self.face.expressInterest(interest, onSegment, onTimeout)
+
+    def fetchDeviceList(self, onDeviceList, onTimeout=None, keywords=None,
+            isCompact=False):
+        """
+        Fetch the newest directory listing from the controller.
+        :param function onDeviceList: Called with the listing, a dict of
+            keyword -> list of {'signed', 'name'}
+        :param function onTimeout: (optional) Called with the interest that
+            timed out if the listing could not be fetched
+        :param list keywords: (optional) Only list commands under these
+            keywords instead of the whole directory
+        :param boolean isCompact: (optional) Transfer the listing as a
+            ListDevicesMessage, which is smaller than the default JSON
+        """
+        def onListing(deviceList, version):
+            onDeviceList(deviceList)
+
+        def onListTimeout(interest):
+            self.log.debug("Timed out fetching " + interest.getName().toUri())
+            if onTimeout is not None:
+                onTimeout(interest)
+
+        self._fetchListing(self._makeListInterest(keywords, isCompact),
+                isCompact, onListing, onListTimeout)
+
+    def watchDeviceList(self, onDeviceList, keywords=None, isCompact=False):
+        """
+        Follow a directory listing: onDeviceList is called with the current
+        listing, then again whenever it changes. Between changes an interest
+        for the next version waits at the controller, and is expressed again
+        when it expires.
+        :param function onDeviceList: Called with each version of the
+            listing, a dict of keyword -> list of {'signed', 'name'}
+        :param list keywords: (optional) Only list commands under these
+            keywords instead of the whole directory
+        :param boolean isCompact: (optional) Transfer the listing as a
+            ListDevicesMessage, which is smaller than the default JSON
+        """
+        watchKey = tuple(keywords or [])
+        watch = {'callback': onDeviceList, 'version': None}
+        self._directoryWatches[watchKey] = watch
+
+        def expressNext():
+            if self._directoryWatches.get(watchKey) is not watch:
+                # stopped, or replaced by another watch
+                return
+            interest = self._makeListInterest(keywords, isCompact,
+                    watch['version'], self._directoryWatchLifetime)
+            self._fetchListing(interest, isCompact, onListing, onWatchTimeout)
+
+        def onListing(deviceList, version):
+            if self._directoryWatches.get(watchKey) is not watch:
+                return
+            watch['version'] = version
+            onDeviceList(deviceList)
+            if version is None:
+                # the controller can't hold the interest for us, so poll
+                self.loop.call_later(5, expressNext)
+            else:
+                expressNext()
+
+        def onWatchTimeout(interest):
+            expressNext()
+
+        expressNext()
+
+    def unwatchDeviceList(self, keywords=None):
+        """
+        Stop following a listing started with watchDeviceList.
+        :param list keywords: (optional) The keywords the watch was started with
+        """
+        self._directoryWatches.pop(tuple(keywords or []), None)
+
 #####
 # Setup methods
 ####
-    def addCommand(self, suffix, dispatchFunc, keywords=[], isSigned=True):
+    def addCommand(self, suffix, dispatchFunc, keywords=[], isSigned=True,
+            isBlocking=False, maxConcurrent=None):
         """
         Install a command. When an interest is expressed for 
         /<node prefix>/<suffix>, dispatchFunc will be called with the interest
@@ -414,14 +1053,24 @@ class IotNode(BaseNode):
         
         :param function dispatchFunc: A function that is called when the 
             command is received. It must take an Interest argument and return a 
-            Data object or None.
+            Data object or None. It may also be a coroutine function, in which
+            case the Data it finally returns is sent.
 
         :param boolean isSigned: Whether the command must be signed. If this is
             True and an unsigned command is received, it will be immediately
             rejected, and dispatchFunc will not be called.
+
+        :param boolean isBlocking: (optional, default=False) Whether dispatchFunc
+            may block, e.g. on I/O or subprocesses. Blocking handlers are run in
+            a thread pool instead of on the event loop.
+
+        :param int maxConcurrent: (optional) The maximum number of handlers for
+            this command that may be pending at once. Interests that arrive
+            when the limit is reached are dropped. Only applies to coroutine and
+            blocking handlers.
         """
         if (suffix.size() == 0):
-            raise RuntimError("Command suffix is empty")
+            raise RuntimeError("Command suffix is empty")
         suffixUri = suffix.toUri()
 
         for command in self._commands:
@@ -429,9 +1078,12 @@ class IotNode(BaseNode):
                 raise RuntimeError("Command is already registered")
 
         newCommand = Command(suffix=suffixUri, function=dispatchFunc, 
-                keywords=tuple(keywords), isSigned=isSigned)
+                keywords=tuple(keywords), isSigned=isSigned,
+                isBlocking=isBlocking, maxConcurrent=maxConcurrent)
 
         self._commands.append(newCommand)
+        self._commandTrie.insert(Name(self.prefix).append(suffix), newCommand)
+        self._encodedCapabilities = None
 
     def removeCommand(self, suffix):
         """
@@ -439,7 +1091,7 @@ class IotNode(BaseNode):
 
         :param Name suffix: The command name. 
         """
-        suffixUri = suffix.ToUri()
+        suffixUri = suffix.toUri()
         toRemove = None
         for command in self._commands:
             if (suffixUri == command.suffix):
@@ -447,6 +1099,19 @@ class IotNode(BaseNode):
                 break
         if toRemove is not None:
             self._commands.remove(toRemove)
+            self._commandTrie.remove(Name(self.prefix).append(suffix))
+            self._encodedCapabilities = None
+
+    def _rebuildCommandTrie(self):
+        """
+        Recompile the command dispatch trie. Must be called whenever the node
+        prefix changes, as the trie is keyed on full command names.
+        """
+        self._encodedCapabilities = None
+        self._commandTrie.clear()
+        for command in self._commands:
+            self._commandTrie.insert(Name(self.prefix).append(Name(command.suffix)),
+                    command)
 
 
     def setupComplete(self, deviceIdentity):
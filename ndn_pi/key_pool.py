@@ -0,0 +1,152 @@
+# -*- Mode:python; c-file-style:"gnu"; indent-tabs-mode:nil -*- */
+#
+# Copyright (C) 2016 Regents of the University of California.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+# A copy of the GNU General Public License is in the file COPYING.
+
+import os
+import stat
+import logging
+from base64 import b64encode, b64decode
+from binascii import hexlify
+
+from pyndn.security import KeyType, RsaKeyParams, EcKeyParams
+from pyndn.security.tpm.tpm_private_key import TpmPrivateKey
+
+from concurrent.futures import ProcessPoolExecutor
+
+def _generateKeyFiles(directory, keyType):
+    """
+    Runs in the key pool's process: generate a key pair of the given type and
+    save it in the pool directory. The public key is written first and the
+    private key renamed into place last, so a key is ready once its .pri file
+    exists.
+    :return: The file name of the new key, without extension
+    :rtype: str
+    """
+    try:
+        # key generation should not slow down the node itself
+        os.nice(10)
+    except OSError:
+        pass
+    if keyType == KeyType.EC:
+        params = EcKeyParams()
+    else:
+        params = RsaKeyParams()
+    privateKey = TpmPrivateKey.generatePrivateKey(params)
+    privateKeyDer = privateKey.toPkcs8().toBytes()
+    publicKeyDer = privateKey.derivePublicKey().toBytes()
+
+    baseName = "{}-{}".format(keyType, hexlify(os.urandom(8)))
+    basePath = os.path.join(directory, baseName)
+    with open(basePath + ".pub", "w") as keyFile:
+        keyFile.write(b64encode(publicKeyDer))
+    with open(basePath + ".pri.tmp", "w") as keyFile:
+        keyFile.write(b64encode(privateKeyDer))
+    os.chmod(basePath + ".pri.tmp", stat.S_IRUSR)
+    os.rename(basePath + ".pri.tmp", basePath + ".pri")
+    return baseName
+
+class KeyPool(object):
+    """
+    Key pairs generated ahead of time in a background process, so that
+    pairing doesn't wait seconds for an RSA key on slow hardware. The keys
+    are kept in a directory, so keys generated while one node program is
+    idle can be used by the next program to start.
+    """
+    def __init__(self, size=2, keyType=KeyType.RSA, directory=""):
+        """
+        :param int size: (optional) The number of keys to keep ready
+        :param int keyType: (optional) The pyndn.security.KeyType of the keys
+        :param str directory: (optional) Where to keep the keys. Defaults to
+            ~/.ndn/iot/keypool
+        """
+        super(KeyPool, self).__init__()
+        if directory == "":
+            directory = os.path.expanduser('~/.ndn/iot/keypool')
+        if not os.path.exists(directory):
+            os.makedirs(directory, 0o700)
+        self.directory = directory
+        self.size = size
+        self.keyType = keyType
+        self._executor = None
+        self._pending = []
+        self.log = logging.getLogger(str(self.__class__))
+
+    def _readyKeys(self):
+        """
+        :return: The file names (without extension) of the keys ready to use
+        :rtype: list of str
+        """
+        prefix = "{}-".format(self.keyType)
+        return sorted(fileName[:-len(".pri")] for fileName in os.listdir(self.directory)
+                if fileName.startswith(prefix) and fileName.endswith(".pri"))
+
+    def getReadyCount(self):
+        """
+        :return: The number of keys that can be taken right away
+        :rtype: int
+        """
+        return len(self._readyKeys())
+
+    def refill(self):
+        """
+        Start generating keys in the background until size keys are ready or
+        being generated. Returns at once.
+        """
+        self._pending = [future for future in self._pending if not future.done()]
+        missing = self.size - self.getReadyCount() - len(self._pending)
+        if missing <= 0:
+            return
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(1)
+        self.log.debug("Generating {} keys for the pool".format(missing))
+        for i in range(missing):
+            self._pending.append(self._executor.submit(_generateKeyFiles,
+                    self.directory, self.keyType))
+
+    def take(self):
+        """
+        Remove a ready key pair from the pool.
+        :return: The DER encoded public key and PKCS #8 private key, or None
+            if no key is ready
+        :rtype: (str, str)
+        """
+        for baseName in self._readyKeys():
+            basePath = os.path.join(self.directory, baseName)
+            try:
+                with open(basePath + ".pub") as keyFile:
+                    publicKeyDer = b64decode(keyFile.read())
+                with open(basePath + ".pri") as keyFile:
+                    privateKeyDer = b64decode(keyFile.read())
+                # whoever removes the private key first owns the pair
+                os.remove(basePath + ".pri")
+            except (IOError, OSError):
+                continue
+            try:
+                os.remove(basePath + ".pub")
+            except OSError:
+                pass
+            return publicKeyDer, privateKeyDer
+        return None
+
+    def shutdown(self):
+        """
+        Stop generating keys. Keys already generated stay in the pool.
+        """
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+        self._pending = []
@@ -0,0 +1,140 @@
+# -*- Mode:python; c-file-style:"gnu"; indent-tabs-mode:nil -*- */
+#
+# Copyright (C) 2016 Regents of the University of California.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+# A copy of the GNU General Public License is in the file COPYING.
+
+class NameTrie(object):
+    """
+    A name-component trie mapping NDN names to values. Lookups walk the
+    components of the queried name, so their cost depends on the depth of
+    the name and not on the number of entries stored.
+    """
+    class _Node(object):
+        __slots__ = ('children', 'value', 'hasValue')
+
+        def __init__(self):
+            self.children = {}
+            self.value = None
+            self.hasValue = False
+
+    def __init__(self):
+        super(NameTrie, self).__init__()
+        self._root = NameTrie._Node()
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def clear(self):
+        """
+        Remove all entries from the trie.
+        """
+        self._root = NameTrie._Node()
+        self._size = 0
+
+    def insert(self, name, value):
+        """
+        Store a value under a name, replacing any value already stored there.
+        :param pyndn.Name name: The name to store the value under
+        :param value: The value to store
+        """
+        node = self._root
+        for i in range(name.size()):
+            component = name.get(i)
+            child = node.children.get(component)
+            if child is None:
+                child = NameTrie._Node()
+                node.children[component] = child
+            node = child
+        if not node.hasValue:
+            self._size += 1
+        node.value = value
+        node.hasValue = True
+
+    def remove(self, name):
+        """
+        Remove the value stored under a name. Does nothing if there is none.
+        :param pyndn.Name name: The name to remove
+        :return: The value that was removed, or None
+        """
+        path = [self._root]
+        node = self._root
+        for i in range(name.size()):
+            node = node.children.get(name.get(i))
+            if node is None:
+                return None
+            path.append(node)
+        if not node.hasValue:
+            return None
+
+        value = node.value
+        node.value = None
+        node.hasValue = False
+        self._size -= 1
+
+        # prune branches that no longer lead to any value
+        for i in range(name.size(), 0, -1):
+            child = path[i]
+            if child.hasValue or len(child.children) > 0:
+                break
+            del path[i-1].children[name.get(i-1)]
+        return value
+
+    def find(self, name):
+        """
+        :param pyndn.Name name: The exact name to look up
+        :return: The value stored under the name, or None
+        """
+        node = self._root
+        for i in range(name.size()):
+            node = node.children.get(name.get(i))
+            if node is None:
+                return None
+        return node.value
+
+    def longestPrefixMatch(self, name):
+        """
+        Find the value stored under the longest name that is a prefix of (or
+        equal to) the given name.
+        :param pyndn.Name name: The name to match, e.g. an interest name
+        :return: The matching value, or None if no stored name is a prefix
+        """
+        node = self._root
+        match = node.value if node.hasValue else None
+        for i in range(name.size()):
+            node = node.children.get(name.get(i))
+            if node is None:
+                break
+            if node.hasValue:
+                match = node.value
+        return match
+
+    def prefixMatches(self, name):
+        """
+        Find the values stored under every prefix of the given name.
+        :param pyndn.Name name: The name to match
+        :return: The matching values, shortest prefix first
+        :rtype: list
+        """
+        node = self._root
+        matches = [node.value] if node.hasValue else []
+        for i in range(name.size()):
+            node = node.children.get(name.get(i))
+            if node is None:
+                break
+            if node.hasValue:
+                matches.append(node.value)
+        return matches
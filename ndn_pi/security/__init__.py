@@ -1,5 +1,8 @@
-__all__ = ['iot_policy_manager', 'hmac_helper']
+__all__ = ['iot_policy_manager', 'hmac_helper', 'session_key', 'lru_certificate_cache', 'trust_rule_matcher']
 
 from iot_policy_manager import IotPolicyManager
 from hmac_helper import HmacHelper
+from session_key import SessionKey, SessionKeyExchange, SessionKeyStore
+from lru_certificate_cache import LruCertificateCache
+from trust_rule_matcher import TrustRuleMatcher
 
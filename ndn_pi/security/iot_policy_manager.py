@@ -21,15 +21,19 @@
 import sys
 
 from pyndn.security.policy import ConfigPolicyManager
-from pyndn import Name
+from pyndn import Name, Interest, Sha256WithEcdsaSignature
+from pyndn.security import KeyType
 
 from pyndn.security.security_exception import SecurityException
 from pyndn.util.boost_info_parser import BoostInfoParser, BoostInfoTree
 
-from pyndn.security.policy.certificate_cache import CertificateCache
 from pyndn.util import Blob
 
+from lru_certificate_cache import LruCertificateCache
+from trust_rule_matcher import TrustRuleMatcher
+
 import os
+import threading
 from base64 import b64encode
 
 """
@@ -45,31 +49,83 @@ There is a root name and public key which must be the top authority in the envir
 for the certificate to be trusted. 
 """
 
+# the parsed .default.conf, shared by every IotPolicyManager in the process
+_configTemplate = None
+_configTemplateLock = threading.Lock()
+
+def _getConfigTemplate():
+    """
+    :return: The validator template, parsed on first use. It must not be
+        modified; policy managers edit their own clone.
+    :rtype: pyndn.util.boost_info_parser.BoostInfoParser
+    """
+    global _configTemplate
+    with _configTemplateLock:
+        if _configTemplate is None:
+            # TODO: use environment variable for this, fall back to default
+            templateFilename = os.path.join(os.path.dirname(__file__), '.default.conf')
+            template = BoostInfoParser()
+            template.read(templateFilename)
+            _configTemplate = template
+    return _configTemplate
+
 class IotPolicyManager(ConfigPolicyManager):
-    def __init__(self, identityStorage, configFilename=None):
+    def __init__(self, identityStorage, configFilename=None, maxCachedCertificates=256):
         """
         :param pyndn.IdentityStorage: A class that stores signing identities and certificates.
         :param str configFilename: A configuration file specifying validation rules and network
             name settings.
+        :param int maxCachedCertificates: (optional) The number of certificates
+            kept in memory, besides pinned ones. Others are looked up in the
+            identity storage.
         """
-
         # use the default configuration where possible
-        # TODO: use environment variable for this, fall back to default
-        path = os.path.dirname(__file__)
-        templateFilename = os.path.join(path, '.default.conf')
-        self._configTemplate = BoostInfoParser()
-        self._configTemplate.read(templateFilename)
+        self._configTemplate = _getConfigTemplate()
 
-        if configFilename is None:
-            configFilename = templateFilename
-        
-        certificateCache = CertificateCache()
+        # incremented whenever the validator rules change, so anything
+        # derived from them can tell it is out of date
+        self._trustRulesVersion = 0
+        # our clone of the template's validator, edited by updateTrustRules
+        self._validatorTree = None
+        # the validator rules compiled for lookup; rebuilt when they change
+        self._ruleMatcher = None
+
+        certificateCache = LruCertificateCache(maxCachedCertificates, identityStorage)
         super(IotPolicyManager, self).__init__(configFilename, certificateCache)
         self._identityStorage = identityStorage
+        if configFilename is None:
+            # the same as loading the template file, without parsing it again
+            self._installValidatorTemplate()
+
+        # verifications that found the signer's certificate already verified
+        # and cached, and those that had to fetch it
+        self._fetchesAvoided = 0
+        self._certificateFetches = 0
 
         self.setEnvironmentPrefix(None)
         self.setTrustRootIdentity(None)
         self.setDeviceIdentity(None)
+        self.setKeyType(KeyType.RSA)
+
+    def _installValidatorTemplate(self):
+        """
+        Replace the validator rules with a clone of the template's.
+        """
+        self._validatorTree = self._configTemplate["validator"][0].clone()
+        self.config._root.subtrees["validator"] = [self._validatorTree]
+        self._onTrustRulesChanged()
+
+    def _onTrustRulesChanged(self):
+        self._trustRulesVersion += 1
+        self._certificateCache.setTrustRulesVersion(self._trustRulesVersion)
+
+    def getTrustRulesVersion(self):
+        """
+        :return: A counter incremented whenever the validator rules change.
+            Caches of verification results should be dropped when it changes.
+        :rtype: int
+        """
+        return self._trustRulesVersion
 
     def updateTrustRules(self):
         """
@@ -79,30 +135,44 @@ class IotPolicyManager(ConfigPolicyManager):
         Not called automatically in case they are all changing (typical for
         bootstrapping).
 
-        Resets the validation rules if we don't have a trust root or environment
-
-        """
-        validatorTree = self._configTemplate["validator"][0].clone()
-        
-        if (self._environmentPrefix.size() > 0 and 
-            self._trustRootIdentity.size() > 0 and 
-            self._deviceIdentity.size() > 0):
-            # don't sneak in a bad identity
-            if not self._environmentPrefix.match(self._deviceIdentity):
-                raise SecurityException("Device identity does not belong to configured network!")
-            
-            environmentUri = self._environmentPrefix.toUri()
-            deviceUri = self._deviceIdentity.toUri()
-            
-            for rule in validatorTree["rule"]:
-                ruleId = rule["id"][0].value
-                if ruleId == 'Certificate Trust':
-                    #modify the 'Certificate Trust' rule
-                    rule["checker/key-locator/name"][0].value = environmentUri
-                elif ruleId == 'Command Interests':
-                    rule["filter/name"][0].value = deviceUri
-                    rule["checker/key-locator/name"][0].value = environmentUri
-        
+        Resets the validation rules if we don't have a trust root or environment.
+        The rules are edited in place and the trust rules version incremented.
+        """
+        isConfigured = (self._environmentPrefix.size() > 0 and
+            self._trustRootIdentity.size() > 0 and
+            self._deviceIdentity.size() > 0)
+        # don't sneak in a bad identity
+        if isConfigured and not self._environmentPrefix.match(self._deviceIdentity):
+            raise SecurityException("Device identity does not belong to configured network!")
+
+        if self._validatorTree is None:
+            # e.g. a configuration file was loaded
+            self._installValidatorTemplate()
+        validatorTree = self._validatorTree
+
+        signatureType = self.getSignatureTypeForKeyType(self._keyType)
+        for checker in validatorTree["rule/checker"]:
+            for sigTypeNode in checker["sig-type"]:
+                sigTypeNode.value = signatureType
+
+        templateRules = self._configTemplate["validator"][0]["rule"]
+        for rule, templateRule in zip(validatorTree["rule"], templateRules):
+            ruleId = rule["id"][0].value
+            if ruleId == 'Certificate Trust':
+                #modify the 'Certificate Trust' rule
+                locatorUri = templateRule["checker/key-locator/name"][0].value
+                if isConfigured:
+                    locatorUri = self._environmentPrefix.toUri()
+                rule["checker/key-locator/name"][0].value = locatorUri
+            elif ruleId == 'Command Interests':
+                filterUri = templateRule["filter/name"][0].value
+                locatorUri = templateRule["checker/key-locator/name"][0].value
+                if isConfigured:
+                    filterUri = self._deviceIdentity.toUri()
+                    locatorUri = self._environmentPrefix.toUri()
+                rule["filter/name"][0].value = filterUri
+                rule["checker/key-locator/name"][0].value = locatorUri
+
         #debug for adding trust anchor
         # try:
         #     validatorTree["trust-anchor"][0]["type"][0].value = "base64"
@@ -117,10 +187,102 @@ class IotPolicyManager(ConfigPolicyManager):
         #     treeNode.createSubtree("file-name", "/home/zhehao/.ndn/.iot.root.cert")
         # self._loadTrustAnchorCertificates()
 
-        #remove old validation rules from config
-        # replace with new validator rules
-        self.config._root.subtrees["validator"] = [validatorTree]
+        self._onTrustRulesChanged()
 
+    def reset(self):
+        """
+        Reset the configuration, as ConfigPolicyManager.reset. Also called
+        when a new configuration is loaded.
+        """
+        super(IotPolicyManager, self).reset()
+        self._validatorTree = None
+        self._onTrustRulesChanged()
+
+    def _findMatchingRule(self, objName, matchType):
+        """
+        Find the first validator rule matching a name, using the rules
+        compiled into a TrustRuleMatcher instead of testing each rule.
+        """
+        if (self._ruleMatcher is None or
+                self._ruleMatcher.trustRulesVersion != self._trustRulesVersion):
+            self._ruleMatcher = TrustRuleMatcher(self.config["validator/rule"],
+                    self._trustRulesVersion)
+        return self._ruleMatcher.findMatchingRule(objName, matchType)
+
+    def _getCertificateInterest(self, stepCount, matchType, objectName,
+            signature, failureReason):
+        """
+        Find the signer's certificate as ConfigPolicyManager does, but before
+        fetching it, try the certificate in our identity storage, verified
+        under the current trust rules.
+        Also count whether the signer's certificate has to be fetched before
+        a packet can be verified. Only the packet itself is counted, not the
+        certificates in its chain, and a signer whose certificate is pinned
+        or a trust anchor would never have been fetched, so is not counted.
+        """
+        certificateCache = self._certificateCache
+        certificateCache.lastLookupSource = None
+        certificateInterest = super(IotPolicyManager, self)._getCertificateInterest(
+                stepCount, matchType, objectName, signature, failureReason)
+        isFetchAvoided = (certificateCache.lastLookupSource ==
+                LruCertificateCache.CACHED)
+        if (certificateInterest is not None and
+                certificateInterest.getName().size() > 0 and
+                self._verifyStoredCertificate(certificateInterest.getName(), stepCount)):
+            certificateInterest = Interest()
+            isFetchAvoided = True
+        if certificateInterest is not None and stepCount == 0:
+            if certificateInterest.getName().size() > 0:
+                self._certificateFetches += 1
+            elif isFetchAvoided:
+                self._fetchesAvoided += 1
+        return certificateInterest
+
+    def _verifyStoredCertificate(self, certificateName, stepCount):
+        """
+        Verify a certificate from the identity storage as if it had been
+        fetched, and cache it if it passes. Its signer must already be cached,
+        or itself be verified from storage.
+        :param Name certificateName: The certificate's name, without version
+        :param int stepCount: The verification step that needs the certificate
+        :return: True if the certificate is now in the cache
+        :rtype: boolean
+        """
+        certificate = self._certificateCache.getStoredCertificate(certificateName)
+        if certificate is None:
+            return False
+        failureReason = ["unknown"]
+        signerInterest = self._getCertificateInterest(stepCount + 1, "data",
+                certificate.getName(), certificate.getSignature(), failureReason)
+        if signerInterest is None or signerInterest.getName().size() > 0:
+            return False
+        if not self._verify(certificate.getSignature(), certificate.wireEncode(),
+                failureReason):
+            return False
+        self._certificateCache.insertCertificate(certificate)
+        return True
+
+    def pinCertificate(self, certificate):
+        """
+        Cache a certificate that must never be evicted, such as the trust root's.
+        :param pyndn.security.certificate.IdentityCertificate certificate:
+            The certificate to pin
+        """
+        self._certificateCache.pinCertificate(certificate)
+
+    def getCertificateCacheStatus(self):
+        """
+        :return: The size and hit, miss and eviction counts of the certificate
+            cache, as from LruCertificateCache.getStatus, plus how many
+            verifications found the signer's certificate cached or verified
+            it from the identity storage ('fetchesAvoided'), and how many had
+            to fetch it ('fetches'). Pinned certificates count as neither.
+        :rtype: dict
+        """
+        status = self._certificateCache.getStatus()
+        status['fetchesAvoided'] = self._fetchesAvoided
+        status['fetches'] = self._certificateFetches
+        return status
 
     def inferSigningIdentity(self, fromName):
         """
@@ -159,6 +321,46 @@ class IotPolicyManager(ConfigPolicyManager):
     def getDeviceIdentity(self):
         return self._deviceIdentity
 
+    def setKeyType(self, keyType):
+        """
+        :param int keyType: The pyndn.security.KeyType of the keys used in the
+            network, which decides the signature type the trust rules expect.
+            Takes effect on the next updateTrustRules.
+        """
+        self.getSignatureTypeForKeyType(keyType)
+        self._keyType = keyType
+
+    def getKeyType(self):
+        """
+        :return: The pyndn.security.KeyType of the keys used in the network
+        :rtype: int
+        """
+        return self._keyType
+
+    @staticmethod
+    def getSignatureTypeForKeyType(keyType):
+        """
+        :param int keyType: KeyType.RSA or KeyType.EC
+        :return: The validator sig-type for signatures made with this type of key
+        :rtype: str
+        """
+        if keyType == KeyType.RSA:
+            return "rsa-sha256"
+        elif keyType == KeyType.EC:
+            return "ecdsa-sha256"
+        raise SecurityException("Unsupported key type: " + str(keyType))
+
+    @staticmethod
+    def getKeyTypeForSignature(signature):
+        """
+        :param pyndn.Signature signature: A signature from a Data or Interest
+        :return: The pyndn.security.KeyType of the key that made the signature
+        :rtype: int
+        """
+        if isinstance(signature, Sha256WithEcdsaSignature):
+            return KeyType.EC
+        return KeyType.RSA
+
     def setDeviceIdentity(self, identity):
         self._deviceIdentity = Name(identity)
 
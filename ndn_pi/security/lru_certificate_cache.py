@@ -0,0 +1,216 @@
+# -*- Mode:python; c-file-style:"gnu"; indent-tabs-mode:nil -*- */
+#
+# Copyright (C) 2016 Regents of the University of California.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+# A copy of the GNU General Public License is in the file COPYING.
+
+from pyndn.security.certificate import IdentityCertificate
+from pyndn.security.policy.certificate_cache import CertificateCache
+
+from collections import OrderedDict
+import time
+
+class LruCertificateCache(CertificateCache):
+    """
+    A CertificateCache holding at most maxSize certificates, evicting the
+    least recently used. Pinned certificates (e.g. the trust root) are never
+    evicted. Certificates in the identity storage, which keeps every
+    certificate we have stored however old, can be looked up with
+    getStoredCertificate; they are not verified, so getCertificate does not
+    return them until the policy manager has verified and inserted them.
+
+    The policy manager only inserts certificates it has verified, so they are
+    kept decoded, and a later packet from the same signer needs only its own
+    signature checked. A certificate is dropped once its validity period is
+    over, or if it was verified under trust rules that have since changed, so
+    it has to be fetched and verified again.
+
+    As in CertificateCache, certificate names are given without their version.
+    """
+    # values of lastLookupSource
+    PINNED = 'pinned'
+    CACHED = 'cached'
+
+    def __init__(self, maxSize=256, identityStorage=None):
+        """
+        :param int maxSize: (optional) The number of unpinned certificates
+            to keep
+        :param pyndn.security.identity.IdentityStorage identityStorage:
+            (optional) Where to look for certificates that are not cached
+        """
+        super(LruCertificateCache, self).__init__()
+        self._maxSize = maxSize
+        self._identityStorage = identityStorage
+        # certificate URI -> (IdentityCertificate, trust rules version it was
+        # inserted under), least recently used first
+        self._cache = OrderedDict()
+        self._trustRulesVersion = 0
+        # where the last getCertificate found its certificate: PINNED, CACHED,
+        # or None if it was not found
+        self.lastLookupSource = None
+        self._pinned = {}
+        self._hits = 0
+        self._misses = 0
+        self._storageHits = 0
+        self._evictions = 0
+        self._expirations = 0
+
+    def insertCertificate(self, certificate):
+        """
+        Insert the certificate into the cache, evicting the least recently
+        used certificate if the cache is full.
+        :param IdentityCertificate certificate: The certificate to insert.
+        """
+        certificate = IdentityCertificate(certificate)
+        certUri = certificate.getName()[:-1].toUri()
+        if certUri in self._pinned:
+            self._pinned[certUri] = certificate
+            return
+        self._cache.pop(certUri, None)
+        self._cache[certUri] = (certificate, self._trustRulesVersion)
+        while len(self._cache) > self._maxSize:
+            self._cache.popitem(last=False)
+            self._evictions += 1
+
+    def pinCertificate(self, certificate):
+        """
+        Insert a certificate that is never evicted, and does not count
+        towards maxSize.
+        :param IdentityCertificate certificate: The certificate to pin.
+        """
+        certificate = IdentityCertificate(certificate)
+        certUri = certificate.getName()[:-1].toUri()
+        self._cache.pop(certUri, None)
+        self._pinned[certUri] = certificate
+
+    def deleteCertificate(self, certificateName):
+        """
+        Remove a certificate from the cache, even if it is pinned. Does nothing
+        if it is not present.
+        :param Name certificateName: The name of the certificate to remove.
+        """
+        certUri = certificateName.toUri()
+        self._cache.pop(certUri, None)
+        self._pinned.pop(certUri, None)
+
+    def getCertificate(self, certificateName):
+        """
+        Fetch a verified certificate from the cache.
+        :param Name certificateName: The name of the certificate to fetch.
+        :return: The certificate, or None if we don't have a valid one. The
+            certificate is shared with the cache and must not be modified.
+        :rtype: IdentityCertificate
+        """
+        certUri = certificateName.toUri()
+        cert = self._pinned.get(certUri)
+        if cert is not None:
+            self._hits += 1
+            self.lastLookupSource = self.PINNED
+            return cert
+
+        entry = self._cache.pop(certUri, None)
+        if entry is not None:
+            cert, trustRulesVersion = entry
+            if trustRulesVersion != self._trustRulesVersion:
+                cert = None
+            elif self._isExpired(cert):
+                self._expirations += 1
+                cert = None
+        if cert is not None:
+            # now the most recently used
+            self._cache[certUri] = entry
+            self._hits += 1
+            self.lastLookupSource = self.CACHED
+            return cert
+
+        self._misses += 1
+        self.lastLookupSource = None
+        return None
+
+    @staticmethod
+    def _isExpired(certificate):
+        return certificate.getNotAfter() < time.time()*1000
+
+    def getStoredCertificate(self, certificateName):
+        """
+        Look up a certificate in the identity storage. It is not inserted into
+        the cache, and must be verified before it is trusted.
+        :param Name certificateName: The certificate's name, without version
+        :return: The latest stored certificate with the given name, or None if
+            there is none or it has expired
+        :rtype: IdentityCertificate
+        """
+        if self._identityStorage is None:
+            return None
+        try:
+            keyName = IdentityCertificate.certificateNameToPublicKeyName(
+                    certificateName)
+            certificateNames = []
+            self._identityStorage.getAllCertificateNamesOfKey(keyName,
+                    certificateNames, True)
+            self._identityStorage.getAllCertificateNamesOfKey(keyName,
+                    certificateNames, False)
+        except RuntimeError:
+            # not a certificate name
+            return None
+
+        matching = [name for name in certificateNames
+                if certificateName.equals(name[:-1])]
+        if len(matching) == 0:
+            return None
+        cert = self._identityStorage.getCertificate(max(matching))
+        if cert is None or self._isExpired(cert):
+            return None
+        self._storageHits += 1
+        return cert
+
+    def setTrustRulesVersion(self, trustRulesVersion):
+        """
+        Note that the trust rules have changed. Unpinned certificates inserted
+        under other versions are no longer returned, so they are verified
+        again under the new rules.
+        :param int trustRulesVersion: The version of the current trust rules
+        """
+        self._trustRulesVersion = trustRulesVersion
+
+    def reset(self):
+        """
+        Clear all certificates, including pinned ones, and the counters.
+        """
+        self._cache = OrderedDict()
+        self._pinned = {}
+        self._hits = self._misses = self._storageHits = self._evictions = 0
+        self._expirations = 0
+
+    def setMaxSize(self, maxSize):
+        """
+        :param int maxSize: The number of unpinned certificates to keep
+        """
+        self._maxSize = maxSize
+        while len(self._cache) > self._maxSize:
+            self._cache.popitem(last=False)
+            self._evictions += 1
+
+    def getStatus(self):
+        """
+        :return: The number of cached and pinned certificates, the size limit,
+            and counts of hits, misses, certificates found in the identity
+            storage, evictions, and certificates dropped because they expired
+        :rtype: dict
+        """
+        return {'size': len(self._cache), 'pinned': len(self._pinned),
+                'maxSize': self._maxSize, 'hits': self._hits,
+                'misses': self._misses, 'storageHits': self._storageHits,
+                'evictions': self._evictions, 'expired': self._expirations}
@@ -0,0 +1,217 @@
+# -*- Mode:python; c-file-style:"gnu"; indent-tabs-mode:nil -*- */
+#
+# Copyright (C) 2016 Regents of the University of California.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+# A copy of the GNU General Public License is in the file COPYING.
+
+from pyndn import Name, HmacWithSha256Signature
+
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+
+from hmac_helper import HmacHelper
+
+from binascii import hexlify
+from collections import OrderedDict
+from os import urandom
+import time
+
+"""
+Short-lived HMAC session keys between a command sender and an IotNode.
+
+The two sides exchange ephemeral ECDH (P-256) public values in packets signed
+with their network certificates, so the peer is validated once per session.
+Commands and responses in the session are then signed with HMAC-SHA256
+using a key derived from the shared secret.
+"""
+
+SESSION_COMPONENT = "_session"
+
+class SessionKey(object):
+    def __init__(self, keyName, rawKey, lifetime, peerIdentity=None):
+        """
+        :param pyndn.Name keyName: The name in the key locator of packets
+            signed with this key: /<node prefix>/_session/<id>
+        :param str rawKey: The derived key bytes
+        :param float lifetime: Seconds until the key expires
+        :param pyndn.Name peerIdentity: (optional) The identity whose
+            certificate signed the key exchange
+        """
+        super(SessionKey, self).__init__()
+        self.keyName = Name(keyName)
+        self.peerIdentity = peerIdentity
+        self.hmac = HmacHelper(rawKey)
+        self.created = time.time()
+        self.expiry = self.created + lifetime
+        self._lastTimestamp = 0
+        self._lastNonces = set()
+
+    def isExpired(self, now=None):
+        if now is None:
+            now = time.time()
+        return now >= self.expiry
+
+    def needsRotation(self, fraction, now=None):
+        """
+        :param float fraction: The part of the lifetime after which a new key
+            should be negotiated
+        """
+        if now is None:
+            now = time.time()
+        return now >= self.created + fraction*(self.expiry - self.created)
+
+    def signInterest(self, interest):
+        self.hmac.signInterest(interest, keyName=self.keyName)
+
+    def signData(self, data):
+        self.hmac.signData(data, keyName=self.keyName)
+
+    def verifyData(self, data):
+        return self.hmac.verifyData(data)
+
+    def verifyInterest(self, interest):
+        """
+        Check the HMAC and make sure the interest is not a replay: its
+        timestamp may not be older than that of the last interest accepted,
+        and its nonce must be new for that timestamp.
+        """
+        if self.isExpired() or not self.hmac.verifyInterest(interest):
+            return False
+        interestName = interest.getName()
+        timestampBytes = bytearray(interestName.get(-3).getValue().toBytes())
+        timestamp = 0
+        for byte in timestampBytes:
+            timestamp = (timestamp << 8) + byte
+        nonce = interestName.get(-4).getValue().toBytes()
+
+        if timestamp < self._lastTimestamp:
+            return False
+        if timestamp > self._lastTimestamp:
+            self._lastTimestamp = timestamp
+            self._lastNonces.clear()
+        elif nonce in self._lastNonces:
+            return False
+        self._lastNonces.add(nonce)
+        return True
+
+class SessionKeyExchange(object):
+    """
+    One side's ephemeral ECDH key for negotiating a session.
+    """
+    def __init__(self):
+        super(SessionKeyExchange, self).__init__()
+        self._privateKey = ec.generate_private_key(ec.SECP256R1(), default_backend())
+
+    def getPublicBits(self):
+        """
+        :return: The DER encoded public value to send to the peer
+        :rtype: str
+        """
+        return self._privateKey.public_key().public_bytes(
+            serialization.Encoding.DER,
+            serialization.PublicFormat.SubjectPublicKeyInfo)
+
+    def deriveKey(self, peerPublicBits, sessionId):
+        """
+        :param str peerPublicBits: The DER encoded public value from the peer
+        :param str sessionId: The session id chosen by the node
+        :return: The HMAC key bytes for the session
+        :rtype: str
+        """
+        peerKey = serialization.load_der_public_key(bytes(peerPublicBits),
+            default_backend())
+        sharedSecret = self._privateKey.exchange(ec.ECDH(), peerKey)
+        kdf = HKDF(algorithm=hashes.SHA256(), length=32, salt=None,
+            info=b"ndn-pi session " + bytes(sessionId), backend=default_backend())
+        return kdf.derive(sharedSecret)
+
+class SessionKeyStore(object):
+    """
+    Node side: the sessions that peers have negotiated with us.
+    """
+    def __init__(self, lifetime=600, maxSessions=64):
+        """
+        :param float lifetime: Seconds a session key may be used
+        :param int maxSessions: New sessions are refused while this many are
+            live, unless the peer asking already holds one
+        """
+        super(SessionKeyStore, self).__init__()
+        self.lifetime = lifetime
+        self.maxSessions = maxSessions
+        # key name URI -> SessionKey, oldest first
+        self._sessions = OrderedDict()
+
+    def createSession(self, prefix, peerPublicBits, peerIdentity=None):
+        """
+        Answer a peer's key exchange.
+        :param pyndn.Name prefix: Our node prefix
+        :param str peerPublicBits: The peer's ECDH public value
+        :param pyndn.Name peerIdentity: (optional) The identity that signed
+            the key exchange
+        :return: The new session and our public value to send back, or None
+            if the store is full
+        :rtype: (SessionKey, str)
+        """
+        self.removeExpired()
+        if len(self._sessions) >= self.maxSessions and peerIdentity is not None:
+            # a peer renegotiating gives up its older keys first
+            for keyUri in [uri for uri, session in self._sessions.items()
+                    if session.peerIdentity is not None and
+                    session.peerIdentity.equals(peerIdentity)]:
+                del self._sessions[keyUri]
+        if len(self._sessions) >= self.maxSessions:
+            # evicting a live session would silently break its peer's commands
+            return None
+
+        sessionId = hexlify(urandom(8))
+        exchange = SessionKeyExchange()
+        rawKey = exchange.deriveKey(peerPublicBits, sessionId)
+        keyName = Name(prefix).append(SESSION_COMPONENT).append(sessionId)
+        session = SessionKey(keyName, rawKey, self.lifetime, peerIdentity)
+        self._sessions[keyName.toUri()] = session
+        return session, exchange.getPublicBits()
+
+    def findSessionForInterest(self, interest):
+        """
+        :return: The live session whose key signed the interest, or None if
+            it is not signed with a session key
+        :rtype: SessionKey
+        """
+        signature = HmacHelper.extractInterestSignature(interest)
+        if not isinstance(signature, HmacWithSha256Signature):
+            return None
+        keyUri = signature.getKeyLocator().getKeyName().toUri()
+        session = self._sessions.get(keyUri)
+        if session is not None and session.isExpired():
+            del self._sessions[keyUri]
+            return None
+        return session
+
+    def isSessionSigned(self, interest):
+        """
+        :return: Whether the interest carries an HMAC signature, and so should
+            be checked against a session instead of the key chain
+        :rtype: boolean
+        """
+        signature = HmacHelper.extractInterestSignature(interest)
+        return isinstance(signature, HmacWithSha256Signature)
+
+    def removeExpired(self):
+        now = time.time()
+        for keyUri in [uri for uri, session in self._sessions.items()
+                if session.isExpired(now)]:
+            del self._sessions[keyUri]
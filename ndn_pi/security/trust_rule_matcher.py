@@ -0,0 +1,209 @@
+# -*- Mode:python; c-file-style:"gnu"; indent-tabs-mode:nil -*- */
+#
+# Copyright (C) 2016 Regents of the University of California.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+# A copy of the GNU General Public License is in the file COPYING.
+
+import re
+
+from pyndn import Name
+from pyndn.security.policy import ConfigPolicyManager
+from pyndn.util.regex.ndn_regex_top_matcher import NdnRegexTopMatcher
+
+from name_trie import NameTrie
+
+# component expressions we can translate: plain text, matched anywhere in
+# the component as NdnRegexComponentMatcher does
+_LITERAL_COMPONENT = re.compile(r'^[A-Za-z0-9_\-]*$')
+_ANY_COMPONENT = '<[^<>]*>'
+
+def _translateComponentSet(literals, isNegated):
+    if len(literals) == 0:
+        return None
+    alternatives = '|'.join(re.escape(literal) for literal in literals)
+    if isNegated:
+        return '<(?![^<>]*(?:{}))[^<>]*>'.format(alternatives)
+    return '<(?=[^<>]*(?:{}))[^<>]*>'.format(alternatives)
+
+def translateNdnRegex(pattern):
+    """
+    Translate an NDN name regex to a Python regex over the name encoded by
+    encodeNameForRegex. Only component text, <>, [<...>] and [^<...>] sets,
+    the * + ? repeats and the ^ $ anchors are translated.
+    :param str pattern: The NDN regex, e.g. "^[^<KEY>]*<KEY><>*<ID-CERT>"
+    :return: The compiled Python regex, or None if the pattern uses anything
+        else and must be left to NdnRegexTopMatcher
+    """
+    body = pattern
+    isAnchoredStart = body.startswith('^')
+    if isAnchoredStart:
+        body = body[1:]
+    isAnchoredEnd = body.endswith('$')
+    if isAnchoredEnd:
+        body = body[:-1]
+
+    translated = []
+    position = 0
+    while position < len(body):
+        character = body[position]
+        if character == '<':
+            end = body.find('>', position)
+            if end < 0:
+                return None
+            literal = body[position+1:end]
+            if not _LITERAL_COMPONENT.match(literal):
+                return None
+            if literal == '':
+                translated.append(_ANY_COMPONENT)
+            else:
+                translated.append(_translateComponentSet([literal], False))
+            position = end + 1
+        elif character == '[':
+            end = body.find(']', position)
+            if end < 0:
+                return None
+            setBody = body[position+1:end]
+            isNegated = setBody.startswith('^')
+            if isNegated:
+                setBody = setBody[1:]
+            literals = re.findall(r'<([^<>]*)>', setBody)
+            if ''.join('<{}>'.format(literal) for literal in literals) != setBody:
+                return None
+            if not all(literal != '' and _LITERAL_COMPONENT.match(literal)
+                    for literal in literals):
+                return None
+            componentSet = _translateComponentSet(literals, isNegated)
+            if componentSet is None:
+                return None
+            translated.append(componentSet)
+            position = end + 1
+        elif character in '*+?' and len(translated) > 0:
+            translated[-1] = '(?:{}){}'.format(translated[-1], character)
+            position += 1
+        else:
+            return None
+
+    # like NdnRegexTopMatcher, an unanchored end may match any components
+    expression = ''.join(translated)
+    if not isAnchoredStart:
+        expression = '(?:{})*'.format(_ANY_COMPONENT) + expression
+    if not isAnchoredEnd:
+        expression = expression + '(?:{})*'.format(_ANY_COMPONENT)
+    return re.compile(expression + r'\Z')
+
+def encodeNameForRegex(name):
+    """
+    :return: The name's escaped components, each between < and >
+    :rtype: str
+    """
+    return ''.join('<' + name.get(i).toEscapedString() + '>'
+            for i in range(name.size()))
+
+class TrustRuleMatcher(object):
+    """
+    The validator rules of a ConfigPolicyManager configuration, compiled so
+    the first rule matching a packet name is found without testing every rule.
+
+    Rules with a name filter are kept in a NameTrie under the filter's name,
+    so only rules whose name is a prefix of the packet name are tested. Other
+    rules are tested for every packet. Each regex is compiled once, to a
+    Python regex if translateNdnRegex supports it. Candidates are tested in
+    rule order, so the result matches ConfigPolicyManager's search.
+    """
+    def __init__(self, rules, trustRulesVersion=0):
+        """
+        :param list rules: The validator's rule subtrees, in order
+        :param int trustRulesVersion: (optional) The version of the rules, as
+            from IotPolicyManager.getTrustRulesVersion
+        """
+        super(TrustRuleMatcher, self).__init__()
+        self.trustRulesVersion = trustRulesVersion
+        # match type -> NameTrie of filter name -> list of (index, rule, filters)
+        self._ruleTries = {}
+        # match type -> list of (index, rule, filters) for rules without a
+        # name filter
+        self._unindexedRules = {}
+        # regex pattern -> compiled Python regex, or NdnRegexTopMatcher
+        self._regexMatchers = {}
+
+        for index, rule in enumerate(rules):
+            try:
+                matchType = rule['for'][0].getValue()
+            except (KeyError, IndexError):
+                continue
+            filters = []
+            indexName = None
+            for filterNode in rule['filter']:
+                regexPattern = filterNode.getFirstValue("regex")
+                if regexPattern is None:
+                    matchName = Name(filterNode.getFirstValue("name"))
+                    filters.append((False, matchName, filterNode.getFirstValue("relation")))
+                    if indexName is None:
+                        indexName = matchName
+                else:
+                    filters.append((True, self._getRegexMatcher(regexPattern), None))
+
+            entry = (index, rule, filters)
+            if indexName is None:
+                self._unindexedRules.setdefault(matchType, []).append(entry)
+            else:
+                ruleTrie = self._ruleTries.setdefault(matchType, NameTrie())
+                entries = ruleTrie.find(indexName)
+                if entries is None:
+                    entries = []
+                    ruleTrie.insert(indexName, entries)
+                entries.append(entry)
+
+    def _getRegexMatcher(self, regexPattern):
+        matcher = self._regexMatchers.get(regexPattern)
+        if matcher is None:
+            matcher = translateNdnRegex(regexPattern)
+            if matcher is None:
+                matcher = NdnRegexTopMatcher(regexPattern)
+            self._regexMatchers[regexPattern] = matcher
+        return matcher
+
+    def findMatchingRule(self, objName, matchType):
+        """
+        :param pyndn.Name objName: The name to match. For command interests,
+            this excludes the timestamp, nonce and signature components.
+        :param str matchType: The rule type to match, "data" or "interest"
+        :return: The first rule whose filters all pass, or None
+        :rtype: pyndn.util.boost_info_parser.BoostInfoTree
+        """
+        candidates = list(self._unindexedRules.get(matchType, []))
+        ruleTrie = self._ruleTries.get(matchType)
+        if ruleTrie is not None:
+            for entries in ruleTrie.prefixMatches(objName):
+                candidates.extend(entries)
+        candidates.sort(key=lambda entry: entry[0])
+
+        encodedName = None
+        for index, rule, filters in candidates:
+            for isRegex, matcher, relation in filters:
+                if isRegex and isinstance(matcher, NdnRegexTopMatcher):
+                    passed = matcher.match(objName)
+                elif isRegex:
+                    if encodedName is None:
+                        encodedName = encodeNameForRegex(objName)
+                    passed = matcher.match(encodedName) is not None
+                else:
+                    passed = ConfigPolicyManager._matchesRelation(objName,
+                            matcher, relation)
+                if not passed:
+                    break
+            else:
+                return rule
+        return None
@@ -0,0 +1,88 @@
+# -*- Mode:python; c-file-style:"gnu"; indent-tabs-mode:nil -*- */
+#
+# Copyright (C) 2016 Regents of the University of California.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+# A copy of the GNU General Public License is in the file COPYING.
+
+from math import ceil
+
+class TimerWheel(object):
+    """
+    A hashed timer wheel for many timeouts that are often pushed back, e.g.
+    one per device that is reset on every keep-alive. Scheduling and
+    cancelling are constant time, and each tick only looks at the timers in
+    one slot. The wheel does not keep time itself: call tick() every
+    tickDuration seconds, e.g. from the event loop.
+    """
+    def __init__(self, tickDuration=1.0, wheelSize=64):
+        """
+        :param float tickDuration: The seconds between calls to tick(), and so
+            the resolution of the timeouts
+        :param int wheelSize: The number of slots. Timeouts longer than
+            wheelSize ticks wait for extra turns of the wheel.
+        """
+        super(TimerWheel, self).__init__()
+        self.tickDuration = tickDuration
+        # each slot maps key -> turns of the wheel left before it expires
+        self._slots = [{} for i in range(wheelSize)]
+        self._current = 0
+        # key -> index of the slot holding it
+        self._timerSlots = {}
+
+    def __len__(self):
+        return len(self._timerSlots)
+
+    def __contains__(self, key):
+        return key in self._timerSlots
+
+    def schedule(self, key, delay):
+        """
+        Set a timeout, replacing any timeout already set for the key.
+        :param key: A hashable key to identify the timeout
+        :param float delay: Seconds until the key should expire. This is
+            rounded up to a whole number of ticks.
+        """
+        self.cancel(key)
+        ticks = max(1, int(ceil(delay/self.tickDuration)))
+        wheelSize = len(self._slots)
+        slotIndex = (self._current + ticks) % wheelSize
+        self._slots[slotIndex][key] = (ticks - 1) // wheelSize
+        self._timerSlots[key] = slotIndex
+
+    def cancel(self, key):
+        """
+        Remove the timeout for a key. Does nothing if there is none.
+        """
+        slotIndex = self._timerSlots.pop(key, None)
+        if slotIndex is not None:
+            del self._slots[slotIndex][key]
+
+    def tick(self):
+        """
+        Advance the wheel by one tick.
+        :return: The keys that expired
+        :rtype: list
+        """
+        self._current = (self._current + 1) % len(self._slots)
+        slot = self._slots[self._current]
+        expired = []
+        for key, turns in list(slot.items()):
+            if turns == 0:
+                del slot[key]
+                del self._timerSlots[key]
+                expired.append(key)
+            else:
+                slot[key] = turns - 1
+        return expired
@@ -0,0 +1,28 @@
+# -*- Mode:python; c-file-style:"gnu"; indent-tabs-mode:nil -*- */
+#
+# Copyright (C) 2016 Regents of the University of California.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+# A copy of the GNU General Public License is in the file COPYING.
+
+# Run from the repository root with: python -m unittest discover -s tests -t .
+
+import os
+import sys
+
+# the ndn_pi modules import each other as top-level modules
+_packageDirectory = os.path.join(os.path.dirname(os.path.dirname(
+        os.path.abspath(__file__))), 'ndn_pi')
+if _packageDirectory not in sys.path:
+    sys.path.insert(0, _packageDirectory)
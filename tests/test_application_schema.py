@@ -0,0 +1,166 @@
+# -*- Mode:python; c-file-style:"gnu"; indent-tabs-mode:nil -*- */
+#
+# Copyright (C) 2016 Regents of the University of California.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+# A copy of the GNU General Public License is in the file COPYING.
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from pyndn import Name
+from pyndn.security.policy import ConfigPolicyManager
+from pyndn.util.boost_info_parser import BoostInfoParser
+
+import application_schema
+from application_schema import ApplicationSchema, writeSchemaFile
+
+def _parse(text):
+    tree = BoostInfoParser()
+    tree.read(text, 'test')
+    return tree
+
+def _applyChanges(schemaText, changes):
+    """
+    Update an encoded schema as a node would with the result of
+    getChangesSince.
+    :return: The updated schema, encoded
+    :rtype: str
+    """
+    schema = ApplicationSchema.fromTree('app', _parse(schemaText))
+    for ruleId in changes["removed"]:
+        schema.removeRule(ruleId)
+    for ruleId, ruleText in changes["added"]:
+        ruleTree = _parse(ruleText).getRoot()["rule"][0]
+        schema._rules[ruleId] = application_schema._nodesFromTree(ruleTree)
+    return schema.encode()
+
+class TestApplicationSchema(unittest.TestCase):
+    def setUp(self):
+        self.schema = ApplicationSchema('app', maxHistory=4)
+        self.schema.setTrustAnchor('Y2VydA==')
+        self.schema.addRegexRule('Certs', '^[^<KEY>]*<KEY><>*<ID-CERT>',
+                'rsa-sha256', signerName=Name('/home/gw/KEY/ksk-1/ID-CERT'))
+        self.schema.addRegexRule('sync-data', '^[^<MULTICAST>]*<MULTICAST><>*',
+                'rsa-sha256', signerRegex='^[^<KEY>]*<KEY><>*<ID-CERT>')
+        self.version = 0
+
+    def _publish(self):
+        self.version += 1
+        self.schema.recordVersion(self.version)
+        return self.schema.encode()
+
+    def _addPrefix(self, prefix):
+        self.schema.addSignerRule(Name(prefix),
+                Name(prefix + '/KEY/ksk-1/ID-CERT'), 'rsa-sha256')
+
+    def test_encoding_loads_in_policy_manager(self):
+        self._addPrefix('/home/app/a')
+        # the policy manager would decode the anchor, which is not a real
+        # certificate here
+        schema = ApplicationSchema.fromTree('app', _parse(self.schema.encode()))
+        schema._otherNodes = []
+        policyManager = ConfigPolicyManager()
+        policyManager.load(schema.encode(), 'app')
+        self.assertEqual([rule["id"][0].getValue()
+                for rule in policyManager.config["validator/rule"]],
+                ['Certs', 'sync-data', '/home/app/a'])
+
+    def test_file_round_trip(self):
+        self._addPrefix('/home/app/a')
+        directory = tempfile.mkdtemp()
+        try:
+            fileName = os.path.join(directory, 'apps', 'app.conf')
+            writeSchemaFile(fileName, self.schema.encode())
+            self.assertFalse(os.path.exists(fileName + '.tmp'))
+            tree = BoostInfoParser()
+            tree.read(fileName)
+        finally:
+            shutil.rmtree(directory)
+        loaded = ApplicationSchema.fromTree('app', tree)
+        self.assertEqual(loaded.encode(), self.schema.encode())
+        self.assertTrue(loaded.hasRule('/home/app/a'))
+        self.assertEqual(loaded.getRuleIds(), self.schema.getRuleIds())
+
+    def test_changes_since_each_version(self):
+        texts = [self._publish()]
+        self._addPrefix('/home/app/a')
+        texts.append(self._publish())
+        self._addPrefix('/home/app/b')
+        self._addPrefix('/home/app/c')
+        texts.append(self._publish())
+        self.schema.removeRule('/home/app/a')
+        latest = self._publish()
+
+        for version, text in enumerate(texts, 1):
+            changes = self.schema.getChangesSince(version)
+            self.assertEqual(changes["from"], version)
+            self.assertEqual(changes["to"], self.version)
+            self.assertEqual(_applyChanges(text, changes), latest)
+
+        changes = self.schema.getChangesSince(3)
+        self.assertEqual(changes["removed"], ['/home/app/a'])
+        self.assertEqual(changes["added"], [])
+        changes = self.schema.getChangesSince(1)
+        self.assertEqual(changes["removed"], [])
+        self.assertEqual([ruleId for ruleId, _ in changes["added"]],
+                ['/home/app/b', '/home/app/c'])
+
+    def test_no_changes_since_latest(self):
+        latest = self._publish()
+        changes = self.schema.getChangesSince(self.version)
+        self.assertEqual((changes["added"], changes["removed"]), ([], []))
+        self.assertEqual(_applyChanges(latest, changes), latest)
+
+    def test_forgotten_and_unknown_versions(self):
+        for i in range(6):
+            self._addPrefix('/home/app/{}'.format(i))
+            self._publish()
+        # only the last 4 of 6 versions are kept
+        self.assertEqual(self.schema.getRecordedVersions(), [3, 4, 5, 6])
+        self.assertIsNone(self.schema.getChangesSince(2))
+        self.assertIsNotNone(self.schema.getChangesSince(3))
+        self.assertIsNone(self.schema.getChangesSince(99))
+
+    def test_new_trust_anchor_needs_snapshot(self):
+        self._publish()
+        self.schema.setTrustAnchor('bmV3')
+        self._publish()
+        self.assertIsNone(self.schema.getChangesSince(1))
+
+    def test_reordered_rules_need_snapshot(self):
+        self._addPrefix('/home/app/a')
+        self._addPrefix('/home/app/b')
+        self._publish()
+        # a changed rule keeps its place, before /home/app/b, so it can't
+        # be sent as removed and appended
+        self.schema.addSignerRule(Name('/home/app/a'), Name('/home/other'),
+                'rsa-sha256')
+        self._publish()
+        self.assertIsNone(self.schema.getChangesSince(1))
+
+    def test_moved_rule_needs_snapshot(self):
+        self._addPrefix('/home/app/a')
+        self._addPrefix('/home/app/b')
+        self._publish()
+        # the same rule, now after /home/app/b
+        self.schema.removeRule('/home/app/a')
+        self._addPrefix('/home/app/a')
+        self._publish()
+        self.assertIsNone(self.schema.getChangesSince(1))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+# -*- Mode:python; c-file-style:"gnu"; indent-tabs-mode:nil -*- */
+#
+# Copyright (C) 2016 Regents of the University of California.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+# A copy of the GNU General Public License is in the file COPYING.
+
+import unittest
+
+from pyndn import Name
+from pyndn.encoding import ProtobufTlv
+
+from capability_directory import (CapabilityDirectory, encodeCompactListing,
+        decodeCompactListing)
+from commands import ListDevicesMessage
+
+class TestCapabilityDirectory(unittest.TestCase):
+    def setUp(self):
+        self.directory = CapabilityDirectory()
+        self.directory.addEntry(Name('/home/a'), 'light', '/home/a/on', True)
+        self.directory.addEntry(Name('/home/a'), 'light', '/home/a/off', True)
+        self.directory.addEntry(Name('/home/b'), 'light', '/home/b/on', False)
+        self.directory.addEntry(Name('/home/b'), 'motion', '/home/b/read', False)
+
+    def test_duplicate_entry_ignored(self):
+        version = self.directory.getVersion()
+        self.assertFalse(self.directory.addEntry(Name('/home/a'), 'light',
+                '/home/a/on', True))
+        self.assertEqual(self.directory.getVersion(), version)
+        self.assertEqual(len(self.directory.getEntries('light')), 3)
+
+    def test_remove_identity_only_touches_its_keywords(self):
+        motionVersion = self.directory.getKeywordVersion('motion')
+        self.directory.removeIdentity(Name('/home/a'))
+        self.assertEqual([info['name'] for info in self.directory.getEntries('light')],
+                ['/home/b/on'])
+        self.assertEqual(self.directory.getKeywordVersion('motion'), motionVersion)
+        self.assertEqual(self.directory.getIdentityEntries(Name('/home/a')), [])
+
+        self.directory.removeIdentity(Name('/home/b'))
+        self.assertEqual(self.directory.keywords(), [])
+        self.assertEqual(self.directory.toDict(), {})
+
+    def test_unconfirmed_listings(self):
+        self.directory.setConfirmed(Name('/home/b'), False)
+        listing = self.directory.toDict(['motion'])
+        self.assertEqual(listing['motion'][0].get('unconfirmed'), True)
+        self.directory.setConfirmed(Name('/home/b'), True)
+        self.assertNotIn('unconfirmed', self.directory.getEntries('motion')[0])
+
+    def test_to_dict_skips_unknown_keywords(self):
+        self.assertEqual(sorted(self.directory.toDict(['motion', 'none']).keys()),
+                ['motion'])
+
+class TestCompactListing(unittest.TestCase):
+    def _roundTrip(self, listing):
+        return decodeCompactListing(encodeCompactListing(listing))
+
+    def test_round_trip(self):
+        directory = CapabilityDirectory()
+        directory.addEntry(Name('/home/a'), 'light', '/home/a/on', True)
+        directory.addEntry(Name('/home/a'), 'light', '/home/a/off', False)
+        directory.addEntry(Name('/home/b'), 'motion', '/home/b/sensor/read', False)
+        directory.setConfirmed(Name('/home/b'), False)
+        listing = directory.toDict()
+        self.assertEqual(self._roundTrip(listing), listing)
+
+    def test_shared_prefixes_are_stored_once(self):
+        listing = {'light': [{'signed': True, 'name': '/home/a/on'},
+                {'signed': True, 'name': '/home/a/off'}],
+                'switch': [{'signed': False, 'name': '/home/a/toggle'}]}
+        message = ListDevicesMessage()
+        ProtobufTlv.decode(message, bytearray(encodeCompactListing(listing)))
+        self.assertEqual(len(message.prefixes), 1)
+        self.assertEqual(self._roundTrip(listing), listing)
+
+    def test_names_with_escaped_and_single_components(self):
+        listing = {'odd': [{'signed': False, 'name': '/top'},
+                {'signed': True, 'name': '/home/%00%FF/%2F'}]}
+        self.assertEqual(self._roundTrip(listing), listing)
+
+    def test_empty(self):
+        self.assertEqual(self._roundTrip({}), {})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,120 @@
+# -*- Mode:python; c-file-style:"gnu"; indent-tabs-mode:nil -*- */
+#
+# Copyright (C) 2016 Regents of the University of California.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+# A copy of the GNU General Public License is in the file COPYING.
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import directory_journal
+from directory_journal import DirectoryJournal
+
+class TestDirectoryJournal(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'journal', 'directory.journal')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _replay(self, journal=None):
+        if journal is None:
+            journal = DirectoryJournal(self.path)
+        return dict((identity, (digest, entries))
+                for identity, digest, entries in journal.replay())
+
+    def test_latest_record_wins(self):
+        journal = DirectoryJournal(self.path)
+        journal.recordIdentity('/home/a', '\x01\x02', [('light', '/home/a/on', True)])
+        journal.recordIdentity('/home/b', None, [('motion', '/home/b/read', False)])
+        journal.recordIdentity('/home/a', '\x03', [('light', '/home/a/off', False)])
+        journal.recordRemoval('/home/b')
+        journal.close()
+
+        self.assertEqual(self._replay(), {
+                '/home/a': ('\x03', [('light', '/home/a/off', False)])})
+
+    def test_truncated_record_skipped(self):
+        journal = DirectoryJournal(self.path)
+        journal.recordIdentity('/home/a', None, [('light', '/home/a/on', True)])
+        journal.close()
+        with open(self.path, 'a') as journalFile:
+            # a crash part way through a write
+            journalFile.write('{"identity": "/home/b", "entr')
+
+        self.assertEqual(list(self._replay().keys()), ['/home/a'])
+
+    def test_needs_compaction(self):
+        journal = DirectoryJournal(self.path, minCompactionRecords=4)
+        for i in range(3):
+            journal.recordIdentity('/home/a', None, [('light', '/home/a/on', True)])
+        # too few records to bother
+        self.assertFalse(journal.needsCompaction())
+        journal.recordIdentity('/home/a', None, [('light', '/home/a/on', True)])
+        self.assertTrue(journal.needsCompaction())
+
+        journal.recordIdentity('/home/b', None, [])
+        journal.recordIdentity('/home/c', None, [])
+        # 6 records for 3 identities
+        self.assertFalse(journal.needsCompaction())
+
+    def test_compact(self):
+        journal = DirectoryJournal(self.path, minCompactionRecords=1)
+        for i in range(5):
+            journal.recordIdentity('/home/a', None, [('light', '/home/a/on', True)])
+        records = [('/home/a', '\x01', [('light', '/home/a/on', True)])]
+        journal.compact(records)
+        self.assertFalse(journal.needsCompaction())
+
+        # appending continues after compaction
+        journal.recordIdentity('/home/b', None, [('motion', '/home/b/read', False)])
+        journal.close()
+        with open(self.path) as journalFile:
+            self.assertEqual(len(journalFile.readlines()), 2)
+        self.assertEqual(sorted(self._replay().keys()), ['/home/a', '/home/b'])
+        self.assertFalse(os.path.exists(self.path + '.tmp'))
+
+    def test_crash_during_compaction_keeps_old_journal(self):
+        journal = DirectoryJournal(self.path)
+        journal.recordIdentity('/home/a', None, [('light', '/home/a/on', True)])
+        journal.recordIdentity('/home/b', None, [('motion', '/home/b/read', False)])
+
+        def crash(source, destination):
+            raise OSError("crashed before the rename")
+        rename = directory_journal.os.rename
+        directory_journal.os.rename = crash
+        try:
+            self.assertRaises(OSError, journal.compact,
+                    [('/home/a', None, [('light', '/home/a/on', True)])])
+        finally:
+            directory_journal.os.rename = rename
+
+        # the old journal is untouched, and a later compaction replaces the
+        # leftover temporary file
+        self.assertEqual(sorted(self._replay().keys()), ['/home/a', '/home/b'])
+        journal = DirectoryJournal(self.path)
+        journal.replay()
+        journal.compact([('/home/b', None, [('motion', '/home/b/read', False)])])
+        self.assertEqual(list(self._replay().keys()), ['/home/b'])
+        self.assertFalse(os.path.exists(self.path + '.tmp'))
+
+    def test_missing_journal(self):
+        self.assertEqual(self._replay(), {})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,135 @@
+# -*- Mode:python; c-file-style:"gnu"; indent-tabs-mode:nil -*- */
+#
+# Copyright (C) 2016 Regents of the University of California.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+# A copy of the GNU General Public License is in the file COPYING.
+
+import time
+import unittest
+
+from pyndn import Name, Data
+from pyndn.security import KeyChain
+from pyndn.security.certificate import IdentityCertificate, CertificateSubjectDescription
+from pyndn.security.identity import IdentityManager, BasicIdentityStorage, MemoryPrivateKeyStorage
+
+from security.iot_policy_manager import IotPolicyManager
+
+class TestStoredCertificates(unittest.TestCase):
+    """
+    A controller /home/gw and a device /home/dev whose certificate, signed by
+    the controller, is only in the identity storage.
+    """
+    def setUp(self):
+        # an in-memory database; MemoryIdentityStorage can't list the
+        # certificates of a key
+        self.identityStorage = BasicIdentityStorage(':memory:')
+        identityManager = IdentityManager(self.identityStorage,
+                MemoryPrivateKeyStorage())
+        self.policyManager = IotPolicyManager(self.identityStorage)
+        self.keyChain = KeyChain(identityManager, self.policyManager)
+
+        rootKeyName = identityManager.generateRSAKeyPairAsDefault(
+                Name('/home/gw'), True)
+        rootCertificate = identityManager.selfSign(rootKeyName)
+        identityManager.addCertificateAsDefault(rootCertificate)
+        self.policyManager.pinCertificate(rootCertificate)
+        self.rootCertificateName = rootCertificate.getName()
+
+        deviceKeyName = identityManager.generateRSAKeyPairAsDefault(
+                Name('/home/dev'), True)
+        now = int(time.time()*1000)
+        deviceCertificate = IdentityCertificate()
+        deviceCertificate.setName(Name('/home/dev/KEY').append(deviceKeyName.get(-1))
+                .append('ID-CERT').appendVersion(now))
+        deviceCertificate.setNotBefore(now - 1000)
+        deviceCertificate.setNotAfter(now + 3600*1000)
+        deviceCertificate.setPublicKeyInfo(identityManager.getPublicKey(deviceKeyName))
+        deviceCertificate.addSubjectDescription(
+                CertificateSubjectDescription("2.5.4.41", deviceKeyName.toUri()))
+        deviceCertificate.encode()
+        self.keyChain.sign(deviceCertificate, rootCertificate.getName())
+        self.identityStorage.addCertificate(deviceCertificate)
+        self.deviceCertificateName = deviceCertificate.getName()
+
+        self._configure(Name('/home'), Name('/home/dev'))
+
+    def _configure(self, environmentPrefix, deviceIdentity):
+        self.policyManager.setEnvironmentPrefix(environmentPrefix)
+        self.policyManager.setTrustRootIdentity(Name('/home/gw'))
+        self.policyManager.setDeviceIdentity(deviceIdentity)
+        self.policyManager.updateTrustRules()
+
+    def _checkDeviceData(self):
+        """
+        :return: 'verified', 'failed', or 'fetch' if the device certificate
+            would have to be fetched
+        """
+        return self._checkData(Name('/home/dev/sensor/1'),
+                self.deviceCertificateName)
+
+    def _checkData(self, dataName, certificateName):
+        data = Data(dataName)
+        data.setContent('reading')
+        self.keyChain.sign(data, certificateName)
+
+        results = []
+        request = self.policyManager.checkVerificationPolicy(data, 0,
+                lambda data: results.append('verified'),
+                lambda data, reason: results.append('failed'))
+        if request is not None:
+            return 'fetch'
+        return results[0]
+
+    def test_stored_certificate_is_verified_before_use(self):
+        self.assertEqual(self._checkDeviceData(), 'verified')
+        status = self.policyManager.getCertificateCacheStatus()
+        self.assertEqual(status['storageHits'], 1)
+        self.assertEqual(status['fetches'], 0)
+
+        # the second packet finds the verified certificate in the cache
+        self.assertEqual(self._checkDeviceData(), 'verified')
+        self.assertEqual(
+                self.policyManager.getCertificateCacheStatus()['storageHits'], 1)
+
+    def test_trust_rule_change_forces_reverification(self):
+        self.assertEqual(self._checkDeviceData(), 'verified')
+
+        # the controller's certificates are no longer trusted to sign
+        # certificates, so the stored device certificate must not be
+        # trusted again without being fetched and checked
+        self._configure(Name('/office'), Name('/office/dev'))
+        self.assertEqual(self._checkDeviceData(), 'fetch')
+
+        # back under the original rules, it is verified again from storage
+        self._configure(Name('/home'), Name('/home/dev'))
+        self.assertEqual(self._checkDeviceData(), 'verified')
+        self.assertEqual(
+                self.policyManager.getCertificateCacheStatus()['storageHits'], 3)
+
+    def test_pinned_signer_is_not_an_avoided_fetch(self):
+        self.assertEqual(self._checkData(Name('/home/gw/status'),
+                self.rootCertificateName), 'verified')
+        self.assertEqual(
+                self.policyManager.getCertificateCacheStatus()['fetchesAvoided'], 0)
+
+        # from storage, then from the cache
+        self.assertEqual(self._checkDeviceData(), 'verified')
+        self.assertEqual(self._checkDeviceData(), 'verified')
+        status = self.policyManager.getCertificateCacheStatus()
+        self.assertEqual(status['fetchesAvoided'], 2)
+        self.assertEqual(status['fetches'], 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,98 @@
+# -*- Mode:python; c-file-style:"gnu"; indent-tabs-mode:nil -*- */
+#
+# Copyright (C) 2016 Regents of the University of California.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+# A copy of the GNU General Public License is in the file COPYING.
+
+import unittest
+
+from pyndn import Name
+
+from name_trie import NameTrie
+
+class TestNameTrie(unittest.TestCase):
+    def setUp(self):
+        self.trie = NameTrie()
+        self.trie.insert(Name('/a'), 'a')
+        self.trie.insert(Name('/a/b/c'), 'abc')
+        self.trie.insert(Name('/a/d'), 'ad')
+
+    def test_find_is_exact(self):
+        self.assertEqual(self.trie.find(Name('/a/b/c')), 'abc')
+        self.assertIsNone(self.trie.find(Name('/a/b')))
+        self.assertIsNone(self.trie.find(Name('/a/b/c/d')))
+        self.assertEqual(len(self.trie), 3)
+
+    def test_insert_replaces(self):
+        self.trie.insert(Name('/a/d'), 'new')
+        self.assertEqual(self.trie.find(Name('/a/d')), 'new')
+        self.assertEqual(len(self.trie), 3)
+
+    def test_longest_prefix_match(self):
+        self.assertEqual(self.trie.longestPrefixMatch(Name('/a/b/c/d/e')), 'abc')
+        # /a/b has no value of its own
+        self.assertEqual(self.trie.longestPrefixMatch(Name('/a/b')), 'a')
+        self.assertEqual(self.trie.longestPrefixMatch(Name('/a/x')), 'a')
+        self.assertIsNone(self.trie.longestPrefixMatch(Name('/x')))
+
+    def test_root_value(self):
+        self.trie.insert(Name(), 'root')
+        self.assertEqual(self.trie.longestPrefixMatch(Name('/x')), 'root')
+        self.assertEqual(self.trie.prefixMatches(Name('/a/b/c')),
+                ['root', 'a', 'abc'])
+
+    def test_prefix_matches_shortest_first(self):
+        self.assertEqual(self.trie.prefixMatches(Name('/a/b/c/d')), ['a', 'abc'])
+        self.assertEqual(self.trie.prefixMatches(Name('/a/d')), ['a', 'ad'])
+        self.assertEqual(self.trie.prefixMatches(Name('/b')), [])
+
+    def test_stored_none_is_a_value(self):
+        self.trie.insert(Name('/n'), None)
+        self.assertEqual(len(self.trie), 4)
+        self.assertEqual(self.trie.prefixMatches(Name('/n/x')), [None])
+
+    def test_remove_prunes_empty_branches(self):
+        self.assertEqual(self.trie.remove(Name('/a/b/c')), 'abc')
+        self.assertEqual(len(self.trie), 2)
+        # nothing is left under /a/b
+        aNode = self.trie._root.children[Name('/a').get(0)]
+        self.assertNotIn(Name('/b').get(0), aNode.children)
+        # values on the way are kept
+        self.assertEqual(self.trie.find(Name('/a')), 'a')
+        self.assertEqual(self.trie.find(Name('/a/d')), 'ad')
+
+        self.trie.remove(Name('/a/d'))
+        self.trie.remove(Name('/a'))
+        self.assertEqual(len(self.trie), 0)
+        self.assertEqual(self.trie._root.children, {})
+
+    def test_remove_keeps_branches_with_values_below(self):
+        self.assertEqual(self.trie.remove(Name('/a')), 'a')
+        self.assertEqual(self.trie.find(Name('/a/b/c')), 'abc')
+        self.assertEqual(self.trie.longestPrefixMatch(Name('/a/x')), None)
+
+    def test_remove_missing(self):
+        self.assertIsNone(self.trie.remove(Name('/a/b')))
+        self.assertIsNone(self.trie.remove(Name('/x/y')))
+        self.assertEqual(len(self.trie), 3)
+        self.assertEqual(self.trie.find(Name('/a/b/c')), 'abc')
+
+    def test_clear(self):
+        self.trie.clear()
+        self.assertEqual(len(self.trie), 0)
+        self.assertIsNone(self.trie.longestPrefixMatch(Name('/a/b/c')))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,60 @@
+# -*- Mode:python; c-file-style:"gnu"; indent-tabs-mode:nil -*- */
+#
+# Copyright (C) 2016 Regents of the University of California.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+# A copy of the GNU General Public License is in the file COPYING.
+
+import unittest
+
+from pyndn import Name
+
+from security.session_key import SessionKeyExchange, SessionKeyStore
+
+class TestSessionKeyStore(unittest.TestCase):
+    def setUp(self):
+        self.prefix = Name('/home/controller')
+        self.store = SessionKeyStore(maxSessions=2)
+
+    def _createSession(self, peerUri):
+        return self.store.createSession(self.prefix,
+                SessionKeyExchange().getPublicBits(), Name(peerUri))
+
+    def _isLive(self, session):
+        return self.store._sessions.get(session.keyName.toUri()) is session
+
+    def test_full_store_refuses_new_peer(self):
+        first, _ = self._createSession('/home/node1')
+        second, _ = self._createSession('/home/node2')
+        self.assertIsNone(self._createSession('/home/node3'))
+        # the live sessions still verify their peers' commands
+        self.assertTrue(self._isLive(first))
+        self.assertTrue(self._isLive(second))
+
+    def test_full_store_lets_peer_renegotiate(self):
+        first, _ = self._createSession('/home/node1')
+        second, _ = self._createSession('/home/node2')
+        renewed, _ = self._createSession('/home/node1')
+        self.assertFalse(self._isLive(first))
+        self.assertTrue(self._isLive(second))
+        self.assertTrue(self._isLive(renewed))
+
+    def test_expired_sessions_make_room(self):
+        first, _ = self._createSession('/home/node1')
+        self._createSession('/home/node2')
+        first.expiry = 0
+        self.assertIsNotNone(self._createSession('/home/node3'))
+
+if __name__ == '__main__':
+    unittest.main()
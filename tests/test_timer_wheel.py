@@ -0,0 +1,80 @@
+# -*- Mode:python; c-file-style:"gnu"; indent-tabs-mode:nil -*- */
+#
+# Copyright (C) 2016 Regents of the University of California.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+# A copy of the GNU General Public License is in the file COPYING.
+
+import unittest
+
+from timer_wheel import TimerWheel
+
+class TestTimerWheel(unittest.TestCase):
+    def _expiryTicks(self, wheel, maxTicks):
+        """
+        :return: key -> the tick on which it expired
+        """
+        expiries = {}
+        for tick in range(1, maxTicks + 1):
+            for key in wheel.tick():
+                expiries[key] = tick
+        return expiries
+
+    def test_expires_after_delay(self):
+        wheel = TimerWheel(tickDuration=1.0, wheelSize=8)
+        wheel.schedule('a', 3)
+        wheel.schedule('b', 0.2)
+        self.assertEqual(len(wheel), 2)
+        self.assertEqual(self._expiryTicks(wheel, 10), {'a': 3, 'b': 1})
+        self.assertEqual(len(wheel), 0)
+
+    def test_delay_rounded_up_to_ticks(self):
+        wheel = TimerWheel(tickDuration=0.5, wheelSize=8)
+        wheel.schedule('a', 1.2)
+        self.assertEqual(self._expiryTicks(wheel, 8), {'a': 3})
+
+    def test_wrap_around(self):
+        wheelSize = 4
+        wheel = TimerWheel(tickDuration=1.0, wheelSize=wheelSize)
+        for delay in (wheelSize - 1, wheelSize, wheelSize + 1, 2*wheelSize,
+                3*wheelSize + 2):
+            wheel.schedule(delay, delay)
+        expiries = self._expiryTicks(wheel, 20)
+        self.assertEqual(expiries, dict((delay, delay) for delay in expiries))
+        self.assertEqual(len(expiries), 5)
+
+    def test_wrap_around_after_turning(self):
+        wheel = TimerWheel(tickDuration=1.0, wheelSize=4)
+        for i in range(6):
+            wheel.tick()
+        wheel.schedule('a', 5)
+        self.assertEqual(self._expiryTicks(wheel, 10), {'a': 5})
+
+    def test_reschedule_pushes_back(self):
+        wheel = TimerWheel(tickDuration=1.0, wheelSize=8)
+        wheel.schedule('a', 2)
+        wheel.tick()
+        wheel.schedule('a', 2)
+        self.assertEqual(self._expiryTicks(wheel, 10), {'a': 2})
+
+    def test_cancel(self):
+        wheel = TimerWheel(tickDuration=1.0, wheelSize=8)
+        wheel.schedule('a', 2)
+        wheel.cancel('a')
+        wheel.cancel('missing')
+        self.assertNotIn('a', wheel)
+        self.assertEqual(self._expiryTicks(wheel, 10), {})
+
+if __name__ == '__main__':
+    unittest.main()
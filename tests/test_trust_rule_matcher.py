@@ -0,0 +1,176 @@
+# -*- Mode:python; c-file-style:"gnu"; indent-tabs-mode:nil -*- */
+#
+# Copyright (C) 2016 Regents of the University of California.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+# A copy of the GNU General Public License is in the file COPYING.
+
+import itertools
+import unittest
+
+from pyndn import Name
+from pyndn.security.policy import ConfigPolicyManager
+from pyndn.util.regex.ndn_regex_top_matcher import NdnRegexTopMatcher
+
+from security.trust_rule_matcher import (TrustRuleMatcher, translateNdnRegex,
+        encodeNameForRegex)
+
+# every name of up to 3 components from these, and some longer ones
+_COMPONENTS = ['home', 'KEY', 'ksk-1', 'ID-CERT', 'MULTICAST', 'x']
+_LONG_NAMES = ['/home/x/KEY/ksk-1/ID-CERT', '/home/x/KEY/ksk-1/ID-CERT/%FD01',
+        '/home/KEY/x/KEY/ksk-1/ID-CERT', '/home/x/MULTICAST/x/home',
+        '/x/home/x/home/x', '/home/x/x/KEY']
+
+def _allNames():
+    for length in range(4):
+        for components in itertools.product(_COMPONENTS, repeat=length):
+            yield Name('/' + '/'.join(components))
+    for uri in _LONG_NAMES:
+        yield Name(uri)
+
+class TestTranslateNdnRegex(unittest.TestCase):
+    def _assertSameMatches(self, pattern):
+        translated = translateNdnRegex(pattern)
+        self.assertIsNotNone(translated, pattern)
+        matcher = NdnRegexTopMatcher(pattern)
+        for name in _allNames():
+            expected = matcher.match(name)
+            actual = translated.match(encodeNameForRegex(name)) is not None
+            self.assertEqual(actual, expected,
+                    '{} on {}'.format(pattern, name.toUri()))
+
+    def test_any_components(self):
+        self._assertSameMatches('<>*')
+        self._assertSameMatches('^<home><>*$')
+        self._assertSameMatches('^<><>?$')
+
+    def test_component_sets(self):
+        self._assertSameMatches('^[^<KEY>]*<KEY><>*<ID-CERT>')
+        self._assertSameMatches('^[^<MULTICAST>]*<MULTICAST><>*')
+        self._assertSameMatches('[^<KEY>]+<KEY><>*<ID-CERT>')
+        self._assertSameMatches('^[<home><x>]+$')
+        self._assertSameMatches('^[^<home><x>]<>$')
+
+    def test_unanchored(self):
+        self._assertSameMatches('<KEY>')
+        self._assertSameMatches('<ksk><ID-CERT>')
+
+    def test_component_text_matches_substrings(self):
+        # as in NdnRegexComponentMatcher, <ksk> matches inside ksk-1
+        self.assertIsNotNone(translateNdnRegex('^<ksk>$').match(
+                encodeNameForRegex(Name('/ksk-1'))))
+
+    def test_untranslatable(self):
+        for pattern in ('^(<a><b>)$', '<a>{2}', '^<a.*>$', '<a>|<b>', '[<a>'):
+            self.assertIsNone(translateNdnRegex(pattern), pattern)
+
+class TestTrustRuleMatcher(unittest.TestCase):
+    CONFIG = '''
+validator
+{
+  rule
+  {
+    id "Certs"
+    for "data"
+    filter
+    {
+      type "regex"
+      regex "^[^<KEY>]*<KEY><>*<ID-CERT>"
+    }
+  }
+  rule
+  {
+    id "home x"
+    for "data"
+    filter
+    {
+      type "name"
+      name "/home/x"
+      relation "is-prefix-of"
+    }
+  }
+  rule
+  {
+    id "home exact"
+    for "data"
+    filter
+    {
+      type "name"
+      name "/home"
+      relation "equal"
+    }
+  }
+  rule
+  {
+    id "home strict"
+    for "data"
+    filter
+    {
+      type "name"
+      name "/home"
+      relation "is-strict-prefix-of"
+    }
+    filter
+    {
+      type "regex"
+      regex "<MULTICAST>"
+    }
+  }
+  rule
+  {
+    id "home interests"
+    for "interest"
+    filter
+    {
+      type "name"
+      name "/home"
+      relation "is-prefix-of"
+    }
+  }
+  rule
+  {
+    id "unfiltered"
+    for "data"
+  }
+}
+'''
+    def setUp(self):
+        self.policyManager = ConfigPolicyManager()
+        self.policyManager.load(self.CONFIG, 'test')
+        self.matcher = TrustRuleMatcher(self.policyManager.config["validator/rule"])
+
+    def _ruleId(self, rule):
+        return None if rule is None else rule["id"][0].getValue()
+
+    def test_same_as_linear_search(self):
+        for name in _allNames():
+            for matchType in ("data", "interest"):
+                expected = ConfigPolicyManager._findMatchingRule(
+                        self.policyManager, name, matchType)
+                actual = self.matcher.findMatchingRule(name, matchType)
+                self.assertEqual(self._ruleId(actual), self._ruleId(expected),
+                        '{} {}'.format(matchType, name.toUri()))
+
+    def test_rule_order(self):
+        # matches both the certificate rule and "home x"; the first wins
+        self.assertEqual(self._ruleId(self.matcher.findMatchingRule(
+                Name('/home/x/KEY/ksk-1/ID-CERT'), "data")), "Certs")
+        self.assertEqual(self._ruleId(self.matcher.findMatchingRule(
+                Name('/home'), "data")), "home exact")
+        self.assertEqual(self._ruleId(self.matcher.findMatchingRule(
+                Name('/other'), "data")), "unfiltered")
+        self.assertIsNone(self.matcher.findMatchingRule(Name('/other'), "interest"))
+
+if __name__ == '__main__':
+    unittest.main()